@@ -11,8 +11,17 @@ app = typer.Typer(suggest_commands=True)
 def models(
     auto_copy: Annotated[bool, typer.Option("--auto-copy/--no-auto-copy")] = True,
     lang: Annotated[
-        str, typer.Option("--lang", "-l", help="Language: zh-TW or en")
-    ] = "zh-TW",
+        str, typer.Option("--lang", "-l", help="Language: zh-TW, en or all")
+    ] = "all",
+    full: Annotated[
+        bool,
+        typer.Option("--full/--first-page", help="Also sync the whole catalogue"),
+    ] = True,
+    page_size: Annotated[int, typer.Option(help="Models per page")] = 100,
+    max_models: Annotated[
+        int, typer.Option(help="Maximum models per language, 0 for no limit")
+    ] = 10000,
+    concurrency: Annotated[int, typer.Option(help="Concurrent page requests")] = 4,
 ):
     """獲取模型列表並保存到本地 JSON 文件"""
     import asyncio
@@ -20,7 +29,16 @@ def models(
     from utils.fish_model import main
 
     logger.info(f"Start fetching models (lang={lang})...")
-    asyncio.run(main(auto_copy, lang=lang))
+    asyncio.run(
+        main(
+            auto_copy,
+            lang=lang,
+            full=full,
+            page_size=page_size,
+            max_models=max_models,
+            concurrency=concurrency,
+        )
+    )
     logger.info("Finished fetching models.")
 
 
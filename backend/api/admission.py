@@ -0,0 +1,214 @@
+import asyncio
+import math
+import time
+from collections import deque
+from typing import Any, Awaitable
+
+from api import metrics
+from api.cache import LRUCache
+from fastapi import HTTPException
+from settings import (
+    ADMISSION_BURST,
+    ADMISSION_MAX_ACTIVE,
+    ADMISSION_MAX_CLIENTS,
+    ADMISSION_MAX_QUEUE,
+    ADMISSION_QUEUE_TIMEOUT,
+    ADMISSION_RATE,
+    WORKERS,
+)
+from utils.log import logger
+
+# 統計等待時間百分位數時保留的最近樣本數
+WAIT_SAMPLES = 200
+
+
+class TokenBucket:
+    """每秒補充 rate 個權杖、最多累積 burst 個的權杖桶"""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def take(self, count: int = 1) -> float:
+        """
+        取用 count 個權杖，成功回傳 0，否則回傳需等待的秒數
+        count 超過 burst 時只要桶滿即可取用，不足的部分記為欠額，之後的請求要等補回
+        """
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        need = min(count, self.burst)
+        if self.tokens >= need:
+            self.tokens -= count
+            return 0.0
+        return (need - self.tokens) / self.rate
+
+
+class AdmissionController:
+    """
+    /tier 的准入控制：寧可讓已接受的請求都快速完成，也不要讓所有請求一起變慢
+    - 每個用戶端一個權杖桶，超過速率回傳 429
+    - 全域同時進行的案例數上限，超過時在有上限的佇列中依序等待；
+      佇列已滿或等待逾時回傳 503
+    - 兩者都附上 Retry-After
+    一個名額從案例建立起，持有到其 LLM、TTS 與存檔工作全部結束
+    """
+
+    def __init__(
+        self,
+        rate: float,
+        burst: int,
+        max_active: int,
+        max_queue: int,
+        queue_timeout: float,
+        max_clients: int,
+    ):
+        self.max_active = max_active
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.rate = rate
+        self.burst = burst
+        # 閒置 burst / rate 秒後權杖桶必定已滿，與不存在相同，可以直接淘汰
+        self.buckets: LRUCache[TokenBucket] = LRUCache(
+            max_clients, burst / rate if rate > 0 else 0
+        )
+        self.active = 0
+        self.waiters: deque[asyncio.Future[None]] = deque()
+        self.waits: deque[float] = deque(maxlen=WAIT_SAMPLES)
+        # 名額持有時間的指數移動平均，用於估計 Retry-After
+        self.typical_hold = 30.0
+        self.counts = {
+            "admitted": 0,
+            "rate_limited": 0,
+            "queue_full": 0,
+            "queue_timeout": 0,
+        }
+
+    def check_rate(self, client: str, cost: int = 1):
+        """cost 為這個請求會建立的案例數，批次請求每個項目一個權杖"""
+        if self.rate <= 0:
+            return
+        bucket = self.buckets.get(client)
+        if bucket is None:
+            bucket = TokenBucket(self.rate, self.burst)
+        retry_after = bucket.take(cost)
+        # 有欠額的權杖桶要多等欠額補回的時間才算已滿，延後淘汰
+        debt = max(-bucket.tokens, 0.0) / self.rate
+        self.buckets.put(client, bucket, time.time() + debt)
+        if retry_after:
+            self.counts["rate_limited"] += 1
+            metrics.admission_rejected.labels("rate_limited").inc()
+            raise HTTPException(
+                status_code=429,
+                detail="Too many requests",
+                headers={"Retry-After": str(math.ceil(retry_after))},
+            )
+
+    def _overloaded(self, reason: str) -> HTTPException:
+        self.counts[reason] += 1
+        metrics.admission_rejected.labels(reason).inc()
+        # 排在前面的請求大約需要 (佇列長度 / 名額數 + 1) 個平均持有時間
+        estimate = self.typical_hold * (len(self.waiters) / self.max_active + 1)
+        logger.warning(
+            f"Admission rejected ({reason}): active {self.active}, queued {len(self.waiters)}"
+        )
+        return HTTPException(
+            status_code=503,
+            detail="Server is busy, please retry later",
+            headers={"Retry-After": str(max(math.ceil(estimate), 1))},
+        )
+
+    async def acquire(self):
+        """取得一個名額，必要時排隊等待；呼叫者之後必須以 hold 或 release 歸還"""
+        if self.max_active <= 0:
+            return
+        start = time.monotonic()
+        if self.active < self.max_active and not self.waiters:
+            self.active += 1
+        else:
+            if len(self.waiters) >= self.max_queue:
+                raise self._overloaded("queue_full")
+            waiter = asyncio.get_running_loop().create_future()
+            self.waiters.append(waiter)
+            try:
+                await asyncio.wait_for(asyncio.shield(waiter), self.queue_timeout)
+            except (TimeoutError, asyncio.CancelledError) as e:
+                if waiter.done() and not waiter.cancelled():
+                    # 名額已轉交給此請求，但請求已放棄，轉給下一位
+                    self.release()
+                else:
+                    waiter.cancel()
+                    self.waiters.remove(waiter)
+                if isinstance(e, asyncio.CancelledError):
+                    raise
+                raise self._overloaded("queue_timeout") from None
+        waited = time.monotonic() - start
+        self.waits.append(waited)
+        metrics.admission_wait_seconds.observe(waited)
+        self.counts["admitted"] += 1
+
+    def release(self):
+        if self.max_active <= 0:
+            return
+        # 名額直接轉交給佇列中最早的請求，active 不變
+        while self.waiters:
+            waiter = self.waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.active -= 1
+
+    def hold(self, work: Awaitable[Any]):
+        """名額持有到 work 結束（不論成功、失敗或取消）"""
+        start = time.monotonic()
+
+        def done(_: Any):
+            self.typical_hold = 0.9 * self.typical_hold + 0.1 * (
+                time.monotonic() - start
+            )
+            self.release()
+
+        asyncio.ensure_future(work).add_done_callback(done)
+
+    def stats(self) -> dict[str, Any]:
+        waits = sorted(self.waits)
+
+        def percentile(q: float) -> float:
+            if not waits:
+                return 0.0
+            return round(waits[min(int(q * len(waits)), len(waits) - 1)], 3)
+
+        return {
+            "active": self.active,
+            "max_active": self.max_active,
+            "queued": len(self.waiters),
+            "max_queue": self.max_queue,
+            "wait_p50": percentile(0.5),
+            "wait_p95": percentile(0.95),
+            "typical_hold": round(self.typical_hold, 1),
+            **self.counts,
+        }
+
+
+def per_worker(limit: int, workers: int = WORKERS) -> int:
+    """
+    把整個服務的上限平分給各 worker（無條件進位，0 仍代表不限制）
+    名額只在程序內計算，不經 case backend 協調：各 worker 的負載由 uvicorn 分配，
+    平分後的總和與設定值至多差 workers - 1
+    """
+    return -(-limit // max(workers, 1)) if limit > 0 else limit
+
+
+admission = AdmissionController(
+    ADMISSION_RATE,
+    ADMISSION_BURST,
+    per_worker(ADMISSION_MAX_ACTIVE),
+    per_worker(ADMISSION_MAX_QUEUE),
+    ADMISSION_QUEUE_TIMEOUT,
+    ADMISSION_MAX_CLIENTS,
+)
+metrics.admission_slots.set_function(
+    lambda: {("active",): admission.active, ("queued",): len(admission.waiters)}
+)
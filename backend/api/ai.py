@@ -1,13 +1,32 @@
-import re
+import asyncio
+import time
+from collections import deque
 from typing import Any, AsyncGenerator, Optional
 
+from api import metrics
 from dotenv import load_dotenv
 from openai import AsyncOpenAI
 from pydantic import BaseModel
-from settings import AI_API_KEY, LLMs_list, LLMs_to_api
+from settings import (
+    AI_API_KEY,
+    LLM_BREAKER_COOLDOWN,
+    LLM_BREAKER_ERROR_RATE,
+    LLM_BREAKER_MIN_CALLS,
+    LLM_BREAKER_SLOW_TTFT,
+    LLM_BREAKER_WINDOW,
+    LLM_HEDGE,
+    LLM_HEDGE_MAX_DELAY,
+    LLM_HEDGE_MIN_DELAY,
+    LLMs_list,
+    LLMs_to_api,
+)
+from utils.log import logger
 
 load_dotenv()
 
+# 粗估每個 LLM token 對應的字元數
+CHARS_PER_TOKEN = 1.5
+
 
 client = AsyncOpenAI(
     api_key=AI_API_KEY,
@@ -20,21 +39,113 @@ class ChatRespond(BaseModel):
     content: str
 
 
-async def stream_messages(
-    messages: str, model: Optional[str] = None
-) -> AsyncGenerator[str, Any]:
-    if not model:
-        model = LLMs_list[0]
-    if model not in LLMs_list:
-        raise ValueError(f"Model {model} is not supported. Choose from {LLMs_list}")
-    if not messages:
-        raise ValueError("Messages cannot be empty.")
-    if not model:
-        raise ValueError("Model must be specified.")
-    model_api = LLMs_to_api.get(model, model)
+class CircuitBreaker:
+    """
+    單一模型的斷路器，以最近 LLM_BREAKER_WINDOW 次呼叫的結果與首字延遲判斷健康狀態
+    - closed：正常使用
+    - open：錯誤率或 p95 首字延遲過高，LLM_BREAKER_COOLDOWN 秒內不使用
+    - half_open：冷卻結束，只放行一個試探請求，成功則恢復，失敗則再次斷開
+    """
+
+    def __init__(self, model: str):
+        self.model = model
+        self.ttfts: deque[float] = deque(maxlen=LLM_BREAKER_WINDOW)
+        self.failures: deque[bool] = deque(maxlen=LLM_BREAKER_WINDOW)
+        self.open_until = 0.0
+        self.probing = False
+
+    @property
+    def state(self) -> str:
+        if not self.open_until:
+            return "closed"
+        if time.monotonic() < self.open_until:
+            return "open"
+        return "half_open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half_open" and not self.probing:
+            self.probing = True
+            return True
+        return False
+
+    def p95_ttft(self) -> Optional[float]:
+        if len(self.ttfts) < LLM_BREAKER_MIN_CALLS:
+            return None
+        ordered = sorted(self.ttfts)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+
+    def hedge_delay(self) -> float:
+        """首字超過此秒數仍未到達時發出對沖請求；資料不足時保守使用上限"""
+        p95 = self.p95_ttft()
+        if p95 is None:
+            return LLM_HEDGE_MAX_DELAY
+        return min(max(p95, LLM_HEDGE_MIN_DELAY), LLM_HEDGE_MAX_DELAY)
+
+    def record_ttft(self, seconds: float):
+        self.ttfts.append(seconds)
+
+    def record_result(self, failed: bool):
+        self.failures.append(failed)
+        if self.open_until:
+            # 試探請求的結果決定恢復或再次斷開
+            if failed:
+                self._trip()
+            else:
+                logger.info(f"LLM circuit for {self.model} closed")
+                self.open_until = 0.0
+                self.probing = False
+                self.ttfts.clear()
+                self.failures.clear()
+            return
+        self._check()
+
+    def abandon(self, waited: Optional[float] = None):
+        """
+        請求在有結果前被取消，讓出試探名額；
+        對沖輸掉的請求把已等待的時間當作首字延遲的下限，持續卡住的模型也會斷開
+        """
+        self.probing = False
+        if waited is not None:
+            self.ttfts.append(waited)
+            if not self.open_until:
+                self._check()
+
+    def _check(self):
+        p95 = self.p95_ttft()
+        slow = p95 is not None and p95 >= LLM_BREAKER_SLOW_TTFT
+        errors = (
+            len(self.failures) >= LLM_BREAKER_MIN_CALLS
+            and sum(self.failures) / len(self.failures) >= LLM_BREAKER_ERROR_RATE
+        )
+        if slow or errors:
+            self._trip()
+
+    def _trip(self):
+        self.open_until = time.monotonic() + LLM_BREAKER_COOLDOWN
+        self.probing = False
+        logger.warning(
+            f"LLM circuit for {self.model} opened for {LLM_BREAKER_COOLDOWN:.0f}s "
+            f"(p95 TTFT {self.p95_ttft()}, recent failures {sum(self.failures)}/{len(self.failures)})"
+        )
 
+
+breakers = {model: CircuitBreaker(model) for model in LLMs_list}
+
+
+def _pick_backup(exclude: str) -> Optional[str]:
+    """依 LLMs_list 的順序選出第一個斷路器允許的備援模型"""
+    for model in LLMs_list:
+        if model != exclude and breakers[model].allow():
+            return model
+    return None
+
+
+async def _stream_model(messages: str, model: str) -> AsyncGenerator[str, Any]:
     response = await client.chat.completions.create(
-        model=model_api,
+        model=LLMs_to_api.get(model, model),
         messages=[
             {
                 "role": "user",
@@ -44,29 +155,141 @@ async def stream_messages(
         stream=True,
     )
 
-    full_content = ""
-    temp = ""
-    async for chunk in response:
-        if chunk.choices:
-            delta = chunk.choices[0].delta
-            text = delta.content or ""
-            full_content += text
-            if text:
-                if ("[" in text and "]" not in text) or (temp and "]" not in text):
-                    temp += text
-                    continue
-                elif "]" in text and "[" not in text:
-                    text = temp + text
-                    temp = ""
-
-                match_ = re.search(r"\[(.*?)\]", text)
-                if match_:
-                    rank_content = match_.group(1)
-                    if full_content.count(rank_content) == 1:
-                        text = text.replace(
-                            match_.group(0), f"{rank_content}{match_.group(0)}"
-                        )
+    # 被取消時一併關閉上游連線；評級標籤由 api.tier_parser 在下游解析
+    try:
+        async for chunk in response:
+            if chunk.choices:
+                text = chunk.choices[0].delta.content
+                if text:
+                    yield text
+                if chunk.choices[0].finish_reason:
+                    return
+    finally:
+        await response.close()
+
+
+async def stream_messages(
+    messages: str, model: Optional[str] = None
+) -> AsyncGenerator[str, Any]:
+    """
+    串流 LLM 回應。主要模型在 hedge_delay 秒內沒有產生首字時，
+    向備援模型發出第二個請求，採用先產生文字的一方並取消另一方
+    """
+    if not model:
+        model = LLMs_list[0]
+    if model not in LLMs_list:
+        raise ValueError(f"Model {model} is not supported. Choose from {LLMs_list}")
+    if not messages:
+        raise ValueError("Messages cannot be empty.")
+
+    primary = model
+    if not breakers[primary].allow():
+        backup = _pick_backup(primary)
+        if backup:
+            logger.warning(f"LLM circuit for {primary} is open, using {backup}")
+            primary = backup
+
+    # 每個嘗試：等待首字的 task -> (模型, 生成器, 開始時間)
+    attempts: dict[
+        asyncio.Future[str], tuple[str, AsyncGenerator[str, Any], float]
+    ] = {}
+
+    def launch(name: str):
+        gen = _stream_model(messages, name)
+        attempts[asyncio.ensure_future(anext(gen))] = (name, gen, time.monotonic())
+
+    winner: Optional[tuple[str, AsyncGenerator[str, Any]]] = None
+    failed = False
+    cancelled = False
+    try:
+        launch(primary)
+        started = time.monotonic()
+        hedged = not LLM_HEDGE
+        last_error: Optional[BaseException] = None
+        first = ""
+        while winner is None:
+            timeout = None
+            if not hedged:
+                timeout = max(
+                    breakers[primary].hedge_delay() - (time.monotonic() - started), 0
+                )
+            done, _ = await asyncio.wait(
+                attempts, timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+            )
+            for task in done:
+                name, gen, task_started = attempts.pop(task)
+                try:
+                    first = task.result()
+                except StopAsyncIteration:
+                    last_error = ValueError(f"Empty response from {name}")
+                except Exception as e:
+                    last_error = e
+                else:
+                    breakers[name].record_ttft(time.monotonic() - task_started)
+                    winner = (name, gen)
+                    break
+                logger.warning(f"LLM request to {name} failed: {last_error!r}")
+                breakers[name].record_result(failed=True)
+
+            # 首字逾時或主要模型失敗時，發出對沖請求
+            if winner is None and not hedged and (not done or not attempts):
+                hedged = True
+                backup = _pick_backup(primary)
+                if backup:
+                    logger.info(
+                        f"Hedging LLM request: {primary} -> {backup} "
+                        f"after {time.monotonic() - started:.2f}s"
+                    )
+                    launch(backup)
+            if winner is None and not attempts:
+                assert last_error is not None
+                raise last_error
+
+        # 取消落後的請求
+        for task in attempts:
+            task.cancel()
+        await asyncio.gather(*attempts, return_exceptions=True)
+        for task, (name, gen, task_started) in attempts.items():
+            breakers[name].abandon(time.monotonic() - task_started)
+            await gen.aclose()
+        attempts.clear()
 
+        name, gen = winner
+        if name != model:
+            logger.info(f"LLM response served by {name} instead of {model}")
+        first_at = time.monotonic()
+        metrics.llm_ttft_seconds.labels(name).observe(first_at - started)
+        chars = len(first)
+        try:
+            yield first
+            async for text in gen:
+                chars += len(text)
                 yield text
-            if chunk.choices[0].finish_reason:
-                return
+        except (asyncio.CancelledError, GeneratorExit):
+            # 無人收聽而取消，模型沒有成功也沒有失敗
+            cancelled = True
+            raise
+        except Exception:
+            failed = True
+            raise
+        finally:
+            await gen.aclose()
+        if (elapsed := time.monotonic() - first_at) > 0:
+            metrics.llm_tokens_per_second.labels(name).observe(
+                chars / CHARS_PER_TOKEN / elapsed
+            )
+    finally:
+        for task in attempts:
+            task.cancel()
+        if attempts:
+            await asyncio.gather(*attempts, return_exceptions=True)
+        for task, (name, gen, _) in attempts.items():
+            breakers[name].abandon()
+            await gen.aclose()
+        if winner is not None and cancelled:
+            # 與落後的對沖請求相同：讓出試探名額，不計入錯誤率
+            breakers[winner[0]].abandon()
+            metrics.llm_requests.labels(winner[0], "cancelled").inc()
+        elif winner is not None:
+            breakers[winner[0]].record_result(failed)
+            metrics.llm_requests.labels(winner[0], "error" if failed else "ok").inc()
@@ -0,0 +1,129 @@
+import json
+import uuid
+from pathlib import Path
+from typing import Any, Optional
+
+from api.chunker import create_chunker
+from settings import AUDIO_DIR
+
+# 往後搜尋 MP3 frame 起點的最大距離（128 kbps 的一個 frame 約 418 位元組）
+FRAME_SEARCH_BYTES = 4096
+
+
+def alignment_path(case_id: str) -> Path:
+    """對齊索引與音訊放在一起：{AUDIO_DIR}/{case_id}.align.json"""
+    return Path(f"{AUDIO_DIR}/{case_id}.align.json")
+
+
+def _is_frame_header(audio: bytes, offset: int) -> bool:
+    if offset + 4 > len(audio):
+        return False
+    b1, b2 = audio[offset + 1], audio[offset + 2]
+    return (
+        audio[offset] == 0xFF
+        and b1 & 0xE0 == 0xE0
+        and (b1 >> 1) & 0x03 != 0  # layer
+        and (b2 >> 4) not in (0x0, 0xF)  # bitrate index
+        and (b2 >> 2) & 0x03 != 0x03  # sample rate index
+    )
+
+
+def snap_to_frame(audio: bytes, offset: int) -> int:
+    """把位元組偏移移到其後第一個 MP3 frame 起點，讓 Range 請求取得的片段可直接解碼"""
+    for position in range(offset, min(offset + FRAME_SEARCH_BYTES, len(audio))):
+        if _is_frame_header(audio, position):
+            return position
+    return offset
+
+
+def split_text(text: str, strategy: str, lang: str) -> list[str]:
+    """音訊快取命中時沒有實際送出的片段，以相同的 chunker 重新切分完整文字"""
+    chunker = create_chunker(strategy, lang)
+    chunks = chunker.feed(text)
+    if rest := chunker.flush():
+        chunks.append(rest)
+    return chunks
+
+
+def tier_char(record: dict[str, Any]) -> Optional[int]:
+    """評級出現在朗讀文字中的字元位置，record 為 encode_timeline 的結果"""
+    if record["tier"] is None:
+        return None
+    if not record["tier_index"]:
+        return 0
+    return record["timing"][record["tier_index"] - 1][1]
+
+
+def build_alignment(
+    chunks: list[tuple[str, int]],
+    audio: bytes,
+    bitrate: int,
+    tier: Optional[str] = None,
+    tier_at: Optional[int] = None,
+) -> dict[str, Any]:
+    """
+    建立文字與音訊的對齊索引
+    chunks 為依序送給 TTS 的 (片段文字, 送出當下已收到的音訊位元組數)。
+    Fish Audio 依序合成但不標示音訊屬於哪個片段，因此每段的起點以字數比例估計，
+    並不早於該片段送出時已收到的位元組數（那些音訊一定屬於先前的片段），
+    最後對齊到 MP3 frame 起點；秒數以固定位元率換算
+    """
+    total_chars = sum(len(text) for text, _ in chunks)
+    total_bytes = len(audio)
+
+    def seconds(offset: int) -> float:
+        return round(offset * 8 / bitrate, 3)
+
+    starts, chars, previous = [], 0, 0
+    for text, received in chunks:
+        estimate = chars * total_bytes // total_chars if total_chars else 0
+        start = min(max(estimate, received, previous), total_bytes)
+        start = snap_to_frame(audio, start) if start else 0
+        starts.append(start)
+        chars += len(text)
+        previous = start
+
+    entries, chars = [], 0
+    for index, (text, _) in enumerate(chunks):
+        start = starts[index]
+        end = starts[index + 1] if index + 1 < len(starts) else total_bytes
+        entries.append(
+            {
+                "text": text,
+                "chars": [chars, chars + len(text)],
+                "bytes": [start, end],
+                "time": [seconds(start), seconds(end)],
+            }
+        )
+        chars += len(text)
+
+    reveal = None
+    if tier is not None and tier_at is not None:
+        # 評級所在片段內再依字數比例內插
+        byte = total_bytes
+        for entry in entries:
+            (c0, c1), (b0, b1) = entry["chars"], entry["bytes"]
+            if c0 <= tier_at < c1 or (c0 == tier_at == c1):
+                byte = snap_to_frame(
+                    audio, b0 + (tier_at - c0) * (b1 - b0) // (c1 - c0 or 1)
+                )
+                break
+        reveal = {"tier": tier, "char": tier_at, "byte": byte, "time": seconds(byte)}
+
+    return {
+        "bitrate": bitrate,
+        "bytes": total_bytes,
+        "duration": seconds(total_bytes),
+        "chunks": entries,
+        "tier": reveal,
+    }
+
+
+def write_alignment(case_id: str, index: dict[str, Any]):
+    """同步寫入（於執行緒中呼叫），先寫暫存檔再 rename"""
+    path = alignment_path(case_id)
+    tmp = path.with_name(f".{path.name}.{uuid.uuid4().hex}.tmp")
+    tmp.write_text(
+        json.dumps(index, ensure_ascii=False, separators=(",", ":")), encoding="utf-8"
+    )
+    tmp.replace(path)
@@ -0,0 +1,133 @@
+import asyncio
+import json
+import re
+import uuid
+from pathlib import Path
+from typing import Any, AsyncGenerator, Optional
+
+import aiofiles
+import aiofiles.os
+from api.cache import AudioCache, DiskTier
+from api.tier_parser import StreamEvent
+from fastapi import HTTPException
+from settings import CASE_ARCHIVE_DIR, CASE_ARCHIVE_MAX_BYTES
+
+CASE_ID_PATTERN = re.compile(r"[0-9a-f]{32}")
+
+
+def encode_timeline(timeline: list[tuple[float, StreamEvent]]) -> dict[str, Any]:
+    """
+    將事件序列壓縮為封存格式
+    - text：完整文字（不含評級標籤）
+    - timing：每個 text_delta 的 [距案例開始的秒數, 累計字數]
+    - tier / tier_index：評級與其前面有幾個 text_delta
+    """
+    parts: list[str] = []
+    timing: list[list[float]] = []
+    tier, tier_index, length = None, None, 0
+    for elapsed, event in timeline:
+        if event.type == "text_delta":
+            parts.append(event.data)
+            length += len(event.data)
+            timing.append([round(elapsed, 3), length])
+        elif event.type == "tier_decision":
+            tier, tier_index = event.data, len(timing)
+    return {
+        "text": "".join(parts),
+        "tier": tier,
+        "tier_index": tier_index,
+        "timing": timing,
+    }
+
+
+def decode_events(record: dict[str, Any]) -> list[StreamEvent]:
+    text, events, start = record["text"], [], 0
+    for index, (_, end) in enumerate(record["timing"]):
+        if index == record["tier_index"]:
+            events.append(StreamEvent("tier_decision", record["tier"]))
+        events.append(StreamEvent("text_delta", text[start:end]))
+        start = end
+    if record["tier_index"] == len(record["timing"]):
+        events.append(StreamEvent("tier_decision", record["tier"]))
+    events.append(StreamEvent("done"))
+    return events
+
+
+class ArchivedCase:
+    """已完成並從記憶體移除的案例，由磁碟上的封存檔提供文字、事件、音訊與圖片"""
+
+    def __init__(self, case_id: str, record: dict[str, Any]):
+        self.case_id = case_id
+        self.record = record
+        self.tts = record["tts"]
+
+    async def llm_gen(self) -> AsyncGenerator[str, None]:
+        for event in decode_events(self.record):
+            if text := event.to_text():
+                yield text
+
+    async def event_gen(self) -> AsyncGenerator[str, None]:
+        for event in decode_events(self.record):
+            yield event.to_sse()
+
+    def audio_file(self) -> Optional[Path]:
+        """封存時已寫入的音訊檔；未啟用 TTS 或已被淘汰時為 None"""
+        audio_path = self.record["audio_path"]
+        if not self.tts or not audio_path or not Path(audio_path).exists():
+            return None
+        return Path(audio_path)
+
+    def tts_gen(self) -> AsyncGenerator[bytes, None]:
+        if not self.tts:
+            raise HTTPException(status_code=400, detail="TTS is disabled for this case")
+        path = self.audio_file()
+        if path is None:
+            raise HTTPException(status_code=404, detail="Audio not found")
+        return AudioCache.read(path)
+
+    async def image_url(self) -> str:
+        return self.record["image_url"]
+
+
+class CaseArchive:
+    """
+    已完成案例的封存：{directory}/{case_id[:2]}/{case_id}.json
+    記憶體中的 ApiService 過期後，/text、/tts、/image 改由封存檔提供
+    總大小超過 max_bytes 時依最後讀寫時間淘汰最舊的封存，被淘汰的案例回應 404
+    """
+
+    def __init__(self, directory: str, max_bytes: Optional[int] = None):
+        self.disk = DiskTier(directory, ".json", max_bytes=max_bytes, shard=2)
+
+    def path(self, case_id: str) -> Path:
+        return self.disk.path(case_id)
+
+    async def save(self, case_id: str, record: dict[str, Any]):
+        path = self.path(case_id)
+        content = json.dumps(record, ensure_ascii=False, separators=(",", ":"))
+        await aiofiles.os.makedirs(path.parent, exist_ok=True)
+        tmp = path.with_name(f".{path.name}.{uuid.uuid4().hex}.tmp")
+        async with aiofiles.open(tmp, "w", encoding="utf-8") as f:
+            await f.write(content)
+        await aiofiles.os.replace(tmp, path)
+        await self.disk.added(len(content.encode("utf-8")))
+
+    def _read(self, case_id: str) -> str:
+        content = self.path(case_id).read_text(encoding="utf-8")
+        self.disk.touch(case_id)
+        return content
+
+    async def lookup(self, case_id: str) -> Optional[ArchivedCase]:
+        # case_id 來自 URL，避免路徑穿越
+        if not CASE_ID_PATTERN.fullmatch(case_id):
+            return None
+        try:
+            # 封存檔可能不在頁面快取中，讀取放到執行緒，不阻塞事件迴圈
+            content = await asyncio.to_thread(self._read, case_id)
+            record = json.loads(content)
+        except (FileNotFoundError, ValueError):
+            return None
+        return ArchivedCase(case_id, record)
+
+
+case_archive = CaseArchive(CASE_ARCHIVE_DIR, CASE_ARCHIVE_MAX_BYTES)
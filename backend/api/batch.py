@@ -0,0 +1,172 @@
+import asyncio
+from typing import Any, AsyncGenerator, Awaitable, Callable, Optional
+from uuid import uuid4
+
+from api import metrics
+from api.admission import admission
+from api.degrade import Decision
+from api.services import ApiService
+from api.tier_parser import format_sse
+from api.tracing import tracer
+from fastapi import HTTPException
+from starlette.responses import StreamingResponse
+from starlette.types import Receive, Scope, Send
+from utils.log import logger
+
+# 依 (項目序號, case_id) 建立並啟動案例，呼叫前已取得准入名額
+CaseFactory = Callable[[int, str], Awaitable[tuple[ApiService, Decision]]]
+
+
+class Batch:
+    """
+    一次請求銳評多個項目：以有上限的並行數依序啟動各項目的 ApiService，
+    並把各項目的文字、評級與圖片事件合併成一條以 item 標記的 SSE 串流
+    - 項目的名額持有到其 LLM、TTS、存檔與圖片搜尋全部結束，之後才啟動下一個項目
+    - 每個項目另外取得一個全域准入名額，被拒絕時只有該項目以 item_error 結束
+    - 串流開著時批次算作各項目的收聽者，語音在前端取用前不會因寬限期被取消；
+      用戶端離開時不再啟動新項目，已啟動的項目依一般的寬限期處理
+    """
+
+    def __init__(
+        self,
+        subjects: list[str],
+        create_case: CaseFactory,
+        concurrency: int,
+        admitted: bool = False,
+    ):
+        self.subjects = subjects
+        self.create_case = create_case
+        self.slots = asyncio.Semaphore(max(concurrency, 1))
+        # 呼叫端已先為第一個項目取得准入名額，讓整體過載能在串流開始前以 503 回應
+        self.admitted = admitted
+        self.queue: asyncio.Queue[Optional[str]] = asyncio.Queue()
+        self.items: list[asyncio.Task[bool]] = []
+
+    def _emit(self, event: str, index: int, payload: dict[str, Any]):
+        self.queue.put_nowait(format_sse(event, {"item": index, **payload}))
+
+    async def _launch(self, index: int) -> Optional[ApiService]:
+        case_id = uuid4().hex
+        if self.admitted:
+            self.admitted = False
+        else:
+            try:
+                with tracer.trace(case_id).span("admission"):
+                    await admission.acquire()
+            except HTTPException as e:
+                tracer.discard(case_id)
+                metrics.batch_items.labels("rejected").inc()
+                self._emit(
+                    "item_error", index, {"status": e.status_code, "detail": e.detail}
+                )
+                return None
+
+        try:
+            service, decision = await self.create_case(index, case_id)
+        except asyncio.CancelledError:
+            # 用戶端在項目啟動途中離開
+            admission.release()
+            raise
+        except Exception as e:
+            admission.release()
+            logger.error(f"Failed to start batch item {index}: {e}")
+            metrics.batch_items.labels("failed").inc()
+            self._emit("item_error", index, {"status": 500, "detail": str(e)})
+            return None
+        admission.hold(service.finished())
+
+        self._emit(
+            "item_start",
+            index,
+            {
+                "case_id": case_id,
+                "subject": self.subjects[index],
+                "mode": decision.mode,
+                "tts": decision.tts,
+                "llm_model": decision.llm_model,
+            },
+        )
+        return service
+
+    async def _image(self, index: int, service: ApiService):
+        self._emit("image", index, {"img_url": await service.image_url()})
+
+    async def _item(self, index: int) -> bool:
+        try:
+            service = await self._launch(index)
+            if service is None:
+                return False
+            done = False
+            with service.listening():
+                image = asyncio.create_task(self._image(index, service))
+                try:
+                    async for event in service.events(span="batch_events"):
+                        done = event.type == "done"
+                        self._emit(event.type, index, event.payload())
+                    await image
+                finally:
+                    image.cancel()
+                if not done:
+                    self._emit(
+                        "item_error",
+                        index,
+                        {"status": 502, "detail": "Generation failed"},
+                    )
+                # 語音合成與存檔結束前持續算作收聽者
+                await service.finished()
+            metrics.batch_items.labels("ok" if done else "failed").inc()
+            return done
+        finally:
+            self.slots.release()
+
+    async def _run(self):
+        try:
+            for index in range(len(self.subjects)):
+                await self.slots.acquire()
+                self.items.append(asyncio.create_task(self._item(index)))
+            results = await asyncio.gather(*self.items, return_exceptions=True)
+            ok = sum(result is True for result in results)
+            self.queue.put_nowait(
+                format_sse(
+                    "batch_done",
+                    {"items": len(results), "ok": ok, "failed": len(results) - ok},
+                )
+            )
+        finally:
+            self.release_admitted()
+            self.queue.put_nowait(None)
+
+    def release_admitted(self):
+        """第一個項目啟動前就結束時歸還預先取得的名額，可重複呼叫"""
+        if self.admitted:
+            self.admitted = False
+            admission.release()
+
+    async def stream(self) -> AsyncGenerator[str, None]:
+        """SSE：item_start、image、text_delta、tier_decision、done、item_error，最後為 batch_done"""
+        runner = asyncio.create_task(self._run())
+        try:
+            while (chunk := await self.queue.get()) is not None:
+                yield chunk
+        finally:
+            runner.cancel()
+            for item in self.items:
+                item.cancel()
+
+
+class BatchResponse(StreamingResponse):
+    """
+    批次的 SSE 回應；用戶端在串流開始前就離開時 stream() 不會被執行，
+    因此在回應結束時（包含例外）再歸還一次預先取得的名額
+    """
+
+    def __init__(self, batch: Batch):
+        super().__init__(batch.stream(), media_type="text/event-stream")
+        self.batch = batch
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            await self.body_iterator.aclose()
+            self.batch.release_admitted()
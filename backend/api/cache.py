@@ -0,0 +1,305 @@
+import asyncio
+import hashlib
+import json
+import os
+import shutil
+import time
+import uuid
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, AsyncGenerator, Generic, Optional, TypeVar
+
+import aiofiles
+from api import metrics
+from settings import (
+    AUDIO_DIR,
+    AUDIO_MAX_BYTES,
+    LLM_CACHE_DIR,
+    LLM_CACHE_MAX_DISK_ENTRIES,
+    LLM_CACHE_MAX_ENTRIES,
+    LLM_CACHE_PACE,
+    LLM_CACHE_TTL,
+    TTS_CACHE_DIR,
+    TTS_CACHE_MAX_BYTES,
+)
+from utils.log import logger
+
+T = TypeVar("T")
+
+
+def content_key(*parts: str) -> str:
+    """以內容計算快取鍵"""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class LRUCache(Generic[T]):
+    """有 TTL 的記憶體 LRU 快取"""
+
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries: OrderedDict[str, tuple[float, T]] = OrderedDict()
+
+    def get(self, key: str) -> Optional[T]:
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        created_at, value = entry
+        if time.time() - created_at > self.ttl:
+            del self.entries[key]
+            return None
+        self.entries.move_to_end(key)
+        return value
+
+    def put(self, key: str, value: T, created_at: Optional[float] = None):
+        self.entries[key] = (created_at or time.time(), value)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+
+class DiskTier:
+    """
+    快取的磁碟層：每個鍵一個檔案，以 mtime 作為 LRU 順序，可限制條目數與總大小
+    shard > 0 時檔案放在以鍵的前 shard 個字元命名的子目錄中
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        suffix: str,
+        max_entries: Optional[int] = None,
+        max_bytes: Optional[int] = None,
+        companions: tuple[str, ...] = (),
+        shard: int = 0,
+    ):
+        self.directory = Path(directory)
+        self.suffix = suffix
+        self.shard = shard
+        # 與主檔同名、不同副檔名的附屬檔，淘汰時一併刪除
+        self.companions = companions
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.count: Optional[int] = None
+        self.size: Optional[int] = None
+
+    def path(self, key: str) -> Path:
+        directory = self.directory / key[: self.shard] if self.shard else self.directory
+        return directory / f"{key}{self.suffix}"
+
+    def touch(self, key: str):
+        try:
+            os.utime(self.path(key))
+        except FileNotFoundError:
+            pass
+
+    def _over(self, count: int, size: int, ratio: float = 1.0) -> bool:
+        return (self.max_entries is not None and count > self.max_entries * ratio) or (
+            self.max_bytes is not None and size > self.max_bytes * ratio
+        )
+
+    def _evict(self):
+        """超過上限時刪除最久未使用的檔案，直到降至上限的九成"""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        files = []
+        paths = self.directory.glob("*/*") if self.shard else self.directory.iterdir()
+        for path in paths:
+            if path.name.endswith(self.suffix):
+                stat = path.stat()
+                files.append((stat.st_mtime, stat.st_size, path))
+        files.sort()
+        count, size = len(files), sum(f[1] for f in files)
+        if self._over(count, size):
+            for _, file_size, path in files:
+                if not self._over(count, size, 0.9):
+                    break
+                path.unlink(missing_ok=True)
+                key = path.name.removesuffix(self.suffix)
+                for suffix in self.companions:
+                    path.with_name(f"{key}{suffix}").unlink(missing_ok=True)
+                count -= 1
+                size -= file_size
+        self.count, self.size = count, size
+
+    async def added(self, size: int = 0):
+        """新增一個檔案後呼叫，必要時在背景執行緒中淘汰舊檔"""
+        if self.count is None or self.size is None:
+            await asyncio.to_thread(self._evict)
+            return
+        self.count += 1
+        self.size += size
+        if self._over(self.count, self.size):
+            await asyncio.to_thread(self._evict)
+
+
+class JsonCache(Generic[T]):
+    """
+    記憶體 LRU + 磁碟 JSON 檔的兩層快取，兩層共用同一個 TTL
+    name 為命中率指標的 cache 標籤
+    """
+
+    def __init__(
+        self,
+        name: str,
+        directory: str,
+        max_entries: int,
+        max_disk_entries: int,
+        ttl: float,
+    ):
+        self.name = name
+        self.memory: LRUCache[T] = LRUCache(max_entries, ttl)
+        self.disk = DiskTier(directory, ".json", max_entries=max_disk_entries)
+        self.ttl = ttl
+
+    async def get(self, key: str) -> Optional[T]:
+        value = self.memory.get(key)
+        if value is None:
+            value = await self._load(key)
+        result = "miss" if value is None else "hit"
+        metrics.cache_requests.labels(self.name, result).inc()
+        return value
+
+    async def _load(self, key: str) -> Optional[T]:
+        path = self.disk.path(key)
+        try:
+            async with aiofiles.open(path, "r", encoding="utf-8") as f:
+                data = json.loads(await f.read())
+        except FileNotFoundError:
+            return None
+        except ValueError:
+            logger.error(f"Corrupted cache entry {path}")
+            path.unlink(missing_ok=True)
+            return None
+
+        if time.time() - data["created_at"] > self.ttl:
+            path.unlink(missing_ok=True)
+            return None
+        self.memory.put(key, data["value"], created_at=data["created_at"])
+        self.disk.touch(key)
+        return data["value"]
+
+    async def put(self, key: str, value: T):
+        """寫入快取；磁碟層寫入失敗只記錄錯誤，不影響呼叫者"""
+        created_at = time.time()
+        self.memory.put(key, value, created_at=created_at)
+
+        path = self.disk.path(key)
+        data = {"created_at": created_at, "value": value}
+        content = json.dumps(data, ensure_ascii=False)
+        # 相同的請求可能同時完成，每次寫入使用各自的暫存檔
+        tmp_path = path.with_name(f".{path.name}.{uuid.uuid4().hex}.tmp")
+        try:
+            self.disk.directory.mkdir(parents=True, exist_ok=True)
+            async with aiofiles.open(tmp_path, "w", encoding="utf-8") as f:
+                await f.write(content)
+            os.replace(tmp_path, path)
+            await self.disk.added(len(content))
+        except OSError as e:
+            logger.error(f"Failed to write cache entry {path}: {e}")
+            tmp_path.unlink(missing_ok=True)
+
+
+# (與上一片段的間隔秒數, 文字片段)
+TimedChunks = list[tuple[float, str]]
+
+
+class RoastCache(JsonCache[TimedChunks]):
+    """已完成 LLM 銳評的內容定址快取，鍵為 hash(prompt, llm_model)"""
+
+    def __init__(
+        self,
+        directory: str = LLM_CACHE_DIR,
+        max_entries: int = LLM_CACHE_MAX_ENTRIES,
+        max_disk_entries: int = LLM_CACHE_MAX_DISK_ENTRIES,
+        ttl: float = LLM_CACHE_TTL,
+    ):
+        super().__init__("roast", directory, max_entries, max_disk_entries, ttl)
+
+    @staticmethod
+    def key(prompt: str, llm_model: str) -> str:
+        return content_key(prompt, llm_model)
+
+    @staticmethod
+    async def replay(
+        chunks: TimedChunks, pace: float = LLM_CACHE_PACE
+    ) -> AsyncGenerator[str, Any]:
+        """重播快取的片段；pace 為 0 時立即輸出，1 為原速（第一個片段不等待）"""
+        for index, (delay, text) in enumerate(chunks):
+            if pace and index:
+                await asyncio.sleep(delay * pace)
+            yield text
+
+
+class AudioCache:
+    """
+    TTS 音訊的內容定址快取，鍵為 (正規化文字, 模型, 語速, 格式)
+    快取檔是 storage/audio/{case_id}.mp3 的獨立複本，兩個目錄各自依總大小做 LRU 淘汰，
+    刪除任一邊都會實際釋放空間
+    """
+
+    def __init__(
+        self, directory: str = TTS_CACHE_DIR, max_bytes: int = TTS_CACHE_MAX_BYTES
+    ):
+        self.disk = DiskTier(directory, ".mp3", max_bytes=max_bytes)
+
+    @staticmethod
+    def key(text: str, model: str, speed: float, format: str = "mp3") -> str:
+        normalized = " ".join(text.split())
+        return content_key(normalized, model, f"{speed:g}", format)
+
+    def get(self, key: str) -> Optional[Path]:
+        path = self.disk.path(key)
+        if path.exists():
+            metrics.cache_requests.labels("audio", "hit").inc()
+            self.disk.touch(key)
+            return path
+        metrics.cache_requests.labels("audio", "miss").inc()
+        return None
+
+    @staticmethod
+    def _copy(src: Path, dst: Path) -> int:
+        """複製到暫存檔再取代，讀取者不會看到寫到一半的檔案；回傳位元組數"""
+        dst.parent.mkdir(parents=True, exist_ok=True)
+        tmp = dst.with_name(f".{dst.name}.{uuid.uuid4().hex}.tmp")
+        try:
+            shutil.copyfile(src, tmp)
+            os.replace(tmp, dst)
+        finally:
+            tmp.unlink(missing_ok=True)
+        return dst.stat().st_size
+
+    async def copy_to(self, path: Path, dst: str):
+        """將快取的音訊複製到案例的音訊路徑"""
+        size = await asyncio.to_thread(self._copy, path, Path(dst))
+        await case_audio.added(size)
+
+    async def put(self, key: str, src: str):
+        """寫入快取；失敗只記錄錯誤，不影響案例"""
+        path = self.disk.path(key)
+        if path.exists():
+            return
+        try:
+            size = await asyncio.to_thread(self._copy, Path(src), path)
+            await self.disk.added(size)
+        except OSError as e:
+            logger.error(f"Failed to write audio cache entry {path}: {e}")
+
+    @staticmethod
+    async def read(
+        path: Path, chunk_size: int = 16 * 1024
+    ) -> AsyncGenerator[bytes, Any]:
+        async with aiofiles.open(path, "rb") as f:
+            while chunk := await f.read(chunk_size):
+                yield chunk
+
+
+# storage/audio/{case_id}.mp3 與其 .align.json
+case_audio = DiskTier(
+    AUDIO_DIR, ".mp3", max_bytes=AUDIO_MAX_BYTES, companions=(".align.json",)
+)
+roast_cache = RoastCache()
+audio_cache = AudioCache()
@@ -0,0 +1,162 @@
+import asyncio
+import hashlib
+import json
+import time
+from pathlib import Path
+from typing import Any, NamedTuple, Optional
+
+from api import tts as Tts
+from api.model_index import ModelIndex
+from settings import MODEL_CATALOGUE_DIR, MODEL_CATALOGUE_TTL
+from utils.log import logger
+
+SORT_KEYS = ("score", "task_count", "created_at")
+
+# 背景重新整理失敗後，至少間隔此秒數才再嘗試
+RETRY_INTERVAL = 30.0
+
+
+class CatalogueEntry(NamedTuple):
+    items: list[dict[str, Any]]
+    body: bytes  # 預先序列化的回應內容
+    etag: str
+    fetched_at: float
+
+
+def catalogue_lang(lang: Optional[str]) -> str:
+    return "zh" if not lang or lang.startswith("zh") else "en"
+
+
+def snapshot_path(directory: Path, sort_by: str, lang: str) -> Path:
+    """與 utils.fish_model 相同的檔名：zh 為 {sort_by}.json，en 為 {sort_by}_en.json"""
+    suffix = "" if lang == "zh" else "_en"
+    return directory / f"{sort_by}{suffix}.json"
+
+
+def make_entry(items: list[dict[str, Any]], fetched_at: float) -> CatalogueEntry:
+    body = json.dumps(items, ensure_ascii=False).encode("utf-8")
+    etag = f'"{hashlib.sha256(body).hexdigest()[:32]}"'
+    return CatalogueEntry(items, body, etag, fetched_at)
+
+
+class ModelCatalogue:
+    """
+    每個 (sort_by, lang) 的模型清單，stale-while-revalidate
+    - 啟動時從 storage/fish_model 的快照載入
+    - 過期後仍先回傳舊資料，同時在背景向 Fish Audio 重新整理
+    - 只有完全沒有資料時，請求才需要等待 Fish Audio
+    簡轉繁與 JSON 序列化在每次重新整理時做一次，而不是每個請求一次；
+    同一語言所有清單的模型另建 ModelIndex 供 /models?model_name= 在本機搜尋
+    """
+
+    def __init__(self, directory: str, ttl: float):
+        self.directory = Path(directory)
+        self.ttl = ttl
+        self.entries: dict[tuple[str, str], CatalogueEntry] = {}
+        self.in_flight: dict[tuple[str, str], asyncio.Task[CatalogueEntry]] = {}
+        self.last_attempt: dict[tuple[str, str], float] = {}
+        self.indexes: dict[str, ModelIndex] = {}
+        # `python ai.py models` 同步的完整精簡目錄，只用於搜尋
+        self.synced: dict[str, list[dict[str, Any]]] = {}
+
+    def _lang_items(self, lang: str) -> list[dict[str, Any]]:
+        items = [
+            item
+            for (_, entry_lang), entry in self.entries.items()
+            if entry_lang == lang
+            for item in entry.items
+        ]
+        return items + self.synced.get(lang, [])
+
+    def load_snapshots(self):
+        for sort_by in SORT_KEYS:
+            for lang in ("zh", "en"):
+                path = snapshot_path(self.directory, sort_by, lang)
+                try:
+                    items = json.loads(path.read_text("utf-8"))
+                except FileNotFoundError:
+                    continue
+                except (OSError, ValueError) as e:
+                    logger.warning(f"Failed to load model snapshot {path}: {e}")
+                    continue
+                # 以檔案修改時間作為取得時間，舊快照會在第一次請求時於背景更新
+                self.entries[(sort_by, lang)] = make_entry(items, path.stat().st_mtime)
+        for lang in ("zh", "en"):
+            path = snapshot_path(self.directory, "catalogue", lang)
+            try:
+                self.synced[lang] = json.loads(path.read_text("utf-8"))["models"]
+            except FileNotFoundError:
+                pass
+            except (OSError, ValueError, KeyError) as e:
+                logger.warning(f"Failed to load model catalogue {path}: {e}")
+            index = ModelIndex()
+            for model in self.synced.get(lang, []):
+                # 同步時已算好的簡繁形式，不隨搜尋結果回傳
+                cached = model.pop("variants", None)
+                if cached and model.get("_id"):
+                    index.seed(
+                        model["_id"],
+                        model.get("title") or "",
+                        model.get("description") or "",
+                        (tuple(cached[0]), tuple(cached[1])),
+                    )
+            index.update(self._lang_items(lang))
+            self.indexes[lang] = index
+        logger.info(
+            f"Loaded {len(self.entries)} model catalogue snapshots "
+            f"({', '.join(f'{k}: {len(v)} models' for k, v in self.indexes.items())}; "
+            f"{sum(i.converted for i in self.indexes.values())} converted)"
+        )
+
+    async def _refresh(self, key: tuple[str, str]) -> CatalogueEntry:
+        sort_by, lang = key
+        self.last_attempt[key] = time.time()
+        items = await Tts.get_models(
+            sort_by=sort_by, lang="zh-TW" if lang == "zh" else "en"
+        )
+        entry = make_entry(items, time.time())
+        self.entries[key] = entry
+        # 只有新增或標題、描述變更的模型需要簡繁轉換，通常只有幾個，
+        # 直接在事件迴圈上就地更新，搜尋不會看到建到一半的索引
+        self.indexes.setdefault(lang, ModelIndex()).update(self._lang_items(lang))
+        return entry
+
+    def _start_refresh(self, key: tuple[str, str]) -> asyncio.Task[CatalogueEntry]:
+        task = self.in_flight.get(key)
+        if task is None:
+            task = asyncio.create_task(self._refresh(key))
+            self.in_flight[key] = task
+            task.add_done_callback(lambda _: self.in_flight.pop(key, None))
+            task.add_done_callback(self._log_failure)
+        return task
+
+    def _log_failure(self, task: asyncio.Task[CatalogueEntry]):
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning(f"Model catalogue refresh failed: {task.exception()!r}")
+
+    async def get(self, sort_by: str, lang: Optional[str]) -> CatalogueEntry:
+        if sort_by not in SORT_KEYS:
+            raise ValueError(f"Unknown sort_by {sort_by}. Choose from {SORT_KEYS}")
+        key = (sort_by, catalogue_lang(lang))
+        entry = self.entries.get(key)
+        if entry is None:
+            # 冷快取：等待第一次取得，同時間的請求共用同一次上游呼叫
+            return await asyncio.shield(self._start_refresh(key))
+
+        now = time.time()
+        if (
+            now - entry.fetched_at > self.ttl
+            and now - self.last_attempt.get(key, 0) > RETRY_INTERVAL
+            and key not in self.in_flight
+        ):
+            self._start_refresh(key)
+        return entry
+
+    def search(
+        self, query: str, lang: Optional[str], limit: int = 10
+    ) -> list[dict[str, Any]]:
+        index = self.indexes.get(catalogue_lang(lang))
+        return index.search(query, limit) if index is not None else []
+
+
+model_catalogue = ModelCatalogue(MODEL_CATALOGUE_DIR, MODEL_CATALOGUE_TTL)
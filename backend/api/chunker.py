@@ -0,0 +1,177 @@
+import asyncio
+from typing import Any, AsyncGenerator, Optional
+
+# 句末與子句標點：句末優先切分，子句標點在片段過長時使用
+SENTENCE_END = set("。！？.!?；;\n")
+CLAUSE_END = set("，,、：:")
+
+
+class Chunker:
+    """決定何時把累積的文字送給 TTS 的策略"""
+
+    # 緩衝區有文字超過此秒數仍未送出時強制送出，None 表示不使用計時器
+    max_wait: Optional[float] = None
+
+    def __init__(self):
+        self.buffer = ""
+        self.sent = 0  # 已送出的片段數
+
+    def feed(self, text: str) -> list[str]:
+        """加入文字，回傳可以立即送出的片段"""
+        raise NotImplementedError
+
+    def flush(self) -> str:
+        """送出緩衝區內所有文字"""
+        text, self.buffer = self.buffer, ""
+        if text:
+            self.sent += 1
+        return text
+
+
+class FixedChunker(Chunker):
+    """累積到固定字數就送出，不考慮標點"""
+
+    def __init__(self, min_chars: int = 5):
+        super().__init__()
+        self.min_chars = min_chars
+
+    def feed(self, text: str) -> list[str]:
+        self.buffer += text
+        if len(self.buffer) < self.min_chars:
+            return []
+        return [self.flush()]
+
+
+class SentenceChunker(Chunker):
+    """
+    在句子或子句邊界送出，第一段盡量短以降低首段音訊延遲
+    - 第一段在最小長度後最早的句末或子句標點送出
+    - 之後的片段達到最小長度後，在最後一個句末標點送出
+    - 超過最大長度時退而在子句標點或空白處切分，都沒有就硬切
+    - 有文字等待超過 max_wait 秒時全部送出
+    """
+
+    def __init__(
+        self,
+        first_min_chars: int,
+        min_chars: int,
+        max_chars: int,
+        max_wait: Optional[float],
+        word_boundary: bool = False,
+    ):
+        super().__init__()
+        self.first_min_chars = first_min_chars
+        self.min_chars = min_chars
+        self.max_chars = max_chars
+        self.max_wait = max_wait
+        # 英文等以空白分詞的語言，句點後需接空白才算句末（避免切開 3.5 或 e.g.）
+        self.word_boundary = word_boundary
+
+    def _is_boundary(self, index: int, marks: set[str]) -> bool:
+        char = self.buffer[index]
+        if char not in marks:
+            return False
+        if char == "\n" or not (self.word_boundary or char == "."):
+            return True
+        # 半形句點在任何語言都需接空白（避免切開 3.5）
+        return index + 1 < len(self.buffer) and self.buffer[index + 1].isspace()
+
+    def _cut(self, index: int) -> str:
+        text, self.buffer = self.buffer[: index + 1], self.buffer[index + 1 :]
+        self.sent += 1
+        return text
+
+    def _first_cut(self) -> Optional[int]:
+        """第一段：最小長度之後最早的句末或子句標點，一次收到多句時也只送出第一句"""
+        for index in range(
+            self.first_min_chars - 1, min(len(self.buffer), self.max_chars)
+        ):
+            if self._is_boundary(index, SENTENCE_END) or self._is_boundary(
+                index, CLAUSE_END
+            ):
+                return index
+        return None
+
+    def _next_cut(self) -> Optional[int]:
+        """之後的片段：最大長度內最後一個句末標點，盡量合併句子以減少片段數"""
+        last = min(len(self.buffer), self.max_chars) - 1
+        for index in range(last, self.min_chars - 2, -1):
+            if self._is_boundary(index, SENTENCE_END):
+                return index
+        return None
+
+    def feed(self, text: str) -> list[str]:
+        self.buffer += text
+        chunks = []
+        while True:
+            cut = self._next_cut() if self.sent else self._first_cut()
+            if cut is None and len(self.buffer) >= self.max_chars:
+                window = self.buffer[: self.max_chars]
+                cut = max(
+                    (i for i, c in enumerate(window) if c in CLAUSE_END or c.isspace()),
+                    default=self.max_chars - 1,
+                )
+            if cut is None:
+                return chunks
+            chunks.append(self._cut(cut))
+
+
+def create_chunker(strategy: str, lang: str) -> Chunker:
+    """依策略名稱與語言建立 Chunker，zh 與 en 各有調整過的預設值"""
+    if strategy == "fixed":
+        return FixedChunker()
+    if strategy == "sentence":
+        if lang.startswith("zh"):
+            return SentenceChunker(
+                first_min_chars=3, min_chars=12, max_chars=60, max_wait=0.4
+            )
+        return SentenceChunker(
+            first_min_chars=3,
+            min_chars=40,
+            max_chars=160,
+            max_wait=0.4,
+            word_boundary=True,
+        )
+    raise ValueError(f"Unknown chunker {strategy}. Choose from ['fixed', 'sentence']")
+
+
+async def chunk_text(
+    text_gen: AsyncGenerator[str, Any], chunker: Chunker
+) -> AsyncGenerator[str, None]:
+    """依 chunker 策略重新切分文字串流，並在等待過久時由計時器強制送出"""
+    loop = asyncio.get_running_loop()
+    buffered_since: Optional[float] = None
+    next_text: Optional[asyncio.Task[str]] = None
+    try:
+        while True:
+            if next_text is None:
+                next_text = asyncio.ensure_future(anext(text_gen))
+            timeout = None
+            if chunker.max_wait is not None and buffered_since is not None:
+                timeout = max(buffered_since + chunker.max_wait - loop.time(), 0)
+            # 不可直接對 anext 使用 wait_for，逾時取消會中斷上游生成器
+            done, _ = await asyncio.wait({next_text}, timeout=timeout)
+            if not done:
+                if text := chunker.flush():
+                    yield text
+                buffered_since = None
+                continue
+
+            try:
+                text = next_text.result()
+            except StopAsyncIteration:
+                break
+            finally:
+                next_text = None
+            for chunk in chunker.feed(text):
+                yield chunk
+            if not chunker.buffer:
+                buffered_since = None
+            elif buffered_since is None:
+                buffered_since = loop.time()
+
+        if text := chunker.flush():
+            yield text
+    finally:
+        if next_text is not None:
+            next_text.cancel()
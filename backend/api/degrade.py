@@ -0,0 +1,139 @@
+import time
+from typing import Any, Literal, NamedTuple
+
+from api import ai, metrics
+from api import tts as Tts
+from api.admission import admission
+from settings import (
+    DEGRADE_LITE_LOAD,
+    DEGRADE_LITE_MODEL,
+    DEGRADE_LLM_OPEN_CIRCUITS,
+    DEGRADE_MIN_HOLD,
+    DEGRADE_RECOVER_RATIO,
+    DEGRADE_TEXT_ONLY_LOAD,
+    DEGRADE_TTS_ERROR_RATE,
+    DEGRADE_TTS_MAX_STREAMS,
+    LLMs,
+    LLMs_list,
+)
+from utils.log import logger
+
+# full：照請求；text_only：不合成語音；lite：不合成語音且改用較便宜的 LLM
+Mode = Literal["full", "text_only", "lite"]
+MODES: tuple[Mode, ...] = ("full", "text_only", "lite")
+
+
+class Decision(NamedTuple):
+    mode: Mode
+    tts: bool
+    llm_model: LLMs
+
+
+class DegradationController:
+    """
+    依負載決定新案例的服務等級，讓尖峰時仍能持續產出文字銳評
+    - 每次建立案例時以目前的訊號重新評估，不需要背景任務
+    - 升級（降級程度加重）立即生效；恢復需要訊號低於門檻的 recover_ratio 倍，
+      並在目前等級維持至少 min_hold 秒
+    - 只影響新案例，進行中的案例不變
+    進行中的案例數受准入名額限制，不會超過 max_active - 1（決定時新案例尚未建立），
+    因此案例數的門檻以佔名額的比例表示：load = (running_cases + 1) / max_active
+    """
+
+    def __init__(
+        self,
+        recover_ratio: float,
+        min_hold: float,
+        lite_model: str,
+        max_active: int,
+        text_only_load: float,
+        lite_load: float,
+    ):
+        if lite_model not in LLMs_list:
+            raise ValueError(
+                f"Unknown lite model {lite_model}. Choose from {LLMs_list}"
+            )
+        for name, load in (("text_only", text_only_load), ("lite", lite_load)):
+            if not 0 < load <= 1:
+                raise ValueError(
+                    f"Degrade {name} load must be in (0, 1], got {load}: "
+                    "running cases can never exceed the admission limit"
+                )
+        self.recover_ratio = recover_ratio
+        self.min_hold = min_hold
+        self.lite_model = lite_model
+        self.max_active = max_active
+        self.text_only_load = text_only_load
+        self.lite_load = lite_load
+        if max_active <= 0:
+            logger.warning(
+                "Admission limit is disabled, case load never triggers degradation"
+            )
+        self.level = 0
+        self.changed_at = 0.0
+        self.counts = {mode: 0 for mode in MODES}
+
+    def signals(self, running_cases: int) -> dict[str, float]:
+        return {
+            "running_cases": running_cases,
+            "case_load": (
+                (running_cases + 1) / self.max_active if self.max_active > 0 else 0.0
+            ),
+            "tts_streams": Tts.tts_clients.active,
+            "tts_error_rate": Tts.tts_clients.error_rate(),
+            "llm_open_circuits": sum(
+                breaker.state == "open" for breaker in ai.breakers.values()
+            ),
+        }
+
+    def _target(self, signals: dict[str, float]) -> int:
+        def over(name: str, threshold: float, level: int) -> bool:
+            # 已在此等級以上時改用較低的恢復門檻
+            if self.level >= level:
+                threshold *= self.recover_ratio
+            return signals[name] >= threshold
+
+        if over("case_load", self.lite_load, 2) or over(
+            "llm_open_circuits", DEGRADE_LLM_OPEN_CIRCUITS, 2
+        ):
+            return 2
+        if (
+            over("case_load", self.text_only_load, 1)
+            or over("tts_streams", DEGRADE_TTS_MAX_STREAMS, 1)
+            or over("tts_error_rate", DEGRADE_TTS_ERROR_RATE, 1)
+        ):
+            return 1
+        return 0
+
+    def decide(self, running_cases: int, tts: bool, llm_model: LLMs) -> Decision:
+        signals = self.signals(running_cases)
+        target = self._target(signals)
+        now = time.monotonic()
+        if target > self.level or (
+            target < self.level and now - self.changed_at >= self.min_hold
+        ):
+            log = logger.warning if target > self.level else logger.info
+            log(f"Service level {MODES[self.level]} -> {MODES[target]}: {signals}")
+            self.level, self.changed_at = target, now
+
+        mode = MODES[self.level]
+        self.counts[mode] += 1
+        if mode == "full":
+            return Decision(mode, tts, llm_model)
+        if mode == "text_only":
+            return Decision(mode, False, llm_model)
+        return Decision(mode, False, self.lite_model)  # type: ignore[arg-type]
+
+    def stats(self) -> dict[str, Any]:
+        return {"mode": MODES[self.level], "cases_by_mode": dict(self.counts)}
+
+
+degrader = DegradationController(
+    DEGRADE_RECOVER_RATIO,
+    DEGRADE_MIN_HOLD,
+    DEGRADE_LITE_MODEL,
+    admission.max_active,
+    DEGRADE_TEXT_ONLY_LOAD,
+    DEGRADE_LITE_LOAD,
+)
+metrics.service_level.set_function(lambda: degrader.level)
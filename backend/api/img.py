@@ -1,8 +1,36 @@
+import asyncio
+import time
+
 import httpx
-from settings import IMG_API_KEY
+from api.cache import JsonCache, content_key
+from api.metrics import image_search_seconds
+from settings import (
+    IMG_API_KEY,
+    IMG_CACHE_DIR,
+    IMG_CACHE_MAX_DISK_ENTRIES,
+    IMG_CACHE_MAX_ENTRIES,
+    IMG_CACHE_TTL,
+)
 
+# 長期共用的連線池，避免每次搜尋都重新 TCP+TLS 握手
+client = httpx.AsyncClient(
+    timeout=10,
+    limits=httpx.Limits(max_keepalive_connections=20, keepalive_expiry=120),
+)
 
-async def search_images(query: str, lang: str = "zh-TW") -> list[str]:
+image_cache: JsonCache[list[str]] = JsonCache(
+    "image",
+    IMG_CACHE_DIR,
+    IMG_CACHE_MAX_ENTRIES,
+    IMG_CACHE_MAX_DISK_ENTRIES,
+    IMG_CACHE_TTL,
+)
+
+# 進行中的搜尋，相同 (query, lang) 的並發請求共用同一次上游呼叫
+in_flight: dict[str, asyncio.Task[list[str]]] = {}
+
+
+async def _fetch_images(key: str, query: str, lang: str) -> list[str]:
     url = "https://google.serper.dev/images"
     if lang.startswith("zh"):
         payload = {"q": query, "gl": "tw", "hl": "zh-tw"}
@@ -13,7 +41,29 @@ async def search_images(query: str, lang: str = "zh-TW") -> list[str]:
         "Content-Type": "application/json",
     }
 
-    async with httpx.AsyncClient() as client:
-        response = await client.post(url, json=payload, headers=headers)
-        data = response.json().get("images", [])
-    return [i["imageUrl"] for i in data]
+    response = await client.post(url, json=payload, headers=headers)
+    data = response.json().get("images", [])
+    images = [i["imageUrl"] for i in data]
+    if images:
+        await image_cache.put(key, images)
+    return images
+
+
+async def search_images(query: str, lang: str = "zh-TW") -> list[str]:
+    start = time.perf_counter()
+    key = content_key(query, lang)
+    cached = await image_cache.get(key)
+    if cached is not None:
+        image_search_seconds.labels("cache").observe(time.perf_counter() - start)
+        return cached
+
+    task = in_flight.get(key)
+    source = "shared" if task else "upstream"
+    if task is None:
+        task = asyncio.create_task(_fetch_images(key, query, lang))
+        in_flight[key] = task
+        task.add_done_callback(lambda _: in_flight.pop(key, None))
+    # 單一請求被取消時不影響其他等待同一結果的請求
+    images = await asyncio.shield(task)
+    image_search_seconds.labels(source).observe(time.perf_counter() - start)
+    return images
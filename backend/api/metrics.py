@@ -0,0 +1,324 @@
+import os
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Callable, Iterator, Optional
+
+from settings import WORKERS
+
+# 延遲類指標的預設 bucket（秒）
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 4.0, 8.0, 16.0, 32.0)
+# 吞吐量類指標的 bucket
+RATE_BUCKETS = (5, 10, 20, 50, 100, 200, 500, 1000)
+BYTE_RATE_BUCKETS = (4e3, 8e3, 16e3, 32e3, 64e3, 128e3, 256e3, 1e6)
+
+Labels = tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: Labels, values: Labels, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Metric:
+    """
+    Prometheus 文字格式的指標，帶標籤時以 labels(...) 取得子項
+    熱路徑上只有 dict 查詢與數值運算，輸出在 /metrics 被抓取時才進行
+    """
+
+    type = ""
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Labels = (),
+        registry: Optional["Registry"] = None,
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.children: dict[Labels, object] = {}
+        (registry or REGISTRY).register(self)
+
+    def _new_child(self) -> object:
+        raise NotImplementedError
+
+    def labels(self, *values: str):
+        if len(values) != len(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}")
+        child = self.children.get(values)
+        if child is None:
+            child = self.children[values] = self._new_child()
+        return child
+
+    def samples(self, const: str = "") -> Iterator[str]:
+        """const 為附加在每個樣本上的固定標籤（已格式化）"""
+        raise NotImplementedError
+
+    def render(self, const: str = "") -> str:
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.type}",
+            *self.samples(const),
+        ]
+        return "\n".join(lines)
+
+
+class _Value:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0):
+        self.value += amount
+
+    def dec(self, amount: float = 1.0):
+        self.value -= amount
+
+    def set(self, value: float):
+        self.value = value
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def _new_child(self) -> _Value:
+        return _Value()
+
+    def inc(self, amount: float = 1.0):
+        self.labels().inc(amount)
+
+    def samples(self, const: str = "") -> Iterator[str]:
+        for values, child in self.children.items():
+            labels = _format_labels(self.labelnames, values, const)
+            yield f"{self.name}_total{labels} {_format_value(child.value)}"  # type: ignore[attr-defined]
+
+
+class Gauge(Metric):
+    """可直接設定，或以 set_function 在抓取時計算目前值（回傳數值，或 {標籤值: 數值}）"""
+
+    type = "gauge"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.function: Optional[Callable[[], float | dict[Labels, float]]] = None
+
+    def _new_child(self) -> _Value:
+        return _Value()
+
+    def set(self, value: float):
+        self.labels().set(value)
+
+    def set_function(self, function: Callable[[], float | dict[Labels, float]]):
+        self.function = function
+
+    def samples(self, const: str = "") -> Iterator[str]:
+        values: dict[Labels, float]
+        if self.function is None:
+            values = {k: child.value for k, child in self.children.items()}  # type: ignore[attr-defined]
+        else:
+            result = self.function()
+            values = result if isinstance(result, dict) else {(): result}
+        for labels, value in values.items():
+            labels = _format_labels(self.labelnames, labels, const)
+            yield f"{self.name}{labels} {_format_value(value)}"
+
+
+class _HistogramValue:
+    __slots__ = ("bounds", "counts", "sum")
+
+    def __init__(self, bounds: tuple[float, ...]):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # 最後一格為 +Inf
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+    @contextmanager
+    def time(self) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Labels = (),
+        buckets: tuple[float, ...] = LATENCY_BUCKETS,
+        registry: Optional["Registry"] = None,
+    ):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames, registry)
+
+    def _new_child(self) -> _HistogramValue:
+        return _HistogramValue(self.buckets)
+
+    def observe(self, value: float):
+        self.labels().observe(value)
+
+    def time(self):
+        return self.labels().time()
+
+    def samples(self, const: str = "") -> Iterator[str]:
+        for values, child in self.children.items():
+            cumulative = 0
+            for bound, count in zip((*self.buckets, float("inf")), child.counts):  # type: ignore[attr-defined]
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                extra = f"{const},{le}" if const else le
+                labels = _format_labels(self.labelnames, values, extra)
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            labels = _format_labels(self.labelnames, values, const)
+            yield f"{self.name}_sum{labels} {_format_value(child.sum)}"  # type: ignore[attr-defined]
+            yield f"{self.name}_count{labels} {cumulative}"
+
+
+class Registry:
+    """
+    程序內的指標集合；多 worker 時每個 worker 各有一份，/metrics 只回傳接到請求的那一個
+    worker_label 為真時每個樣本都帶 worker="{pid}"，不同 worker 的序列不會互相覆蓋
+    """
+
+    def __init__(self, worker_label: bool = False):
+        self.metrics: dict[str, Metric] = {}
+        self.worker_label = worker_label
+
+    def register(self, metric: Metric):
+        if metric.name in self.metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self.metrics[metric.name] = metric
+
+    def render(self) -> str:
+        # 抓取時才取 pid，fork 出來的 worker 各自帶自己的 pid
+        const = f'worker="{os.getpid()}"' if self.worker_label else ""
+        rendered = (metric.render(const) for metric in self.metrics.values())
+        return "\n".join(rendered) + "\n"
+
+
+REGISTRY = Registry(worker_label=WORKERS > 1)
+
+# 管線各階段的指標，於各模組中更新
+turnstile_seconds = Histogram(
+    "aitier_turnstile_seconds",
+    "Turnstile validation latency",
+    ("endpoint", "result"),
+)
+image_search_seconds = Histogram(
+    "aitier_image_search_seconds",
+    "Image search latency, including cache hits",
+    ("source",),
+)
+llm_ttft_seconds = Histogram(
+    "aitier_llm_ttft_seconds",
+    "LLM time to first token, including hedging",
+    ("model",),
+)
+llm_tokens_per_second = Histogram(
+    "aitier_llm_tokens_per_second",
+    "Estimated LLM output tokens per second after the first token",
+    ("model",),
+    buckets=RATE_BUCKETS,
+)
+llm_requests = Counter(
+    "aitier_llm_requests",
+    "LLM streams by serving model and outcome",
+    ("model", "result"),
+)
+tts_pool_requests = Counter(
+    "aitier_tts_pool_requests",
+    "Fish Audio websocket acquisitions served from the pre-opened pool",
+    ("result",),
+)
+tts_ttfb_seconds = Histogram(
+    "aitier_tts_ttfb_seconds",
+    "Fish Audio time to first audio byte, from socket acquisition",
+)
+tts_bytes_per_second = Histogram(
+    "aitier_tts_bytes_per_second",
+    "Fish Audio audio bytes per second after the first byte",
+    buckets=BYTE_RATE_BUCKETS,
+)
+tts_requests = Counter(
+    "aitier_tts_requests",
+    "Fish Audio syntheses by outcome",
+    ("result",),
+)
+cleanup_seconds = Histogram(
+    "aitier_cleanup_seconds",
+    "Duration of the ApiService cleanup sweep",
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5),
+)
+admission_wait_seconds = Histogram(
+    "aitier_admission_wait_seconds",
+    "Time admitted /tier requests waited for a slot",
+    buckets=(0.001, 0.01, 0.1, 0.5, 1.0, 2.0, 5.0, 10.0),
+)
+admission_rejected = Counter(
+    "aitier_admission_rejected",
+    "Rejected /tier requests by reason",
+    ("reason",),
+)
+cache_requests = Counter(
+    "aitier_cache_requests",
+    "Cache lookups by cache (roast, audio, image) and result",
+    ("cache", "result"),
+)
+batch_items = Counter(
+    "aitier_batch_items",
+    "/tier/batch items by outcome",
+    ("result",),
+)
+log_dropped = Counter(
+    "aitier_log_dropped",
+    "Log records dropped because the log queue was full",
+)
+
+# 抓取時才計算的即時狀態，由擁有該狀態的模組以 set_function 設定
+live_cases = Gauge("aitier_live_cases", "ApiService instances held in memory")
+running_cases = Gauge(
+    "aitier_running_cases", "Cases whose LLM, TTS or save work is still running"
+)
+case_listeners = Gauge("aitier_case_listeners", "Clients attached to case streams")
+broadcaster_bytes = Gauge(
+    "aitier_broadcaster_bytes", "Bytes held in memory by all broadcasters"
+)
+broadcaster_chunks = Gauge(
+    "aitier_broadcaster_chunks",
+    "Chunks held in memory by all broadcasters of a stream",
+    ("stream",),
+)
+broadcaster_max_chunks = Gauge(
+    "aitier_broadcaster_max_chunks",
+    "Chunks held by the fullest broadcaster of a stream",
+    ("stream",),
+)
+admission_slots = Gauge(
+    "aitier_admission_slots", "Admission slots in use and requests queued", ("state",)
+)
+service_level = Gauge(
+    "aitier_service_level",
+    "Degradation level for new cases (0 full, 1 text_only, 2 lite)",
+)
@@ -0,0 +1,156 @@
+import unicodedata
+from typing import Any, Iterable, Optional
+
+from api.tts import s2t, t2s
+
+# 標題的正規化形式與描述的正規化形式（皆含繁體與簡體）
+Variants = tuple[tuple[str, ...], tuple[str, ...]]
+
+
+def normalize(text: str) -> str:
+    return unicodedata.normalize("NFKC", text).casefold()
+
+
+def grams(text: str) -> set[str]:
+    """單字與雙字 n-gram；中文標題常只有兩三個字，三字 n-gram 太稀疏"""
+    result = set(text)
+    result.update(text[i : i + 2] for i in range(len(text) - 1))
+    return result
+
+
+def variants(title: str, description: str) -> Variants:
+    """正規化後的原文、繁體與簡體形式；簡繁轉換是建索引時最慢的一步"""
+    title = normalize(title)
+    description = normalize(description)
+    return (
+        tuple({title, s2t(title), t2s(title)}),
+        tuple({description, s2t(description), t2s(description)}),
+    )
+
+
+def popularity(model: dict[str, Any]) -> tuple[int, int]:
+    return (-(model.get("task_count") or 0), -(model.get("like_count") or 0))
+
+
+class ModelIndex:
+    """
+    語音模型標題與描述的 n-gram 倒排索引，同時收錄繁體與簡體形式
+    - 每個 _id 有固定的文件編號，update() 只重建新增、標題或描述變更、移除的模型，
+      未變更的模型不重跑簡繁轉換
+    - 轉換結果也可以由目錄快照預先提供（seed），啟動時不必轉換已同步的模型
+    - 以查詢字串的 n-gram posting 交集取得候選，再以子字串比對確認
+    - 候選依 task_count、like_count 由高到低排序，標題命中的排在描述命中之前
+    """
+
+    def __init__(self, items: Iterable[dict[str, Any]] = ()):
+        self.doc_ids: dict[str, int] = {}
+        self.models: list[Optional[dict[str, Any]]] = []
+        self.sources: list[Optional[tuple[str, str]]] = []
+        self.titles: list[tuple[str, ...]] = []
+        self.texts: list[tuple[str, ...]] = []
+        self.postings: dict[str, set[int]] = {}
+        self.rank: list[int] = []
+        self.free: list[int] = []
+        # _id -> (標題原文, 描述原文, 轉換結果)，原文不同時視為失效
+        self.cache: dict[str, tuple[str, str, Variants]] = {}
+        self.converted = 0
+        self.update(items)
+
+    def __len__(self) -> int:
+        return len(self.doc_ids)
+
+    def seed(self, _id: str, title: str, description: str, cached: Variants):
+        self.cache[_id] = (title, description, cached)
+
+    def _variants(self, _id: str, title: str, description: str) -> Variants:
+        entry = self.cache.get(_id)
+        if entry is not None and entry[0] == title and entry[1] == description:
+            return entry[2]
+        result = variants(title, description)
+        self.cache[_id] = (title, description, result)
+        self.converted += 1
+        return result
+
+    def _index(self, doc_id: int, _id: str, source: tuple[str, str]):
+        titles, descriptions = self._variants(_id, *source)
+        texts = titles + descriptions
+        self.sources[doc_id] = source
+        self.titles[doc_id] = titles
+        self.texts[doc_id] = texts
+        for gram in set().union(*map(grams, texts)):
+            self.postings.setdefault(gram, set()).add(doc_id)
+
+    def _unindex(self, doc_id: int):
+        for gram in set().union(*map(grams, self.texts[doc_id])):
+            posting = self.postings.get(gram)
+            if posting is not None:
+                posting.discard(doc_id)
+                if not posting:
+                    del self.postings[gram]
+        self.sources[doc_id] = None
+        self.titles[doc_id] = ()
+        self.texts[doc_id] = ()
+
+    def update(self, items: Iterable[dict[str, Any]]):
+        """以目前的完整模型清單更新索引，回傳後立即生效"""
+        # 相同模型出現在多個清單時保留第一個（欄位較完整的排序清單）
+        unique: dict[str, dict[str, Any]] = {}
+        for item in items:
+            if item.get("_id"):
+                unique.setdefault(item["_id"], item)
+
+        for _id in self.doc_ids.keys() - unique.keys():
+            doc_id = self.doc_ids.pop(_id)
+            self._unindex(doc_id)
+            self.models[doc_id] = None
+            self.cache.pop(_id, None)
+            self.free.append(doc_id)
+
+        for _id, model in unique.items():
+            source = (model.get("title") or "", model.get("description") or "")
+            doc_id = self.doc_ids.get(_id)
+            if doc_id is None:
+                if self.free:
+                    doc_id = self.free.pop()
+                else:
+                    doc_id = len(self.models)
+                    self.models.append(None)
+                    self.sources.append(None)
+                    self.titles.append(())
+                    self.texts.append(())
+                self.doc_ids[_id] = doc_id
+            elif self.sources[doc_id] != source:
+                self._unindex(doc_id)
+            self.models[doc_id] = model
+            if self.sources[doc_id] is None:
+                self._index(doc_id, _id, source)
+
+        rank = [0] * len(self.models)
+        order = sorted(unique, key=lambda _id: popularity(unique[_id]))
+        for position, _id in enumerate(order):
+            rank[self.doc_ids[_id]] = position
+        self.rank = rank
+
+    def search(self, query: str, limit: int = 10) -> list[dict[str, Any]]:
+        query = normalize(query.strip())
+        if not query:
+            return []
+        keys = grams(query) if len(query) == 1 else grams(query) - set(query)
+        lists = sorted((self.postings.get(k, set()) for k in keys), key=len)
+        if not lists or not lists[0]:
+            return []
+        candidates = set(lists[0])
+        for posting in lists[1:]:
+            candidates.intersection_update(posting)
+            if not candidates:
+                return []
+
+        title_hits, text_hits = [], []
+        for doc_id in sorted(candidates, key=self.rank.__getitem__):
+            if any(query in t for t in self.titles[doc_id]):
+                title_hits.append(doc_id)
+                if len(title_hits) >= limit:
+                    break
+            elif any(query in t for t in self.texts[doc_id]):
+                text_hits.append(doc_id)
+        return [self.models[i] for i in (title_hits + text_hits)[:limit]]
@@ -0,0 +1,233 @@
+import asyncio
+import json
+import os
+import socket
+import struct
+from pathlib import Path
+from typing import Any, AsyncGenerator, Callable, Optional
+
+from fastapi import HTTPException
+from utils.log import logger
+
+# (case_id, stream, offset) -> 本地串流；找不到時回傳 None
+StreamGetter = Callable[[str, str, int], Optional[AsyncGenerator[Any, None]]]
+# case_id -> 本程序是否仍擁有該案例
+OwnsCase = Callable[[str], bool]
+
+# 訊框格式：1 byte 類型 + 4 bytes 長度
+FRAME = struct.Struct("!BI")
+FRAME_STR = 0
+FRAME_BYTES = 1
+FRAME_END = 2
+FRAME_NOT_FOUND = 3
+
+
+class CaseBackend:
+    """案例串流的共享後端，預設僅在單一程序內有效"""
+
+    async def register(self, case_id: str, tts: bool): ...
+
+    async def unregister(self, *case_ids: str): ...
+
+    async def lookup(self, case_id: str) -> Optional["RemoteCase"]:
+        return None
+
+    async def close(self): ...
+
+
+class LocalCaseBackend(CaseBackend):
+    """單一程序：所有案例都在 ApiService.all_services 內"""
+
+
+class RemoteCase:
+    """由其他 worker 擁有的案例，透過 Unix socket 讀取其串流"""
+
+    def __init__(self, case_id: str, socket_path: str, tts: bool):
+        self.case_id = case_id
+        self.socket_path = socket_path
+        self.tts = tts
+
+    async def _request(
+        self, stream: Optional[str], offset: int = 0
+    ) -> tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+        reader, writer = await asyncio.open_unix_connection(self.socket_path)
+        request = {"case_id": self.case_id, "stream": stream, "offset": offset}
+        writer.write(json.dumps(request).encode() + b"\n")
+        await writer.drain()
+        return reader, writer
+
+    async def owned(self) -> bool:
+        """詢問擁有者是否仍持有此案例；socket 已失效時拋出 ConnectionRefusedError 等"""
+        reader, writer = await self._request(None)
+        try:
+            kind, _ = FRAME.unpack(await reader.readexactly(FRAME.size))
+            return kind == FRAME_END
+        finally:
+            writer.close()
+
+    async def _stream(self, stream: str, offset: int = 0) -> AsyncGenerator[Any, None]:
+        reader, writer = await self._request(stream, offset)
+        try:
+            while True:
+                kind, length = FRAME.unpack(await reader.readexactly(FRAME.size))
+                if kind == FRAME_END:
+                    return
+                if kind == FRAME_NOT_FOUND:
+                    raise HTTPException(status_code=404, detail="Case not found")
+                payload = await reader.readexactly(length)
+                yield payload.decode("utf-8") if kind == FRAME_STR else payload
+        finally:
+            writer.close()
+
+    def audio_file(self) -> None:
+        # 擁有者程序仍可能在寫入音訊，一律經由串流讀取
+        return None
+
+    def tts_gen(self) -> AsyncGenerator[bytes, None]:
+        if not self.tts:
+            raise HTTPException(status_code=400, detail="TTS is disabled for this case")
+        return self._stream("tts")
+
+    def llm_gen(self) -> AsyncGenerator[str, None]:
+        return self._stream("text")
+
+    def event_gen(self) -> AsyncGenerator[str, None]:
+        return self._stream("events")
+
+    async def image_url(self) -> str:
+        return "".join([chunk async for chunk in self._stream("image")])
+
+
+class UnixSocketCaseBackend(CaseBackend):
+    """
+    同主機多 worker 共享案例串流
+    每個 worker 在 {directory}/{pid}.sock 提供自己擁有的案例，
+    並在 {directory}/cases/{case_id} 記錄擁有者，讓其他 worker 能找到它
+    - 檔案系統操作都在執行緒中進行，不阻塞事件迴圈
+    - 查詢時先連線詢問擁有者，已結束的 worker 留下的紀錄會被移除
+    """
+
+    def __init__(self, directory: str, get_stream: StreamGetter, owns: OwnsCase):
+        self.directory = Path(directory)
+        self.cases_dir = self.directory / "cases"
+        self.socket_path = ""
+        self.get_stream = get_stream
+        self.owns = owns
+        self.server_task: Optional[asyncio.Task[asyncio.AbstractServer]] = None
+
+    def _bind(self) -> socket.socket:
+        self.cases_dir.mkdir(parents=True, exist_ok=True)
+        # 在第一次註冊時才決定路徑，fork 出來的 worker 各自使用自己的 pid
+        self.socket_path = str(self.directory / f"{os.getpid()}.sock")
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.bind(self.socket_path)
+        sock.listen(128)
+        sock.setblocking(False)
+        return sock
+
+    async def _listen(self) -> asyncio.AbstractServer:
+        sock = await asyncio.to_thread(self._bind)
+        server = await asyncio.start_unix_server(self._handle, sock=sock)
+        logger.info(f"Case stream server listening on {self.socket_path}")
+        return server
+
+    async def register(self, case_id: str, tts: bool):
+        # 同時註冊的案例共用同一次啟動；伺服器就緒後才寫入紀錄，其他 worker 立即可以連線
+        if self.server_task is None:
+            self.server_task = asyncio.create_task(self._listen())
+        await self.server_task
+        record = json.dumps({"socket": self.socket_path, "tts": tts})
+        path = self.cases_dir / case_id
+        await asyncio.to_thread(path.write_text, record, encoding="utf-8")
+
+    async def unregister(self, *case_ids: str):
+        def unlink():
+            for case_id in case_ids:
+                (self.cases_dir / case_id).unlink(missing_ok=True)
+
+        await asyncio.to_thread(unlink)
+
+    async def lookup(self, case_id: str) -> Optional[RemoteCase]:
+        path = self.cases_dir / case_id
+        # case_id 來自 URL，避免路徑穿越
+        if path.parent != self.cases_dir:
+            return None
+        record = await asyncio.to_thread(self._read_record, path)
+        if record is None or record["socket"] == self.socket_path:
+            return None
+        remote = RemoteCase(case_id, record["socket"], record["tts"])
+        try:
+            owned = await remote.owned()
+        except (ConnectionRefusedError, FileNotFoundError, asyncio.IncompleteReadError):
+            logger.warning(f"Removing stale owner record of case {case_id}")
+            await asyncio.to_thread(self._remove_stale, path, record["socket"])
+            return None
+        return remote if owned else None
+
+    @staticmethod
+    def _read_record(path: Path) -> Optional[dict[str, Any]]:
+        try:
+            return json.loads(path.read_text(encoding="utf-8"))
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def _remove_stale(self, path: Path, socket_path: str):
+        # 讀取後紀錄可能已被新的擁有者改寫，只移除仍指向失效 socket 的紀錄
+        record = self._read_record(path)
+        if record is not None and record["socket"] == socket_path:
+            path.unlink(missing_ok=True)
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            request = json.loads(await reader.readline())
+            case_id = request["case_id"]
+            # 未指定串流時只回答是否仍擁有該案例
+            if request["stream"] is None:
+                owned = self.owns(case_id)
+                writer.write(FRAME.pack(FRAME_END if owned else FRAME_NOT_FOUND, 0))
+                return
+            stream = self.get_stream(
+                case_id, request["stream"], request.get("offset", 0)
+            )
+            if stream is None:
+                writer.write(FRAME.pack(FRAME_NOT_FOUND, 0))
+                return
+            async for chunk in stream:
+                if isinstance(chunk, str):
+                    payload, kind = chunk.encode("utf-8"), FRAME_STR
+                else:
+                    payload, kind = bytes(chunk), FRAME_BYTES
+                writer.write(FRAME.pack(kind, len(payload)) + payload)
+                await writer.drain()
+            writer.write(FRAME.pack(FRAME_END, 0))
+        except (ConnectionError, KeyError, TypeError, ValueError) as e:
+            logger.error(f"Case stream connection error: {e!r}")
+        finally:
+            writer.close()
+
+    async def close(self):
+        if self.server_task is None:
+            return
+        server = await self.server_task
+        server.close()
+        await asyncio.to_thread(self._remove_own_records)
+
+    def _remove_own_records(self):
+        for path in self.cases_dir.iterdir():
+            record = self._read_record(path)
+            if record is not None and record["socket"] == self.socket_path:
+                path.unlink(missing_ok=True)
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+
+
+def create_case_backend(
+    name: str, directory: str, get_stream: StreamGetter, owns: OwnsCase
+) -> CaseBackend:
+    if name == "local":
+        return LocalCaseBackend()
+    if name == "unix":
+        return UnixSocketCaseBackend(directory, get_stream, owns)
+    raise ValueError(f"Unknown case backend {name}. Choose from ['local', 'unix']")
@@ -1,44 +1,337 @@
 import asyncio
-from collections import OrderedDict
-from re import sub
-from typing import Any, AsyncGenerator, Optional, TypeVar
+import weakref
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from itertools import islice
+from pathlib import Path
+from typing import (
+    Any,
+    AsyncGenerator,
+    Awaitable,
+    Callable,
+    Iterator,
+    Literal,
+    Optional,
+)
 from uuid import uuid4
 
 import aiofiles
-from api import ai
+from api import ai, metrics
 from api import tts as Tts
+from api.alignment import build_alignment, split_text, tier_char, write_alignment
+from api.archive import ArchivedCase, case_archive, decode_events, encode_timeline
+from api.cache import audio_cache, case_audio, roast_cache
+from api.chunker import chunk_text, create_chunker
+from api.img import search_images
+from api.registry import RemoteCase, create_case_backend
+from api.tier_parser import StreamEvent, clean_text, parse_events
+from api.tracing import tracer
 from fastapi import HTTPException
-from settings import API_SERVICE_TIME_OUT, LLMs, LLMs_list
+from settings import (
+    API_SERVICE_TIME_OUT,
+    AUDIO_DIR,
+    BROADCASTER_GLOBAL_MAX_BYTES,
+    BROADCASTER_MAX_BYTES,
+    CASE_ARCHIVED_TTL,
+    CASE_BACKEND,
+    CASE_IDLE_GRACE,
+    CASE_PERSIST,
+    CASE_SOCKET_DIR,
+    DEFAULT_TTS_MODEL,
+    LLMs,
+    LLMs_list,
+    TTS_CHUNKER,
+)
 from utils.log import logger
 
-NO_VOICE = (
-    r"\[夯\]|\[頂級\]|\[人上人\]|\[NPC\]|\[拉完了\]|\[S\]|\[A\]|\[B\]|\[C\]|\[D\]"
-)
+OverflowPolicy = Literal["block", "spill", "drop"]
+
+SPILL_READ_SIZE = 64 * 1024
+
+# Fish Audio mp3 輸出的位元率，用於由位元組數估算音訊秒數
+TTS_MP3_BITRATE = 128_000
 
 
 class Broadcaster:
-    def __init__(self):
-        self.subscribers: set[asyncio.Queue[Any]] = set()
+    """
+    共享的只增片段日誌：任意數量的訂閱者都能從頭重播，再跟上即時串流
+    超過預算時淘汰最舊的片段，落後的訂閱者依其溢出策略處理：
+    - block: 生產者暫停，直到該訂閱者跟上
+    - spill: 已淘汰的部分改從持久化的來源讀取（spill_path 檔案或 replay），
+      兩者皆無時等同 drop
+    - drop: 其未讀的片段只在本串流超過自身預算時淘汰，被越過時中斷該訂閱者
+    全域預算先以 LRU 順序整個回收已結束、無人訂閱且已持久化的串流；
+    進行中的串流只淘汰可重播且所有訂閱者都已讀過的片段，尚無人讀取的文字不會被淘汰
+    """
 
-    def subscribe(self) -> asyncio.Queue[Any]:
-        queue = asyncio.Queue()
-        self.subscribers.add(queue)
-        return queue
+    # 所有 Broadcaster 目前在記憶體中持有的位元組數
+    total_bytes = 0
+    global_max_bytes = BROADCASTER_GLOBAL_MAX_BYTES
+    # 依最近活動排序的所有 Broadcaster，全域預算不足時從最久未活動的開始回收
+    recent: "OrderedDict[int, weakref.ref[Broadcaster]]" = OrderedDict()
 
-    async def publish(self, async_gen: AsyncGenerator[Any, None]):
-        async for chunk in async_gen:
-            # print(f"Publishing chunk: {len(chunk)}")
-            for queue in list(self.subscribers):
-                queue.put_nowait(chunk)
+    def __init__(
+        self, max_bytes: int = BROADCASTER_MAX_BYTES, spill_path: Optional[str] = None
+    ):
+        self.max_bytes = max_bytes
+        self.spill_path = spill_path
+        # 已淘汰的片段可重新取得的來源（依片段序號），由 persisted() 設定
+        self.replay: Optional[Callable[[], Awaitable[list[Any]]]] = None
+        self.durable = False
+        self.chunks: deque[Any] = deque()
+        self.start_offset = 0  # 已被淘汰的片段數量
+        self.start_byte = 0  # 已被淘汰的位元組數
+        self.nbytes = 0
+        self.closed = False
+        self.cursors: dict[int, int] = {}  # block 訂閱者目前讀到的位置
+        self.readers: dict[int, int] = {}  # drop 訂閱者目前讀到的位置
+        self._next_id = 0
+        self._producer_waiting = False
+        self._changed = asyncio.Event()
+        key = id(self)
+        Broadcaster.recent[key] = weakref.ref(
+            self, lambda _: Broadcaster.recent.pop(key, None)
+        )
+
+    @staticmethod
+    def _sizeof(chunk: Any) -> int:
+        if isinstance(chunk, StreamEvent):
+            return len(chunk.data) or 1
+        return len(chunk) if isinstance(chunk, (str, bytes)) else 1
+
+    @property
+    def end_offset(self) -> int:
+        return self.start_offset + len(self.chunks)
+
+    @property
+    def appended_bytes(self) -> int:
+        """至今發布過的總量（含已淘汰的部分）"""
+        return self.start_byte + self.nbytes
+
+    @property
+    def idle(self) -> bool:
+        """已結束、無人訂閱且內容已持久化，可以整個釋放"""
+        return self.closed and self.durable and not self.cursors and not self.readers
+
+    def _touch(self):
+        if id(self) in Broadcaster.recent:
+            Broadcaster.recent.move_to_end(id(self))
+
+    def _notify(self):
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    def _over_budget(self) -> bool:
+        return (
+            self.nbytes > self.max_bytes
+            or Broadcaster.total_bytes > Broadcaster.global_max_bytes
+        )
+
+    def persisted(self, replay: Optional[Callable[[], Awaitable[list[Any]]]] = None):
+        """
+        內容已完整持久化（spill_path 已寫完，或可由 replay 重新取得），
+        之後淘汰的片段仍能以 spill 策略重播
+        """
+        if replay is not None:
+            self.replay = replay
+        self.durable = True
+
+    @classmethod
+    def _reclaim(cls, keep: "Broadcaster"):
+        """全域預算不足時，依 LRU 順序釋放閒置的串流"""
+        for ref in list(cls.recent.values()):
+            if cls.total_bytes <= cls.global_max_bytes:
+                return
+            broadcaster = ref()
+            if broadcaster is not None and broadcaster is not keep and broadcaster.idle:
+                broadcaster.release()
+
+    def _trim(self):
+        """
+        淘汰最舊的片段直到回到預算內，不越過任何 block 訂閱者
+        - 超過自身預算：drop 訂閱者未讀的片段也會淘汰，但一律保留最新的片段
+        - 只超過全域預算：先回收其他閒置的串流，本串流只淘汰可重播且 drop 訂閱者都已讀過的片段
+        """
+        if self.nbytes <= self.max_bytes:
+            Broadcaster._reclaim(self)
+        replayable = self.durable or self.spill_path is not None
+        limit = min(self.cursors.values(), default=self.end_offset)
+        unread = min(self.readers.values(), default=self.end_offset)
+        while self.start_offset < limit and self._over_budget():
+            if self.nbytes <= self.max_bytes:
+                if not replayable or self.start_offset >= unread:
+                    break
+            elif (
+                self.start_offset >= unread and self.start_offset >= self.end_offset - 1
+            ):
+                break
+            size = self._sizeof(self.chunks.popleft())
+            self.nbytes -= size
+            Broadcaster.total_bytes -= size
+            self.start_byte += size
+            self.start_offset += 1
+
+    def append(self, chunk: Any):
+        size = self._sizeof(chunk)
+        self.chunks.append(chunk)
+        self.nbytes += size
+        Broadcaster.total_bytes += size
+        self._touch()
+        if self._over_budget():
+            self._trim()
+        self._notify()
+
+    def close(self):
+        self.closed = True
+        self._notify()
+
+    def release(self):
+        """釋放所有仍在記憶體中的片段；已持久化的內容之後仍可以 spill 策略重播"""
+        Broadcaster.total_bytes -= self.nbytes
+        self.start_byte += self.nbytes
+        self.start_offset = self.end_offset
+        self.chunks = deque()
+        self.nbytes = 0
+        self._notify()
 
-        for queue in self.subscribers:
-            queue.put_nowait(None)
+    def reserve(self, offset: int = 0) -> int:
+        """
+        預先登記一個 block 訂閱者，確保 offset 之後的片段在它開始讀取前不被淘汰
+        之後以 subscribe(sid=...) 讀取，或在確定不讀取時以 unsubscribe 取消
+        """
+        sid = self._next_id
+        self._next_id += 1
+        self.cursors[sid] = offset
+        return sid
+
+    def unsubscribe(self, sid: int):
+        """
+        取消訂閱；尚未開始迭代的產生器被關閉時不會執行其 finally，
+        預先登記的位置必須以此明確移除，否則會一直阻擋淘汰與生產者
+        """
+        self.readers.pop(sid, None)
+        if self.cursors.pop(sid, None) is not None and self._producer_waiting:
+            self._notify()
+
+    def subscribe(
+        self,
+        offset: int = 0,
+        policy: OverflowPolicy = "spill",
+        sid: Optional[int] = None,
+    ) -> AsyncGenerator[Any, None]:
+        """從 offset 開始重播已有片段，接著跟隨即時串流直到結束；sid 為 reserve 的回傳值"""
+        self._touch()
+        if sid is not None:
+            offset, policy = self.cursors[sid], "block"
+        else:
+            if policy == "spill" and not self.spill_path and self.replay is None:
+                policy = "drop"
+            sid = self._next_id
+            self._next_id += 1
+            # 在此立即登記，確保第一個片段不會在它開始讀取前被淘汰
+            if policy == "block":
+                self.cursors[sid] = offset
+            elif policy == "drop":
+                self.readers[sid] = offset
+        if offset >= self.start_offset:
+            retained = islice(self.chunks, offset - self.start_offset)
+            position = self.start_byte + sum(map(self._sizeof, retained))
+        else:
+            position = 0
+        return self._follow(sid, offset, position, policy)
+
+    async def _follow(
+        self, sid: int, offset: int, position: int, policy: OverflowPolicy
+    ) -> AsyncGenerator[Any, None]:
+        try:
+            while True:
+                if offset < self.start_offset:
+                    if policy != "spill":
+                        logger.warning(
+                            "Subscriber fell behind the broadcaster, dropped"
+                        )
+                        return
+                    if self.replay is not None:
+                        replayed = await self.replay()
+                        for chunk in replayed[offset : self.start_offset]:
+                            offset += 1
+                            position += self._sizeof(chunk)
+                            if chunk:
+                                yield chunk
+                        if offset < self.start_offset:
+                            logger.error("Broadcaster replay is incomplete")
+                            return
+                    else:
+                        async for data in self._read_spilled(position):
+                            position += len(data)
+                            yield data
+                        if position < self.start_byte:
+                            logger.error(f"Spill file {self.spill_path} is incomplete")
+                            return
+                        offset = self.start_offset
+
+                while self.start_offset <= offset < self.end_offset:
+                    chunk = self.chunks[offset - self.start_offset]
+                    offset += 1
+                    position += self._sizeof(chunk)
+                    if chunk:
+                        yield chunk
+                    if sid in self.cursors:
+                        self.cursors[sid] = offset
+                        if self._producer_waiting:
+                            self._notify()
+                    elif sid in self.readers:
+                        self.readers[sid] = offset
+
+                if offset < self.start_offset:
+                    continue
+                if self.closed:
+                    return
+                await self._changed.wait()
+        finally:
+            self.readers.pop(sid, None)
+            if self.cursors.pop(sid, None) is not None and self._producer_waiting:
+                self._notify()
+
+    async def _read_spilled(self, position: int) -> AsyncGenerator[bytes, None]:
+        """讀取已從記憶體淘汰、但已寫入磁碟的部分"""
+        assert self.spill_path
+        async with aiofiles.open(self.spill_path, "rb") as f:
+            await f.seek(position)
+            while position < self.start_byte:
+                data = await f.read(min(SPILL_READ_SIZE, self.start_byte - position))
+                if not data:
+                    return
+                position += len(data)
+                yield data
+
+    def _block_lagging(self) -> bool:
+        return min(self.cursors.values(), default=self.end_offset) < self.end_offset
+
+    async def publish(self, async_gen: AsyncGenerator[Any, None]):
+        try:
+            async for chunk in async_gen:
+                self.append(chunk)
+                # 背壓：block 訂閱者跟不上而無法淘汰時，暫停生產者
+                while self.nbytes > self.max_bytes and self._block_lagging():
+                    self._producer_waiting = True
+                    await self._changed.wait()
+                    self._producer_waiting = False
+                    self._trim()
+        finally:
+            self.close()
 
 
 class ApiService:
     all_services: OrderedDict[str, "ApiService"] = OrderedDict()
     auto_cleanup_task_started = False
 
+    # 因無人收聽而取消上游工作所省下的用量（估計值）
+    savings = {"cancelled_cases": 0, "llm_tokens": 0, "tts_seconds": 0.0}
+    # 已完成案例的平均輸出量（指數移動平均），用於估計取消時省下多少
+    typical_text_len = 150.0
+    typical_audio_bytes = 30 * TTS_MP3_BITRATE / 8
+
     def __init__(
         self,
         prompt: str,
@@ -47,6 +340,9 @@ class ApiService:
         tts_model: Optional[str] = None,
         tts: bool = True,
         tts_speed: Optional[float] = None,
+        persist: bool = CASE_PERSIST,
+        use_cache: bool = True,
+        lang: str = "zh-TW",
     ):
         self.prompt = prompt
         self.tts_model = tts_model or None
@@ -54,17 +350,39 @@ class ApiService:
         self.tts_speed = tts_speed
         self.case_id = case_id or uuid4().hex
         self.tts = tts
+        self.persist = persist
+        self.use_cache = use_cache
+        self.lang = lang
+
+        # 上游任務與收聽者的參照計數，無人收聽超過寬限期時取消上游工作
+        self.tasks: list[asyncio.Task[Any]] = []
+        self.listeners = 0
+        self._idle_handle: Optional[asyncio.TimerHandle] = None
+
+        # 快取命中時銳評的完整文字（不含評級標籤）可預先得知，TTS 才能查詢音訊快取
+        loop = asyncio.get_event_loop()
+        self.cached_text: asyncio.Future[Optional[str]] = loop.create_future()
+        self.cached_audio: asyncio.Future[Optional[Path]] = loop.create_future()
+        self.full_text: Optional[str] = None
+        self.tts_complete = False
+        # 送給 TTS 的片段與送出當下已收到的音訊位元組數，用於建立對齊索引
+        self.tts_chunks: list[tuple[str, int]] = []
+        self.audio_saved = False
+        self.image: Optional[asyncio.Task[list[str]]] = None
+        # 事件與其距案例開始的秒數，完成後寫入封存
+        self.timeline: list[tuple[float, StreamEvent]] = []
+        self.archived_at: Optional[float] = None
 
         # text broadcaster
         self.llm_broadcaster = Broadcaster()
-        self.queue_for_tts = self.llm_broadcaster.subscribe()
-        self.queue_for_text = self.llm_broadcaster.subscribe()
 
-        # tts broadcaster
+        # tts broadcaster，已寫入磁碟的音訊可從記憶體淘汰，落後的聽眾改從檔案讀取
+        self.audio_path = f"{AUDIO_DIR}/{self.case_id}.mp3"
         if self.tts:
-            self.tts_broadcaster = Broadcaster()
-            self.tts_queue_audio = self.tts_broadcaster.subscribe()
-            self.tts_queue_save = self.tts_broadcaster.subscribe()
+            self.tts_broadcaster = Broadcaster(spill_path=self.audio_path)
+
+        # 各階段的時間線，/tier 已在建立前記錄 Turnstile 與准入等待
+        self.trace = tracer.trace(self.case_id)
 
         # for get api service by case_id and auto cleanup
         self.created_at = asyncio.get_event_loop().time()
@@ -74,83 +392,438 @@ class ApiService:
             asyncio.create_task(self.__class__.cleanup_api_service())
 
     @classmethod
-    def get_api_service(cls, case_id: str) -> "ApiService":
+    async def get_api_service(
+        cls, case_id: str
+    ) -> "ApiService | RemoteCase | ArchivedCase":
         if case_id in cls.all_services:
             return cls.all_services[case_id]
 
+        # 由其他 worker 擁有的案例
+        remote = await case_backend.lookup(case_id)
+        if remote:
+            return remote
+
+        # 已完成並從記憶體移除的案例
+        archived = await case_archive.lookup(case_id)
+        if archived:
+            return archived
+
         logger.error(f"ApiService with case_id {case_id} not found")
         raise HTTPException(status_code=404, detail="Case not found")
 
+    @classmethod
+    def running_cases(cls) -> int:
+        """上游工作（LLM、TTS、存檔）尚未全部結束的案例數"""
+        return sum(
+            not all(task.done() for task in service.tasks)
+            for service in cls.all_services.values()
+        )
+
     @classmethod
     async def cleanup_api_service(cls):
         while True:
-            await asyncio.sleep(API_SERVICE_TIME_OUT)
-            time_before = asyncio.get_event_loop().time() - API_SERVICE_TIME_OUT
-            for case_id, service in list(cls.all_services.items()):
-                if service.created_at < time_before:
-                    cls.all_services.pop(case_id)
-                else:
-                    break
+            await asyncio.sleep(min(API_SERVICE_TIME_OUT, CASE_ARCHIVED_TTL))
+            with metrics.cleanup_seconds.time():
+                removed = cls._sweep(asyncio.get_event_loop().time())
+            await case_backend.unregister(*removed)
+            logger.info(
+                f"Live cases: {len(cls.all_services)}, broadcaster bytes held: {Broadcaster.total_bytes}"
+            )
 
-    T = TypeVar("T")
+    @classmethod
+    def _sweep(cls, now: float) -> list[str]:
+        """移除逾時的案例，回傳被移除的 case_id"""
+        removed = []
+        for case_id, service in list(cls.all_services.items()):
+            # 已封存且無人收聽的案例提早移除，其餘最多保留 API_SERVICE_TIME_OUT 秒
+            archived = (
+                service.archived_at is not None
+                and service.archived_at < now - CASE_ARCHIVED_TTL
+                and not service.listeners
+            )
+            if archived or service.created_at < now - API_SERVICE_TIME_OUT:
+                cls.all_services.pop(case_id)
+                removed.append(case_id)
+                service._cancel_idle_timer()
+                service.llm_broadcaster.release()
+                if service.tts:
+                    service.tts_broadcaster.release()
+        return removed
 
-    @staticmethod
-    async def queue_to_async_gen(queue: asyncio.Queue[T]) -> AsyncGenerator[T, None]:
-        while True:
-            chunk = await queue.get()
-            if chunk is None:
-                break
-            if not chunk:
-                continue
+    async def _llm_stream(self) -> AsyncGenerator[str, None]:
+        """優先重播快取的銳評，否則呼叫 LLM 並在完成後寫入快取"""
+        key = roast_cache.key(self.prompt, self.llm_model)
+        try:
+            cached = await roast_cache.get(key) if self.use_cache else None
+            if cached:
+                self.full_text = clean_text("".join(text for _, text in cached))
+        finally:
+            if not self.cached_text.done():
+                self.cached_text.set_result(self.full_text)
+        if cached:
+            logger.info(f"Roast cache hit for case {self.case_id}")
+            async for chunk in roast_cache.replay(cached):
+                yield chunk
+            return
+
+        loop = asyncio.get_running_loop()
+        last = loop.time()
+        recorded: list[tuple[float, str]] = []
+        async for chunk in ai.stream_messages(self.prompt, self.llm_model):
+            now = loop.time()
+            recorded.append((round(now - last, 3), chunk))
+            last = now
             yield chunk
+        self.full_text = clean_text("".join(text for _, text in recorded))
+        await roast_cache.put(key, recorded)
 
-    async def _gen_for_tts(self) -> AsyncGenerator[str, None]:
-        temp = ""
-        while True:
-            chunk: str = await self.queue_for_tts.get()
+    def _audio_key(self, text: str) -> str:
+        return audio_cache.key(
+            text,
+            self.tts_model or DEFAULT_TTS_MODEL,
+            self.tts_speed or 1.0,
+        )
 
-            if chunk is None:
-                if temp:
-                    # logger.info(f"供 TTS 使用的片段: {temp}")
-                    yield temp
-                break
+    async def _tts_stream(self) -> AsyncGenerator[bytes, None]:
+        """音訊快取命中時直接從磁碟讀取，否則經由 Fish Audio websocket 合成"""
+        path = None
+        try:
+            text = await self.cached_text
+            if text is not None:
+                path = audio_cache.get(self._audio_key(text))
+        finally:
+            if not self.cached_audio.done():
+                self.cached_audio.set_result(path)
+        if path:
+            logger.info(f"Audio cache hit for case {self.case_id}")
+            self.llm_broadcaster.unsubscribe(self._tts_text_sid)
+            async for chunk in audio_cache.read(path):
+                yield chunk
+            return
 
-            chunk = sub(NO_VOICE, "", chunk)
-            if not chunk.strip():
-                continue
-
-            temp += chunk
-            if len(temp) < 5:
-                continue
-            # logger.info(f"供 TTS 使用的片段: {temp}")
-            yield temp
-            temp = ""
-
-    def start(self):
-        asyncio.create_task(
-            self.llm_broadcaster.publish(
-                ai.stream_messages(self.prompt, self.llm_model)
-            )
+        text_for_tts = self.llm_broadcaster.subscribe(sid=self._tts_text_sid)
+        async for chunk in Tts.websocket_tts(
+            self._gen_for_tts(text_for_tts),
+            model=self.tts_model,
+            speed=self.tts_speed,
+        ):
+            yield chunk
+        self.tts_complete = True
+
+    async def _gen_for_tts(
+        self, events: AsyncGenerator[StreamEvent, None]
+    ) -> AsyncGenerator[str, None]:
+        async def voiced() -> AsyncGenerator[str, None]:
+            async for event in events:
+                if event.type == "text_delta":
+                    yield event.data
+
+        chunker = create_chunker(TTS_CHUNKER, self.lang)
+        async for chunk in chunk_text(voiced(), chunker):
+            # logger.info(f"供 TTS 使用的片段: {chunk}")
+            self.tts_chunks.append((chunk, self.tts_broadcaster.appended_bytes))
+            yield chunk
+
+    async def start(self):
+        # 先登記擁有者，回應 /tier 前其他 worker 就能找到這個案例
+        await case_backend.register(self.case_id, tts=self.tts)
+        # 內部消費者必須完整讀取串流，先登記 block 訂閱者再啟動生產者；
+        # 快取命中時不會讀取，由 _tts_stream、save_tts 取消登記
+        if self.tts:
+            self._tts_text_sid = self.llm_broadcaster.reserve()
+            self._save_sid = self.tts_broadcaster.reserve()
+
+        llm_stream = self.trace.wrap("llm", self._llm_stream())
+        llm_task = asyncio.create_task(
+            self.llm_broadcaster.publish(self._record(parse_events(llm_stream)))
         )
+        llm_task.add_done_callback(self._on_llm_done)
+        self.tasks.append(llm_task)
         if self.tts:
-            asyncio.create_task(
-                self.tts_broadcaster.publish(
-                    Tts.websocket_tts(
-                        self._gen_for_tts(), model=self.tts_model, speed=self.tts_speed
-                    )
-                )
+            tts_stream = self.trace.wrap("tts", self._tts_stream())
+            tts_task = asyncio.create_task(self.tts_broadcaster.publish(tts_stream))
+            tts_task.add_done_callback(self._on_tts_done)
+            self.tasks.append(tts_task)
+            save_task = asyncio.create_task(self.save_tts())
+            save_task.add_done_callback(
+                lambda _: self.tts_broadcaster.unsubscribe(self._save_sid)
             )
-            asyncio.create_task(self.save_tts())
+            self.tasks.append(save_task)
+        asyncio.create_task(self._archive_when_done())
+
+        # 第一個收聽者也必須在寬限期內連上
+        self._schedule_idle_cancel()
+
+    def finished(self) -> "asyncio.Future[list[Any]]":
+        """LLM、TTS、存檔與圖片搜尋全部結束（不論成功與否）時完成"""
+        image = [self.image] if self.image else []
+        return asyncio.gather(*self.tasks, *image, return_exceptions=True)
+
+    async def _record(
+        self, events: AsyncGenerator[StreamEvent, None]
+    ) -> AsyncGenerator[StreamEvent, None]:
+        loop = asyncio.get_running_loop()
+        async for event in events:
+            self.timeline.append((loop.time() - self.created_at, event))
+            yield event
+
+    async def _archive_when_done(self):
+        try:
+            await self._archive()
+        finally:
+            await tracer.finish(self.case_id)
+
+    async def _archive(self):
+        """LLM 完整結束後封存案例；音訊只有在合成與寫檔都成功時才一併封存"""
+        results = await asyncio.gather(*self.tasks, return_exceptions=True)
+        if isinstance(results[0], BaseException):
+            return
+        audio_ok = self.tts and not any(
+            isinstance(result, BaseException) for result in results[1:]
+        )
+        timeline = encode_timeline(self.timeline)
+        if audio_ok:
+            self.audio_saved = True
+            # 音訊檔已完整寫入，全域預算不足時可整個釋放，之後的聽眾改讀檔案
+            self.tts_broadcaster.persisted()
+            await self._save_alignment(timeline)
+        record = {
+            "case_id": self.case_id,
+            "lang": self.lang,
+            "tts": self.tts,
+            "audio_path": self.audio_path if audio_ok else None,
+            "image_url": await self.image_url() if self.image else "",
+            **timeline,
+        }
+        try:
+            with self.trace.span("archive"):
+                await case_archive.save(self.case_id, record)
+        except OSError as e:
+            logger.error(f"Failed to archive case {self.case_id}: {e}")
+            return
+        self.archived_at = asyncio.get_running_loop().time()
+        # 文字事件改由封存檔重播，記憶體中只剩 Broadcaster 一份
+        self.llm_broadcaster.persisted(self._archived_events)
+        self.timeline = []
+
+    async def _archived_events(self) -> list[StreamEvent]:
+        archived = await case_archive.lookup(self.case_id)
+        return decode_events(archived.record) if archived else []
+
+    async def _save_alignment(self, timeline: dict[str, Any]):
+        """寫入 storage/audio/{case_id}.align.json：每個 TTS 片段的文字範圍與音訊位元組、秒數"""
+        chunks = self.tts_chunks or [
+            (text, 0) for text in split_text(timeline["text"], TTS_CHUNKER, self.lang)
+        ]
+
+        def build():
+            audio = Path(self.audio_path).read_bytes()
+            index = build_alignment(
+                chunks,
+                audio,
+                TTS_MP3_BITRATE,
+                tier=timeline["tier"],
+                tier_at=tier_char(timeline),
+            )
+            write_alignment(self.case_id, {"case_id": self.case_id, **index})
+
+        try:
+            await asyncio.to_thread(build)
+        except OSError as e:
+            logger.error(f"Failed to write alignment for case {self.case_id}: {e}")
+
+    def _on_llm_done(self, task: asyncio.Task[Any]):
+        if not task.cancelled():
+            cls = self.__class__
+            text_len = self.llm_broadcaster.appended_bytes
+            cls.typical_text_len = 0.9 * cls.typical_text_len + 0.1 * text_len
+
+    def _on_tts_done(self, task: asyncio.Task[Any]):
+        # 任務在開始讀取前就被取消或失敗時，預先登記的位置仍在
+        self.llm_broadcaster.unsubscribe(self._tts_text_sid)
+        if not task.cancelled():
+            cls = self.__class__
+            audio_bytes = self.tts_broadcaster.appended_bytes
+            cls.typical_audio_bytes = 0.9 * cls.typical_audio_bytes + 0.1 * audio_bytes
+
+    def _cancel_idle_timer(self):
+        if self._idle_handle:
+            self._idle_handle.cancel()
+            self._idle_handle = None
+
+    def _schedule_idle_cancel(self):
+        if self.persist or self.listeners:
+            return
+        self._cancel_idle_timer()
+        self._idle_handle = asyncio.get_running_loop().call_later(
+            CASE_IDLE_GRACE, self._cancel_upstream
+        )
 
-    def tts_gen(self) -> AsyncGenerator[bytes, None]:
+    def _cancel_upstream(self):
+        """無人收聽且不需持久化時，取消 LLM 與 TTS 串流並釋放 websocket"""
+        self._idle_handle = None
+        if self.listeners or all(task.done() for task in self.tasks):
+            return
+
+        cls = self.__class__
+        llm_running = not self.tasks[0].done()
+        if llm_running:
+            text_left = cls.typical_text_len - self.llm_broadcaster.appended_bytes
+            cls.savings["llm_tokens"] += int(max(text_left, 0) / ai.CHARS_PER_TOKEN)
+        if self.tts and not self.tasks[1].done():
+            audio_left = cls.typical_audio_bytes - self.tts_broadcaster.appended_bytes
+            cls.savings["tts_seconds"] += max(audio_left, 0) * 8 / TTS_MP3_BITRATE
+        cls.savings["cancelled_cases"] += 1
+
+        for task in self.tasks:
+            task.cancel()
+        logger.info(
+            f"Cancelled unwatched case {self.case_id} (llm running: {llm_running}), total savings: {cls.savings}"
+        )
+
+    @contextmanager
+    def listening(self) -> Iterator[None]:
+        """計算收聽者數量，最後一位離開時開始寬限期倒數"""
+        self.listeners += 1
+        self._cancel_idle_timer()
+        try:
+            yield
+        finally:
+            self.listeners -= 1
+            if not self.listeners:
+                self._schedule_idle_cancel()
+
+    async def _watch(self, gen: AsyncGenerator[Any, None]) -> AsyncGenerator[Any, None]:
+        with self.listening():
+            async for chunk in gen:
+                yield chunk
+
+    def search_image(self, subject: str, lang: str):
+        """在背景搜尋圖片，與 LLM 生成同時進行"""
+        self.image = asyncio.create_task(self._search_image(subject, lang))
+
+    async def _search_image(self, subject: str, lang: str) -> list[str]:
+        with self.trace.span("image"):
+            return await search_images(subject, lang=lang)
+
+    async def image_url(self) -> str:
+        if self.image is None:
+            raise HTTPException(status_code=404, detail="No image for this case")
+        try:
+            images = await asyncio.shield(self.image)
+        except Exception as e:
+            logger.error(f"Image search failed for case {self.case_id}: {e}")
+            return ""
+        return images[0] if images else ""
+
+    async def image_gen(self) -> AsyncGenerator[str, None]:
+        yield await self.image_url()
+
+    def audio_file(self) -> Optional[Path]:
+        """合成並寫檔完成後的音訊檔，可直接以檔案回應（支援 Range）；已被淘汰時為 None"""
+        path = Path(self.audio_path)
+        return path if self.audio_saved and path.exists() else None
+
+    def tts_gen(self, offset: int = 0) -> AsyncGenerator[bytes, None]:
         if not self.tts:
             raise HTTPException(status_code=400, detail="TTS is disabled for this case")
-        return self.queue_to_async_gen(self.tts_queue_audio)
+        stream = self.tts_broadcaster.subscribe(offset)
+        return self._watch(self.trace.wrap("client_tts", stream, offset=offset))
+
+    async def llm_gen(self, offset: int = 0) -> AsyncGenerator[str, None]:
+        """舊版純文字串流，評級以 [標籤] 內嵌在文字中"""
+        stream = self.llm_broadcaster.subscribe(offset)
+        async for event in self._watch(
+            self.trace.wrap("client_text", stream, offset=offset)
+        ):
+            if text := event.to_text():
+                yield text
+
+    def events(
+        self, offset: int = 0, span: str = "client_events"
+    ) -> AsyncGenerator[StreamEvent, None]:
+        """解析後的事件串流，不計入收聽者；LLM 失敗時會在 done 之前結束"""
+        stream = self.llm_broadcaster.subscribe(offset)
+        return self.trace.wrap(span, stream, offset=offset)
 
-    def llm_gen(self) -> AsyncGenerator[str, None]:
-        return self.queue_to_async_gen(self.queue_for_text)
+    async def event_gen(self, offset: int = 0) -> AsyncGenerator[str, None]:
+        """SSE 事件串流：text_delta、tier_decision、done"""
+        async for event in self._watch(self.events(offset)):
+            yield event.to_sse()
 
     async def save_tts(self):
-        async with aiofiles.open(f"storage/audio/{self.case_id}.mp3", "wb") as f:
-            async for chunk in self.queue_to_async_gen(self.tts_queue_save):
-                await f.write(chunk)
+        cached_path = await self.cached_audio
+        if cached_path:
+            # 複製完成前保留登記，溢出到磁碟的聽眾才有檔案可讀
+            try:
+                with self.trace.span("save_tts", cached=True):
+                    await audio_cache.copy_to(cached_path, self.audio_path)
+            finally:
+                self.tts_broadcaster.unsubscribe(self._save_sid)
+            return
+
+        audio_gen = self.tts_broadcaster.subscribe(sid=self._save_sid)
+
+        with self.trace.span("save_tts") as span:
+            async with aiofiles.open(self.audio_path, "wb") as f:
+                async for chunk in audio_gen:
+                    await f.write(chunk)
+                    # 讓溢出到磁碟的聽眾能立即讀到
+                    await f.flush()
+                    span.first()
+        await case_audio.added(self.tts_broadcaster.appended_bytes)
+
+        # 合成中途失敗時不寫入快取
+        if self.full_text is not None and self.tts_complete:
+            await audio_cache.put(self._audio_key(self.full_text), self.audio_path)
+
+
+def _local_stream(
+    case_id: str, stream: str, offset: int
+) -> Optional[AsyncGenerator[Any, None]]:
+    """供其他 worker 讀取本程序擁有的案例串流"""
+    service = ApiService.all_services.get(case_id)
+    if service is None:
+        return None
+    if stream == "text":
+        return service.llm_gen(offset)
+    if stream == "events":
+        return service.event_gen(offset)
+    if stream == "tts" and service.tts:
+        return service.tts_gen(offset)
+    if stream == "image" and service.image:
+        return service.image_gen()
+    return None
+
+
+case_backend = create_case_backend(
+    CASE_BACKEND,
+    CASE_SOCKET_DIR,
+    _local_stream,
+    lambda case_id: case_id in ApiService.all_services,
+)
+
+
+def _broadcaster_depths(maximum: bool) -> dict[tuple[str, ...], float]:
+    depths: dict[tuple[str, ...], float] = {("text",): 0, ("tts",): 0}
+    for service in ApiService.all_services.values():
+        streams = [("text", service.llm_broadcaster)]
+        if service.tts:
+            streams.append(("tts", service.tts_broadcaster))
+        for name, broadcaster in streams:
+            held = len(broadcaster.chunks)
+            if maximum:
+                depths[(name,)] = max(depths[(name,)], held)
+            else:
+                depths[(name,)] += held
+    return depths
+
+
+metrics.live_cases.set_function(lambda: len(ApiService.all_services))
+metrics.running_cases.set_function(ApiService.running_cases)
+metrics.case_listeners.set_function(
+    lambda: sum(service.listeners for service in ApiService.all_services.values())
+)
+metrics.broadcaster_bytes.set_function(lambda: Broadcaster.total_bytes)
+metrics.broadcaster_chunks.set_function(lambda: _broadcaster_depths(maximum=False))
+metrics.broadcaster_max_chunks.set_function(lambda: _broadcaster_depths(maximum=True))
@@ -0,0 +1,127 @@
+import asyncio
+import gzip
+import hashlib
+import json
+import re
+import uuid
+from pathlib import Path
+from typing import Any, NamedTuple, Optional
+
+import aiofiles
+import aiofiles.os
+from api.cache import LRUCache
+from settings import (
+    SHARE_CACHE_MAX_ENTRIES,
+    SHARE_CACHE_TTL,
+    SHARE_COMPRESS_LEVEL,
+    SHARE_DIR,
+)
+
+SHARE_ID_PATTERN = re.compile(r"[0-9a-f]{32}")
+
+
+class SharedBlob(NamedTuple):
+    # gzip 壓縮的 {"cases": [...]}，可直接以 Content-Encoding: gzip 回傳
+    compressed: bytes
+    etag: str  # 強 ETag：未壓縮內容的 SHA-256
+
+
+class ShareStore:
+    """
+    分享案例的儲存
+    - blobs/{hash[:2]}/{hash[2:4]}/{hash}.json.gz：以內容雜湊定址、gzip 壓縮的 {"cases": [...]}，
+      相同內容只存一份
+    - refs/{share_id[:2]}/{share_id}：分享 ID 指向的內容雜湊
+    - {share_id}.json：舊版未壓縮的平面檔案，仍可讀取
+    壓縮在執行緒中進行，檔案以 aiofiles 寫入暫存檔後 rename，不阻塞事件迴圈；
+    分享內容不會再變動，熱門分享的壓縮內容保留在記憶體 LRU 中
+    """
+
+    def __init__(
+        self, directory: str, compress_level: int, cache_entries: int, cache_ttl: float
+    ):
+        self.directory = Path(directory)
+        self.compress_level = compress_level
+        self.hot: LRUCache[SharedBlob] = LRUCache(cache_entries, cache_ttl)
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def blob_path(self, digest: str) -> Path:
+        return self.directory / "blobs" / digest[:2] / digest[2:4] / f"{digest}.json.gz"
+
+    def ref_path(self, share_id: str) -> Path:
+        return self.directory / "refs" / share_id[:2] / share_id
+
+    def legacy_path(self, share_id: str) -> Path:
+        return self.directory / f"{share_id}.json"
+
+    async def _write_atomic(self, path: Path, data: bytes):
+        await aiofiles.os.makedirs(path.parent, exist_ok=True)
+        tmp = path.with_name(f".{path.name}.{uuid.uuid4().hex}.tmp")
+        async with aiofiles.open(tmp, "wb") as f:
+            await f.write(data)
+        await aiofiles.os.replace(tmp, path)
+
+    async def save(self, cases: list[dict[str, Any]]) -> tuple[str, bool]:
+        """保存案例，回傳 (share_id, 是否與既有內容重複)"""
+        body = json.dumps(
+            {"cases": cases}, ensure_ascii=False, separators=(",", ":")
+        ).encode("utf-8")
+        digest = hashlib.sha256(body).hexdigest()
+        blob = self.blob_path(digest)
+        duplicate = await aiofiles.os.path.exists(blob)
+        if not duplicate:
+            # mtime=0 讓相同內容壓縮出相同位元組
+            compressed = await asyncio.to_thread(
+                gzip.compress, body, self.compress_level, mtime=0
+            )
+            await self._write_atomic(blob, compressed)
+
+        share_id = uuid.uuid4().hex
+        await self._write_atomic(self.ref_path(share_id), digest.encode("ascii"))
+        return share_id, duplicate
+
+    async def _read(self, share_id: str) -> Optional[SharedBlob]:
+        try:
+            async with aiofiles.open(self.ref_path(share_id), "rb") as f:
+                digest = (await f.read()).decode("ascii").strip()
+            async with aiofiles.open(self.blob_path(digest), "rb") as f:
+                return SharedBlob(await f.read(), f'"{digest}"')
+        except FileNotFoundError:
+            pass
+
+        # 舊版平面檔案：格式化過的案例陣列
+        try:
+            async with aiofiles.open(self.legacy_path(share_id), "rb") as f:
+                legacy = await f.read()
+        except FileNotFoundError:
+            return None
+        cases = json.loads(legacy)
+        body = json.dumps(
+            {"cases": cases}, ensure_ascii=False, separators=(",", ":")
+        ).encode("utf-8")
+        compressed = await asyncio.to_thread(
+            gzip.compress, body, self.compress_level, mtime=0
+        )
+        return SharedBlob(compressed, f'"{hashlib.sha256(body).hexdigest()}"')
+
+    async def get(self, share_id: str) -> Optional[SharedBlob]:
+        """讀取分享的壓縮內容，找不到時回傳 None"""
+        if not SHARE_ID_PATTERN.fullmatch(share_id):
+            return None
+        shared = self.hot.get(share_id)
+        if shared is None:
+            shared = await self._read(share_id)
+            if shared is not None:
+                self.hot.put(share_id, shared)
+        return shared
+
+    async def load(self, share_id: str) -> Optional[dict[str, Any]]:
+        shared = await self.get(share_id)
+        if shared is None:
+            return None
+        return json.loads(await asyncio.to_thread(gzip.decompress, shared.compressed))
+
+
+share_store = ShareStore(
+    SHARE_DIR, SHARE_COMPRESS_LEVEL, SHARE_CACHE_MAX_ENTRIES, SHARE_CACHE_TTL
+)
@@ -0,0 +1,137 @@
+import json
+from typing import Any, AsyncGenerator, Literal, NamedTuple, Optional
+
+# LLM 以 [夯]、[S] 等標籤標示評級，標籤本身不顯示也不唸出
+TIERS = ("夯", "頂級", "人上人", "NPC", "拉完了", "S", "A", "B", "C", "D")
+
+EventType = Literal["text_delta", "tier_decision", "done"]
+
+
+def format_sse(event: str, payload: dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+
+class StreamEvent(NamedTuple):
+    type: EventType
+    data: str = ""
+
+    def payload(self) -> dict[str, Any]:
+        if self.type == "text_delta":
+            return {"text": self.data}
+        if self.type == "tier_decision":
+            return {"tier": self.data}
+        return {}
+
+    def to_sse(self) -> str:
+        return format_sse(self.type, self.payload())
+
+    def to_text(self) -> str:
+        """舊版純文字串流的格式：評級以 [標籤] 內嵌在文字中"""
+        if self.type == "text_delta":
+            return self.data
+        if self.type == "tier_decision":
+            return f"[{self.data}]"
+        return ""
+
+
+class TierTagParser:
+    """
+    增量的評級標籤解析器，每個字元只掃描常數次，整體為線性時間
+    - 標籤外的文字輸出為 text_delta
+    - 第一個合法的評級標籤輸出為 tier_decision，之後重複的評級標籤直接略過
+    - 若評級文字沒有在標籤前出現過（例如「這必須給到[夯]」），先補上評級文字，
+      讓使用者看得到也聽得到
+    - 過長或內容不是評級的方括號視為一般文字
+    """
+
+    def __init__(self, tiers: tuple[str, ...] = TIERS):
+        self.tiers = set(tiers)
+        self.max_tag_len = max(map(len, tiers))
+        self.tag: Optional[str] = None  # 目前在 [ 之後累積的內容
+        # 評級決定前已輸出的文字，只在遇到第一個評級標籤時搜尋一次
+        self.visible: list[str] = []
+        self.decided = False
+
+    def _emit_text(self, text: str, events: list[StreamEvent]):
+        if not text:
+            return
+        if not self.decided:
+            self.visible.append(text)
+        events.append(StreamEvent("text_delta", text))
+
+    def _close_tag(self, content: str, events: list[StreamEvent]):
+        tier = content.strip()
+        if tier not in self.tiers:
+            self._emit_text(f"[{content}]", events)
+            return
+        if self.decided:
+            return
+        if tier not in "".join(self.visible):
+            self._emit_text(tier, events)
+        events.append(StreamEvent("tier_decision", tier))
+        self.decided = True
+        self.visible = []
+
+    def feed(self, text: str) -> list[StreamEvent]:
+        events: list[StreamEvent] = []
+        # 快速路徑：大部分片段不含方括號
+        if self.tag is None and "[" not in text:
+            self._emit_text(text, events)
+            return events
+        i, n = 0, len(text)
+        while i < n:
+            if self.tag is None:
+                j = text.find("[", i)
+                if j == -1:
+                    self._emit_text(text[i:], events)
+                    break
+                self._emit_text(text[i:j], events)
+                self.tag = ""
+                i = j + 1
+                continue
+
+            # 在標籤內：最多只往後看到標籤長度上限，超過就不是標籤
+            limit = min(n, i + self.max_tag_len - len(self.tag) + 1)
+            end = text.find("]", i, limit)
+            restart = text.find("[", i, limit if end == -1 else end)
+            if restart != -1:
+                self._emit_text(f"[{self.tag}{text[i:restart]}", events)
+                self.tag = ""
+                i = restart + 1
+            elif end != -1:
+                self._close_tag(self.tag + text[i:end], events)
+                self.tag = None
+                i = end + 1
+            else:
+                self.tag += text[i:limit]
+                i = limit
+                if len(self.tag) > self.max_tag_len:
+                    self._emit_text(f"[{self.tag}", events)
+                    self.tag = None
+        return events
+
+    def close(self) -> list[StreamEvent]:
+        events: list[StreamEvent] = []
+        if self.tag is not None:
+            self._emit_text(f"[{self.tag}", events)
+            self.tag = None
+        events.append(StreamEvent("done"))
+        return events
+
+
+def clean_text(raw: str) -> str:
+    """移除評級標籤後、實際顯示與唸出的文字"""
+    parser = TierTagParser()
+    events = parser.feed(raw) + parser.close()
+    return "".join(e.data for e in events if e.type == "text_delta")
+
+
+async def parse_events(
+    text_gen: AsyncGenerator[str, Any],
+) -> AsyncGenerator[StreamEvent, None]:
+    parser = TierTagParser()
+    async for text in text_gen:
+        for event in parser.feed(text):
+            yield event
+    for event in parser.close():
+        yield event
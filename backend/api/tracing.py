@@ -0,0 +1,157 @@
+import json
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, AsyncGenerator, Iterator, Optional, TypeVar
+
+import aiofiles
+import aiofiles.os
+from settings import TRACE_EXPORT_PATH, TRACE_MAX_CASES
+from utils.log import logger
+
+T = TypeVar("T")
+
+
+def _ms(seconds: Optional[float]) -> Optional[float]:
+    return None if seconds is None else round(seconds * 1000, 1)
+
+
+class Span:
+    """一個階段的開始、第一個片段與結束時間（相對於案例開始的秒數）"""
+
+    __slots__ = ("name", "start", "first_at", "end_at", "error", "attrs", "_trace")
+
+    def __init__(self, trace: "Trace", name: str, attrs: dict[str, Any]):
+        self._trace = trace
+        self.name = name
+        self.start = trace.elapsed()
+        self.first_at: Optional[float] = None
+        self.end_at: Optional[float] = None
+        self.error: Optional[str] = None
+        self.attrs = attrs
+
+    def first(self):
+        if self.first_at is None:
+            self.first_at = self._trace.elapsed()
+
+    def end(self, error: Optional[BaseException] = None):
+        if self.end_at is not None:
+            return
+        self.end_at = self._trace.elapsed()
+        if error is not None:
+            self.error = type(error).__name__
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "name": self.name,
+            "start_ms": _ms(self.start),
+            "first_ms": _ms(self.first_at),
+            "end_ms": _ms(self.end_at),
+            "error": self.error,
+            **({"attrs": self.attrs} if self.attrs else {}),
+        }
+
+
+class Trace:
+    """單一案例跨越多個非同步任務的時間線"""
+
+    def __init__(self, case_id: str):
+        self.case_id = case_id
+        self.started_at = time.time()
+        self._t0 = time.monotonic()
+        self.spans: list[Span] = []
+        self.finished = False
+
+    def elapsed(self) -> float:
+        return time.monotonic() - self._t0
+
+    def begin(self, name: str, **attrs: Any) -> Span:
+        span = Span(self, name, attrs)
+        self.spans.append(span)
+        return span
+
+    @contextmanager
+    def span(self, name: str, **attrs: Any) -> Iterator[Span]:
+        span = self.begin(name, **attrs)
+        try:
+            yield span
+        except BaseException as e:
+            span.end(e)
+            raise
+        span.end()
+
+    async def wrap(
+        self, name: str, gen: AsyncGenerator[T, None], **attrs: Any
+    ) -> AsyncGenerator[T, None]:
+        """包裝串流：第一個片段的時間即為該階段的首字／首包延遲"""
+        span = self.begin(name, **attrs)
+        try:
+            async for item in gen:
+                span.first()
+                yield item
+        except BaseException as e:
+            span.end(e)
+            raise
+        finally:
+            span.end()
+            await gen.aclose()
+
+    def to_dict(self) -> dict[str, Any]:
+        ends = [span.end_at or span.start for span in self.spans]
+        return {
+            "case_id": self.case_id,
+            "started_at": round(self.started_at, 3),
+            "duration_ms": _ms(max(ends, default=0.0)),
+            "finished": self.finished,
+            "spans": [span.to_dict() for span in self.spans],
+        }
+
+
+class Tracer:
+    """
+    以 case_id 為鍵保留最近 max_cases 個案例的時間線（環狀緩衝）
+    設定 export_path 時，案例結束後把時間線附加到 JSONL 檔
+    """
+
+    def __init__(self, max_cases: int, export_path: str = ""):
+        self.max_cases = max_cases
+        self.export_path = Path(export_path) if export_path else None
+        self.traces: OrderedDict[str, Trace] = OrderedDict()
+
+    def trace(self, case_id: str) -> Trace:
+        """取得案例的時間線，不存在時建立"""
+        trace = self.traces.get(case_id)
+        if trace is None:
+            trace = self.traces[case_id] = Trace(case_id)
+            while len(self.traces) > self.max_cases:
+                self.traces.popitem(last=False)
+        return trace
+
+    def discard(self, case_id: str):
+        """請求在建立案例前就被拒絕時，不保留其時間線"""
+        self.traces.pop(case_id, None)
+
+    def get(self, case_id: str) -> Optional[Trace]:
+        return self.traces.get(case_id)
+
+    def recent(self, limit: int) -> list[Trace]:
+        return list(self.traces.values())[-limit:][::-1]
+
+    async def finish(self, case_id: str):
+        trace = self.traces.get(case_id)
+        if trace is None or trace.finished:
+            return
+        trace.finished = True
+        if self.export_path is None:
+            return
+        line = json.dumps(trace.to_dict(), ensure_ascii=False) + "\n"
+        try:
+            await aiofiles.os.makedirs(self.export_path.parent, exist_ok=True)
+            async with aiofiles.open(self.export_path, "a", encoding="utf-8") as f:
+                await f.write(line)
+        except OSError as e:
+            logger.error(f"Failed to export trace for case {case_id}: {e}")
+
+
+tracer = Tracer(TRACE_MAX_CASES, TRACE_EXPORT_PATH)
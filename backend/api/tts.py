@@ -1,13 +1,38 @@
+import asyncio
+import time
+from collections import deque
 from typing import Any, AsyncGenerator, Optional
-from venv import logger
 
 import httpx
+import ormsgpack
+from api import metrics
 from dotenv import load_dotenv
 from fastapi import HTTPException
-from fishaudio import AsyncFishAudio
+from fishaudio import WebSocketError
+from fishaudio.types import (
+    CloseEvent,
+    Prosody,
+    StartEvent,
+    TextEvent,
+    TTSConfig,
+    TTSRequest,
+)
+from httpx_ws import AsyncWebSocketSession, WebSocketDisconnect, aconnect_ws
 from opencc import opencc
 from rich.traceback import install
-from settings import DEFAULT_TTS_MODEL, FISH_API_KEY
+from settings import (
+    DEFAULT_TTS_MODEL,
+    FISH_API_KEY,
+    TTS_ERROR_WINDOW,
+    TTS_WS_HEALTH_INTERVAL,
+    TTS_WS_IDLE_TIMEOUT,
+    TTS_WS_POOL_SIZE,
+)
+from utils.log import logger
+
+FISH_BASE_URL = "https://api.fish.audio"
+# websocket 的 TTS 模型在握手時以 header 指定，預先建立的連線必須固定使用同一個模型
+FISH_TTS_MODEL = "s2-pro"
 
 converter_s2t = opencc.OpenCC("s2t")
 
@@ -36,26 +61,256 @@ install()
 load_dotenv()
 
 
-def websocket_tts(
+class PooledSocket:
+    """
+    預先完成握手的 Fish Audio websocket，一條連線只能用於一次合成
+    httpx_ws 的背景 task group 必須在同一個 task 中開啟與關閉，因此每條連線由專屬的 holder task 持有
+    """
+
+    def __init__(self):
+        self.ws: Optional[AsyncWebSocketSession] = None
+        # 最後一次放回池中或 ping 成功的時間，閒置汰換以此計算
+        self.last_used = time.monotonic()
+        self.released = asyncio.Event()
+        self.holder: Optional[asyncio.Task[None]] = None
+
+    @property
+    def alive(self) -> bool:
+        return self.holder is not None and not self.holder.done()
+
+    def close(self):
+        self.released.set()
+
+
+class TtsClientManager:
+    """
+    應用程式生命週期內共用的 Fish Audio 用戶端
+    - 單一 httpx 連線池供模型查詢等 HTTP 請求與 websocket 握手共用
+    - 維持 pool_size 條預先握手的 websocket，超過 idle_timeout 秒沒有放回或 ping 成功、
+      或 ping 失敗即汰換
+    """
+
+    def __init__(self, pool_size: int, idle_timeout: float, health_interval: float):
+        self.pool_size = pool_size
+        self.idle_timeout = idle_timeout
+        self.health_interval = health_interval
+        self.idle: deque[PooledSocket] = deque()
+        # 進行中的合成數，與最近合成的 (結束時間, 是否失敗)，供降級控制判斷負載
+        self.active = 0
+        self.results: deque[tuple[float, bool]] = deque(maxlen=200)
+        self._http: Optional[httpx.AsyncClient] = None
+        self._maintainer: Optional[asyncio.Task[None]] = None
+        self._wake = asyncio.Event()
+
+    @property
+    def http(self) -> httpx.AsyncClient:
+        # 延遲建立，讓 utils.fish_model 等不經過 lifespan 的命令列工具也能使用
+        if self._http is None:
+            self._http = httpx.AsyncClient(
+                base_url=FISH_BASE_URL,
+                timeout=httpx.Timeout(240),
+                limits=httpx.Limits(max_keepalive_connections=20, keepalive_expiry=120),
+            )
+        return self._http
+
+    async def start(self):
+        if self.pool_size > 0 and self._maintainer is None:
+            self._maintainer = asyncio.create_task(self._maintain())
+
+    async def close(self):
+        if self._maintainer is not None:
+            self._maintainer.cancel()
+            await asyncio.gather(self._maintainer, return_exceptions=True)
+            self._maintainer = None
+        holders = []
+        while self.idle:
+            sock = self.idle.popleft()
+            sock.close()
+            if sock.holder is not None:
+                holders.append(sock.holder)
+        await asyncio.gather(*holders, return_exceptions=True)
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
+
+    async def connect(self) -> PooledSocket:
+        """開啟一條新的 websocket"""
+        sock = PooledSocket()
+        ready: asyncio.Future[PooledSocket] = asyncio.get_running_loop().create_future()
+
+        async def hold():
+            try:
+                async with aconnect_ws(
+                    "/v1/tts/live",
+                    client=self.http,
+                    headers={
+                        "Authorization": f"Bearer {FISH_API_KEY}",
+                        "model": FISH_TTS_MODEL,
+                    },
+                ) as ws:
+                    sock.ws = ws
+                    ready.set_result(sock)
+                    await sock.released.wait()
+            except asyncio.CancelledError:
+                if not ready.done():
+                    ready.cancel()
+                raise
+            except Exception as e:
+                # 使用中斷線的錯誤由使用端的 send/receive 回報
+                if not ready.done():
+                    ready.set_exception(e)
+
+        sock.holder = asyncio.create_task(hold())
+        try:
+            return await ready
+        except asyncio.CancelledError:
+            sock.close()
+            sock.holder.cancel()
+            raise
+
+    async def acquire(self) -> PooledSocket:
+        """取出一條預先握手的 websocket，池中沒有可用連線時才當場建立"""
+        self._wake.set()
+        while self.idle:
+            sock = self.idle.popleft()
+            if sock.alive and time.monotonic() - sock.last_used < self.idle_timeout:
+                metrics.tts_pool_requests.labels("hit").inc()
+                return sock
+            sock.close()
+        metrics.tts_pool_requests.labels("miss").inc()
+        return await self.connect()
+
+    def record_result(self, failed: bool):
+        self.results.append((time.monotonic(), failed))
+
+    def error_rate(self, min_calls: int = 5) -> float:
+        """最近 TTS_ERROR_WINDOW 秒內的合成錯誤率，次數不足時視為 0；不再合成時舊的錯誤會自然過期"""
+        while self.results and self.results[0][0] < time.monotonic() - TTS_ERROR_WINDOW:
+            self.results.popleft()
+        if len(self.results) < min_calls:
+            return 0.0
+        return sum(failed for _, failed in self.results) / len(self.results)
+
+    async def _healthy(self, sock: PooledSocket) -> bool:
+        if not sock.alive or sock.ws is None:
+            return False
+        if time.monotonic() - sock.last_used >= self.idle_timeout:
+            return False
+        try:
+            pong = await sock.ws.ping()
+            await asyncio.wait_for(pong.wait(), 5)
+        except Exception:
+            return False
+        sock.last_used = time.monotonic()
+        return True
+
+    async def _maintain(self):
+        while True:
+            self._wake.clear()
+            for sock in list(self.idle):
+                if not await self._healthy(sock) and sock in self.idle:
+                    self.idle.remove(sock)
+                    sock.close()
+            while len(self.idle) < self.pool_size:
+                try:
+                    sock = await self.connect()
+                    sock.last_used = time.monotonic()
+                    self.idle.append(sock)
+                except Exception as e:
+                    logger.warning(f"Failed to pre-open Fish Audio websocket: {e!r}")
+                    break
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.health_interval)
+            except TimeoutError:
+                pass
+
+
+tts_clients = TtsClientManager(
+    TTS_WS_POOL_SIZE, TTS_WS_IDLE_TIMEOUT, TTS_WS_HEALTH_INTERVAL
+)
+
+
+async def aiter_audio(ws: AsyncWebSocketSession) -> AsyncGenerator[bytes, None]:
+    """讀取合成的音訊訊息直到 finish；Fish Audio 的 websocket 協定為 msgpack 編碼的事件"""
+    while True:
+        try:
+            data = ormsgpack.unpackb(await ws.receive_bytes())
+        except WebSocketDisconnect as e:
+            raise WebSocketError("WebSocket disconnected unexpectedly") from e
+        event = data.get("event")
+        if event == "audio":
+            yield data.get("audio")
+        elif event == "finish":
+            if data.get("reason") == "error":
+                raise WebSocketError("WebSocket stream ended with error")
+            return
+
+
+async def websocket_tts(
     text_gen: AsyncGenerator[str, Any],
     model: Optional[str] = None,
     speed: Optional[float] = None,
 ) -> AsyncGenerator[bytes, Any]:
-    client = AsyncFishAudio(api_key=FISH_API_KEY)
-
     if not model:
         model = DEFAULT_TTS_MODEL
 
-    # Stream audio via WebSocket
-    audio_stream = client.tts.stream_websocket(
-        text_gen,
-        reference_id=model,
+    config = TTSConfig(
         format="mp3",
         latency="balanced",
-        speed=speed,
+        reference_id=model,
+        prosody=Prosody.from_speed_override(speed) if speed is not None else None,
+    )
+    start = ormsgpack.packb(
+        StartEvent(request=TTSRequest(text="", **config.model_dump())).model_dump()
     )
 
-    return audio_stream
+    sock: Optional[PooledSocket] = None
+    failed = True
+    tts_clients.active += 1
+    started = time.monotonic()
+    try:
+        sock = await tts_clients.acquire()
+        try:
+            await sock.ws.send_bytes(start)
+        except Exception as e:
+            # 池中的連線可能已被伺服器關閉，改用新連線重試一次
+            logger.warning(f"Pooled Fish Audio websocket failed, reconnecting: {e!r}")
+            sock.close()
+            sock = await tts_clients.connect()
+            await sock.ws.send_bytes(start)
+        ws = sock.ws
+
+        async def sender():
+            async for text in text_gen:
+                await ws.send_bytes(ormsgpack.packb(TextEvent(text=text).model_dump()))
+            await ws.send_bytes(ormsgpack.packb(CloseEvent().model_dump()))
+
+        sender_task = asyncio.create_task(sender())
+        first_at: Optional[float] = None
+        size = 0
+        try:
+            async for chunk in aiter_audio(ws):
+                if first_at is None:
+                    first_at = time.monotonic()
+                    metrics.tts_ttfb_seconds.observe(first_at - started)
+                size += len(chunk)
+                yield chunk
+            await sender_task
+            failed = False
+        finally:
+            sender_task.cancel()
+        if first_at is not None and (elapsed := time.monotonic() - first_at) > 0:
+            metrics.tts_bytes_per_second.observe(size / elapsed)
+    except (asyncio.CancelledError, GeneratorExit):
+        # 無人收聽而取消不算上游錯誤
+        failed = False
+        raise
+    finally:
+        if sock is not None:
+            sock.close()
+        tts_clients.active -= 1
+        tts_clients.record_result(failed)
+        metrics.tts_requests.labels("error" if failed else "ok").inc()
 
 
 async def get_models(
@@ -63,34 +318,54 @@ async def get_models(
     sort_by: Optional[str] = "score",
     lang: Optional[str] = "zh-TW",
 ) -> list[dict[str, Any]]:
-    async with httpx.AsyncClient() as client:
-        if lang and not lang.startswith("zh"):
-            url = f"https://api.fish.audio/model?page_size=10&page_number=1&sort_by={sort_by}&title_language=en{f'&title={title}' if title else ''}"
-            headers = {"Authorization": f"Bearer {FISH_API_KEY}"}
-            try:
-                response = await client.get(url, headers=headers, timeout=30)
-            except httpx.TimeoutException:
-                logger.error("Timeout fetching model list")
-                raise HTTPException(
-                    status_code=504, detail="Timeout fetching model list"
-                )
-            items = response.json().get("items", [])
-            return items
-        else:
-            title = t2s(title) if title else ""
-            url = f"https://api.fish.audio/model?page_size=10&page_number=1&sort_by={sort_by}&title_language=zh{f'&title={title}' if title else ''}"
-            headers = {"Authorization": f"Bearer {FISH_API_KEY}"}
-            try:
-                response = await client.get(url, headers=headers, timeout=30)
-            except httpx.TimeoutException:
-                logger.error("獲取模型列表超時")
-                raise HTTPException(
-                    status_code=504,
-                    detail="由於我們的爛 Fish Audio 伺服器，獲取模型列表超時",
-                )
-            # logger.info(f"獲取模型列表的響應: {response.text}")
-            items = response.json().get("items", [])
-            for item in items:
-                item["title"] = s2t(item["title"])
-                item["description"] = s2t(item["description"])
-            return items
+    client = tts_clients.http
+    if lang and not lang.startswith("zh"):
+        url = f"https://api.fish.audio/model?page_size=10&page_number=1&sort_by={sort_by}&title_language=en{f'&title={title}' if title else ''}"
+        headers = {"Authorization": f"Bearer {FISH_API_KEY}"}
+        try:
+            response = await client.get(url, headers=headers, timeout=30)
+        except httpx.TimeoutException:
+            logger.error("Timeout fetching model list")
+            raise HTTPException(status_code=504, detail="Timeout fetching model list")
+        items = response.json().get("items", [])
+        return items
+    else:
+        title = t2s(title) if title else ""
+        url = f"https://api.fish.audio/model?page_size=10&page_number=1&sort_by={sort_by}&title_language=zh{f'&title={title}' if title else ''}"
+        headers = {"Authorization": f"Bearer {FISH_API_KEY}"}
+        try:
+            response = await client.get(url, headers=headers, timeout=30)
+        except httpx.TimeoutException:
+            logger.error("獲取模型列表超時")
+            raise HTTPException(
+                status_code=504,
+                detail="由於我們的爛 Fish Audio 伺服器，獲取模型列表超時",
+            )
+        # logger.info(f"獲取模型列表的響應: {response.text}")
+        items = response.json().get("items", [])
+        for item in items:
+            item["title"] = s2t(item["title"])
+            item["description"] = s2t(item["description"])
+        return items
+
+
+async def fetch_model_page(
+    sort_by: str,
+    lang: str,
+    page_number: int,
+    page_size: int = 100,
+) -> dict[str, Any]:
+    """取得一頁原始的模型列表（含 total），不做簡繁轉換，供 utils.fish_model 同步整份目錄"""
+    response = await tts_clients.http.get(
+        "/model",
+        params={
+            "page_size": page_size,
+            "page_number": page_number,
+            "sort_by": sort_by,
+            "title_language": "zh" if lang.startswith("zh") else "en",
+        },
+        headers={"Authorization": f"Bearer {FISH_API_KEY}"},
+        timeout=30,
+    )
+    response.raise_for_status()
+    return response.json()
@@ -0,0 +1,187 @@
+"""
+TTS 文字切分策略基準測試
+
+以錄製的 LLM 片段時間序列（storage/llm_cache 內的快取，若無則使用內建範例）重播文字，
+另外重播一個片段就含多句的 burst 範例，
+經由各種 chunker 切分後送到本機的假 TTS websocket，回報首段音訊延遲與片段數量。
+
+假 TTS 依序合成每個片段，耗時為固定開銷加上與字數成正比的時間，
+所以片段越多、開銷越多，第一段越長、首段音訊越晚。
+
+    python -m benchmarks.chunker --overhead 0.15 --per-char 0.01
+"""
+
+import argparse
+import asyncio
+import json
+import statistics
+import time
+from pathlib import Path
+from typing import Any, AsyncGenerator
+
+import websockets
+from api.chunker import create_chunker, chunk_text
+from settings import LLM_CACHE_DIR
+
+END = "__end__"
+
+SAMPLE_TRACES = {
+    "zh-TW": [
+        (0.6, "說到這個"),
+        (0.05, "東西，"),
+        (0.04, "我真的"),
+        (0.05, "忍不住要說"),
+        (0.06, "兩句。外表"),
+        (0.05, "看起來很唬人，"),
+        (0.04, "結果一用就"),
+        (0.05, "露餡，"),
+        (0.3, "該有的功能"),
+        (0.05, "一個都沒有，"),
+        (0.04, "不該有的"),
+        (0.05, "bug 倒是一堆。"),
+        (0.06, "這只能給到"),
+        (0.05, "拉完了[拉完了]"),
+        (0.04, "，下一個！"),
+    ],
+    "en": [
+        (0.6, "Oh, "),
+        (0.05, "where do "),
+        (0.04, "I even "),
+        (0.05, "start? This "),
+        (0.06, "thing looks "),
+        (0.05, "flashy, "),
+        (0.04, "but the "),
+        (0.05, "moment you "),
+        (0.3, "actually use it, "),
+        (0.05, "it falls apart. "),
+        (0.04, "Zero substance, "),
+        (0.05, "all hype. "),
+        (0.06, "This is a "),
+        (0.05, "straight D[D]"),
+        (0.04, ". Next!"),
+    ],
+}
+
+# 一個片段就含多句的時間序列（閘道緩衝或模型一次輸出大段文字時），
+# 只切在最後一個標點的策略會把整段當成第一段送出
+BURST_TRACES = {
+    "zh-TW": [
+        (0.8, "你好，今天天氣很好。我們去公園玩吧！"),
+        (0.1, "說到這個東西，外表看起來很唬人，結果一用就露餡。"),
+        (0.1, "該有的功能一個都沒有，不該有的 bug 倒是一堆。"),
+        (0.1, "這只能給到拉完了[拉完了]，下一個！"),
+    ],
+    "en": [
+        (0.8, "Oh, where do I even start? This thing looks flashy. "),
+        (0.1, "But the moment you actually use it, it falls apart. "),
+        (0.1, "Zero substance, all hype. This is a straight D[D]. Next!"),
+    ],
+}
+
+
+Trace = list[tuple[float, str]]
+
+
+def load_traces(limit: int) -> dict[tuple[str, str], list[Trace]]:
+    """
+    依 (語言, 來源) 分組的片段時間序列：roast 快取中真實錄製的串流（無則使用內建範例），
+    以及一個片段含多句的 burst 範例
+    """
+    traces: dict[tuple[str, str], list[Trace]] = {
+        (lang, "stream"): [] for lang in SAMPLE_TRACES
+    }
+    directory = Path(LLM_CACHE_DIR)
+    if directory.exists():
+        for path in sorted(directory.glob("*.json"))[:limit]:
+            chunks = [tuple(c) for c in json.loads(path.read_text("utf-8"))["value"]]
+            text = "".join(t for _, t in chunks)
+            lang = "en" if text.isascii() else "zh-TW"
+            traces[(lang, "stream")].append(chunks)
+    for lang, sample in SAMPLE_TRACES.items():
+        if not traces[(lang, "stream")]:
+            traces[(lang, "stream")].append(sample)
+        traces[(lang, "burst")] = [BURST_TRACES[lang]]
+    return traces
+
+
+async def fake_tts_server(overhead: float, per_char: float):
+    """依序合成收到的文字片段並回傳假音訊"""
+
+    async def handler(ws):
+        busy_until = 0.0
+        async for message in ws:
+            if message == END:
+                break
+            now = time.perf_counter()
+            busy_until = max(busy_until, now) + overhead + per_char * len(message)
+            await asyncio.sleep(busy_until - now)
+            await ws.send(b"\0" * (len(message) * 200))
+
+    return await websockets.serve(handler, "127.0.0.1", 0)
+
+
+async def replay(trace: list[tuple[float, str]]) -> AsyncGenerator[str, Any]:
+    for delay, text in trace:
+        await asyncio.sleep(delay)
+        yield text
+
+
+async def run_one(
+    url: str, trace, strategy: str, lang: str
+) -> tuple[float, float, int]:
+    async with websockets.connect(url) as ws:
+        start = time.perf_counter()
+        sent = 0
+
+        async def send():
+            nonlocal sent
+            async for chunk in chunk_text(
+                replay(trace), create_chunker(strategy, lang)
+            ):
+                await ws.send(chunk)
+                sent += 1
+            await ws.send(END)
+
+        sender = asyncio.create_task(send())
+        await ws.recv()
+        first_audio = time.perf_counter() - start
+        async for _ in ws:
+            pass
+        last_audio = time.perf_counter() - start
+        await sender
+        return first_audio, last_audio, sent
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--strategies", nargs="+", default=["fixed", "sentence"])
+    parser.add_argument(
+        "--overhead", type=float, default=0.15, help="每個片段的固定開銷"
+    )
+    parser.add_argument("--per-char", type=float, default=0.01, help="每個字的合成時間")
+    parser.add_argument("--traces", type=int, default=20)
+    args = parser.parse_args()
+
+    server = await fake_tts_server(args.overhead, args.per_char)
+    port = next(iter(server.sockets)).getsockname()[1]
+    url = f"ws://127.0.0.1:{port}"
+
+    print(
+        f"{'lang':>6} {'trace':>7} {'strategy':>10} {'traces':>7} {'TTFA p50':>10} {'done p50':>10} {'chunks':>7}"
+    )
+    for (lang, source), traces in load_traces(args.traces).items():
+        for strategy in args.strategies:
+            results = [await run_one(url, t, strategy, lang) for t in traces]
+            ttfa = statistics.median(r[0] for r in results)
+            done = statistics.median(r[1] for r in results)
+            chunks = statistics.mean(r[2] for r in results)
+            print(
+                f"{lang:>6} {source:>7} {strategy:>10} {len(traces):>7} {ttfa * 1000:>8.0f}ms {done * 1000:>8.0f}ms {chunks:>7.1f}"
+            )
+
+    server.close()
+    await server.wait_closed()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
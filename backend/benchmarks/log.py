@@ -0,0 +1,131 @@
+"""
+記錄對請求吞吐量的影響
+
+以 ASGI 直接呼叫（不經網路）一個只做 chat() 中那筆 "Received request" 紀錄的端點，比較：
+- off：不輸出 INFO 紀錄
+- legacy：舊版設定，呼叫端以 f-string 格式化多行的 TierRequest，
+  在事件迴圈上同步寫入 FileHandler 與 RichHandler
+- queue：utils.log 目前的設定，呼叫端只放入佇列，格式化與寫入在背景執行緒
+- queue-json：同上，記錄檔改為 JSON lines
+- queue-sampled：同上，aitier.request 只保留 10%
+
+控制台輸出導向 /dev/null，記錄檔寫入暫存目錄
+
+    python -m benchmarks.log --requests 3000 --concurrency 32
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import tempfile
+import time
+from typing import TextIO
+
+import httpx
+from fastapi import FastAPI
+from rich.console import Console
+from rich.logging import RichHandler
+
+import main
+from utils import log
+
+
+def make_app(mode: str) -> FastAPI:
+    app = FastAPI()
+    request_logger = log.get_logger("aitier.request")
+
+    @app.post("/tier")
+    async def chat(chat_input: main.TierRequest) -> dict:
+        if mode == "legacy":
+            request_logger.info(f"Received request (full): {chat_input}")
+        else:
+            request_logger.info("Received request (%s): %r", "full", chat_input)
+        return {"case_id": "0" * 32}
+
+    return app
+
+
+def setup(mode: str, directory: str, devnull):
+    root = logging.getLogger()
+    log.shutdown()
+    root.handlers = []
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    if mode == "off":
+        root.setLevel(logging.WARNING)
+        return
+    root.setLevel(logging.INFO)
+    log.console = Console(file=devnull, theme=log.custom_theme, force_terminal=True)
+    if mode == "legacy":
+        rich_handler = RichHandler(console=log.console, rich_tracebacks=True)
+        file_handler = logging.FileHandler(
+            os.path.join(directory, "legacy.log"), encoding="utf-8"
+        )
+        file_handler.setFormatter(logging.Formatter(log.TEXT_FORMAT))
+        root.handlers = [rich_handler, file_handler]
+        return
+    log.configure(
+        log_dir=os.path.join(directory, mode),
+        fmt="json" if mode == "queue-json" else "text",
+        console_output=True,
+        sample="aitier.request=0.1" if mode == "queue-sampled" else "",
+    )
+
+
+async def run(app: FastAPI, requests: int, concurrency: int) -> float:
+    transport = httpx.ASGITransport(app=app)
+    body = {
+        "subject": "珍珠奶茶",
+        "role_name": "銳評AI",
+        "role_description": "說話毒舌但有道理",
+        "tier": "夯",
+        "suggestion": "多加點冰",
+        "turnstile_token": "x",
+    }
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as c:
+        remaining = requests
+
+        async def worker():
+            nonlocal remaining
+            while remaining > 0:
+                remaining -= 1
+                response = await c.post("/tier", json=body)
+                assert response.status_code == 200, response.status_code
+
+        start = time.perf_counter()
+        await asyncio.gather(*[worker() for _ in range(concurrency)])
+        return requests / (time.perf_counter() - start)
+
+
+async def bench(requests: int, concurrency: int, devnull: TextIO):
+    directory = tempfile.mkdtemp(prefix="log-bench-")
+    modes = ["off", "legacy", "queue", "queue-json", "queue-sampled"]
+    results = {}
+    for mode in modes:
+        setup(mode, directory, devnull)
+        app = make_app(mode)
+        await run(app, min(requests, 200), concurrency)  # 暖機
+        results[mode] = await run(app, requests, concurrency)
+        # queue 模式的數字不含背景執行緒清空佇列的時間，另外量測
+        start = time.perf_counter()
+        log.shutdown()
+        results[mode] = (results[mode], time.perf_counter() - start)
+    logging.getLogger().handlers = []
+
+    print(f"{'mode':>14} {'req/s':>10} {'drain s':>8}")
+    for mode, (rate, drain) in results.items():
+        print(f"{mode:>14} {rate:>10.0f} {drain:>8.3f}")
+
+
+def cli():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=3000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    args = parser.parse_args()
+    # 主控台 handler 寫到 /dev/null，量測格式化與寫入的成本但不洗版
+    with open(os.devnull, "w") as devnull:
+        asyncio.run(bench(args.requests, args.concurrency, devnull))
+
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,121 @@
+"""
+GET /share/{share_id} 吞吐量基準測試
+
+在暫存目錄建立一份分享，經由 ASGI 直接呼叫（不經網路）比較：
+- legacy：舊版處理方式，每次同步開檔、json.load 後由 FastAPI 重新序列化
+- gzip / identity：目前的 main.get_shared_cases，直接回傳儲存的 gzip 內容或解壓後的位元組
+- 304：帶 If-None-Match 的重新驗證
+
+    python -m benchmarks.share --requests 2000 --concurrency 32 --cases 20
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import tempfile
+import time
+from pathlib import Path
+
+os.environ["SHARE_DIR"] = tempfile.mkdtemp(prefix="share-bench-")
+
+import httpx
+from fastapi import FastAPI, HTTPException
+
+import main
+from api.share_store import share_store
+
+
+def make_cases(count: int) -> list[dict]:
+    text = "這個東西真的是普普通通，外表看起來很唬人，結果一用就露餡。" * 20
+    return [
+        {
+            "caseId": f"{i:032x}",
+            "timestamp": 1700000000000 + i,
+            "formData": {"subject": f"主題 {i}", "role_name": "銳評AI", "tts": True},
+            "imageUrl": f"https://example.com/{i}.jpg",
+            "streamingText": text,
+            "reply": text + "[拉完了]",
+            "tierDecision": "拉完了",
+        }
+        for i in range(count)
+    ]
+
+
+def legacy_app(directory: Path) -> FastAPI:
+    """舊版 get_shared_cases 的實作（讀檔放到執行緒，只比較解析與序列化的成本）"""
+    app = FastAPI()
+
+    @app.get("/share/{share_id}")
+    async def get_shared_cases(share_id: str):
+        file_path = directory / f"{share_id}.json"
+        if not file_path.exists():
+            raise HTTPException(status_code=404, detail="Shared case not found")
+        content = await asyncio.to_thread(file_path.read_text, encoding="utf-8")
+        return {"cases": json.loads(content)}
+
+    return app
+
+
+async def run(
+    app: FastAPI, path: str, headers: dict, requests: int, concurrency: int
+) -> tuple[float, int]:
+    transport = httpx.ASGITransport(app=app)
+    # 不讓 httpx 自動加上 Accept-Encoding，也不自動解壓
+    async with httpx.AsyncClient(
+        transport=transport, base_url="http://bench"
+    ) as client:
+        client.headers.pop("accept-encoding", None)
+        size = 0
+        remaining = requests
+
+        async def worker():
+            nonlocal remaining, size
+            while remaining > 0:
+                remaining -= 1
+                async with client.stream("GET", path, headers=headers) as response:
+                    assert response.status_code in (200, 304), response.status_code
+                    size = sum([len(chunk) async for chunk in response.aiter_raw()])
+
+        start = time.perf_counter()
+        await asyncio.gather(*[worker() for _ in range(concurrency)])
+        return requests / (time.perf_counter() - start), size
+
+
+async def bench(requests: int, concurrency: int, cases: int):
+    data = make_cases(cases)
+    share_id, _ = await share_store.save(data)
+    etag = (await share_store.get(share_id)).etag
+
+    legacy_dir = Path(tempfile.mkdtemp(prefix="share-legacy-"))
+    (legacy_dir / f"{share_id}.json").write_text(
+        json.dumps(data, ensure_ascii=False, indent=2), "utf-8"
+    )
+
+    scenarios = [
+        ("legacy", legacy_app(legacy_dir), {}),
+        ("gzip", main.app, {"Accept-Encoding": "gzip"}),
+        ("identity", main.app, {}),
+        ("304", main.app, {"Accept-Encoding": "gzip", "If-None-Match": etag}),
+    ]
+    print(f"{'scenario':>10} {'req/s':>10} {'wire bytes':>11}")
+    for name, app, headers in scenarios:
+        rate, size = await run(
+            app, f"/share/{share_id}", headers, requests, concurrency
+        )
+        print(f"{name:>10} {rate:>10.0f} {size:>11}")
+
+
+def cli():
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--cases", type=int, default=20)
+    args = parser.parse_args()
+    asyncio.run(bench(args.requests, args.concurrency, args.cases))
+
+
+if __name__ == "__main__":
+    cli()
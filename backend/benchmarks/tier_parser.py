@@ -0,0 +1,109 @@
+"""
+評級標籤解析的微基準測試
+
+比較舊版 stream_messages 內的逐片段解析（每片段 full_content += text、
+full_content.count()、未編譯的 re.search）與 TierTagParser 在長串流及刁難輸入下的耗時。
+
+舊版在每個標籤都重新掃描全文，標籤多時為平方時間；TierTagParser 為線性時間，
+但每個片段有固定的事件開銷，一般長度的回應兩者都在毫秒以內。
+注意舊版在 open_brackets 下會把 [ 之後的文字全部吞掉，結果並不正確。
+
+    python -m benchmarks.tier_parser --sizes 1000 10000 100000
+"""
+
+import argparse
+import random
+import re
+import time
+from typing import Callable, Iterable
+
+from api.tier_parser import StreamEvent, TierTagParser
+
+
+def legacy_parse(chunks: Iterable[str]) -> list[str]:
+    """舊版 api/ai.py stream_messages 的解析邏輯"""
+    output = []
+    full_content = ""
+    temp = ""
+    for text in chunks:
+        full_content += text
+        if text:
+            if ("[" in text and "]" not in text) or (temp and "]" not in text):
+                temp += text
+                continue
+            elif "]" in text and "[" not in text:
+                text = temp + text
+                temp = ""
+
+            match_ = re.search(r"\[(.*?)\]", text)
+            if match_:
+                rank_content = match_.group(1)
+                if full_content.count(rank_content) == 1:
+                    text = text.replace(
+                        match_.group(0), f"{rank_content}{match_.group(0)}"
+                    )
+            output.append(text)
+    return output
+
+
+def parser_parse(chunks: Iterable[str]) -> list[StreamEvent]:
+    parser = TierTagParser()
+    output = []
+    for text in chunks:
+        output += parser.feed(text)
+    output += parser.close()
+    return output
+
+
+def split(text: str, rng: random.Random) -> list[str]:
+    """切成 1~6 字的片段，模擬 LLM 串流"""
+    chunks, i = [], 0
+    while i < len(text):
+        size = rng.randint(1, 6)
+        chunks.append(text[i : i + size])
+        i += size
+    return chunks
+
+
+def workloads(size: int, rng: random.Random) -> dict[str, list[str]]:
+    body = "這個東西真的是普普通通沒什麼特別的，" * (size // 18 + 1)
+    return {
+        # 一般長回應，最後才給評級
+        "long": split(body[:size] + "這只能給到拉完了[拉完了]", rng),
+        # 大量未閉合的 [，舊版會一直累積在 temp 中
+        "open_brackets": split(("[" + "很長的文字" * 3) * (size // 16 + 1), rng)[
+            : size // 3
+        ],
+        # 大量非評級的方括號標籤，舊版每個標籤都對整段文字 count() 一次
+        "many_tags": split("[註] 你好 [x]" * (size // 11 + 1), rng)[: size // 3],
+        # 評級標籤重複出現，舊版同樣每次都重新掃描全文
+        "repeated_tier": split("真的很普通[NPC]。" * (size // 10 + 1), rng)[
+            : size // 3
+        ],
+    }
+
+
+def measure(fn: Callable[[list[str]], list], chunks: list[str]) -> float:
+    start = time.perf_counter()
+    fn(chunks)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    print(f"{'workload':>14} {'chars':>8} {'legacy':>10} {'parser':>10} {'speedup':>8}")
+    for size in args.sizes:
+        for name, chunks in workloads(size, rng).items():
+            legacy = measure(legacy_parse, chunks)
+            new = measure(parser_parse, chunks)
+            print(
+                f"{name:>14} {sum(map(len, chunks)):>8} {legacy * 1000:>8.2f}ms {new * 1000:>8.2f}ms {legacy / new:>7.1f}x"
+            )
+
+
+if __name__ == "__main__":
+    main()
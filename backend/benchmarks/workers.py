@@ -0,0 +1,124 @@
+"""
+多 worker 案例串流吞吐量基準測試
+
+每個 worker 程序擁有一批已完成的案例，接著所有 worker 隨機讀取全部案例的文字與音訊串流，
+其中大部分落在其他 worker 上，必須經由 Unix socket 後端轉送。
+
+    python -m benchmarks.workers --workers 1 2 4 --cases 50 --reads 400
+"""
+
+import argparse
+import asyncio
+import multiprocessing
+import random
+import tempfile
+import time
+
+from api.registry import UnixSocketCaseBackend
+from api.services import Broadcaster
+
+TEXT_CHUNK = "這個東西真的必須給到夯"
+AUDIO_CHUNK = b"\xff" * 4096
+
+
+def _fill(chunks: list) -> Broadcaster:
+    broadcaster = Broadcaster()
+    for chunk in chunks:
+        broadcaster.append(chunk)
+    broadcaster.close()
+    return broadcaster
+
+
+async def _worker(index: int, args, directory: str, barrier, results):
+    streams = {}
+    for j in range(args.cases):
+        case_id = f"w{index}c{j}"
+        streams[(case_id, "text")] = _fill([TEXT_CHUNK] * args.text_chunks)
+        streams[(case_id, "tts")] = _fill([AUDIO_CHUNK] * args.audio_chunks)
+
+    def get_stream(case_id: str, stream: str, offset: int):
+        broadcaster = streams.get((case_id, stream))
+        return broadcaster.subscribe(offset) if broadcaster else None
+
+    backend = UnixSocketCaseBackend(
+        directory, get_stream, lambda case_id: (case_id, "text") in streams
+    )
+    for j in range(args.cases):
+        await backend.register(f"w{index}c{j}", tts=True)
+    await asyncio.to_thread(barrier.wait)
+
+    rng = random.Random(index)
+    semaphore = asyncio.Semaphore(args.concurrency)
+    total_bytes = 0
+    remote_reads = 0
+
+    async def read_one():
+        nonlocal total_bytes, remote_reads
+        owner = rng.randrange(args.workers)
+        case_id = f"w{owner}c{rng.randrange(args.cases)}"
+        async with semaphore:
+            remote = await backend.lookup(case_id)
+            if remote:
+                remote_reads += 1
+                gens = [remote.llm_gen(), remote.tts_gen()]
+            else:
+                gens = [get_stream(case_id, "text", 0), get_stream(case_id, "tts", 0)]
+            for gen in gens:
+                async for chunk in gen:
+                    total_bytes += len(chunk)
+
+    start = time.perf_counter()
+    await asyncio.gather(*[read_one() for _ in range(args.reads)])
+    elapsed = time.perf_counter() - start
+    results.put((args.reads, remote_reads, total_bytes, elapsed))
+
+    await asyncio.to_thread(barrier.wait)
+    await backend.close()
+
+
+def _run_worker(index, args, directory, barrier, results):
+    asyncio.run(_worker(index, args, directory, barrier, results))
+
+
+def run(args) -> tuple[float, float, float]:
+    with tempfile.TemporaryDirectory() as directory:
+        barrier = multiprocessing.Barrier(args.workers)
+        results = multiprocessing.Queue()
+        processes = [
+            multiprocessing.Process(
+                target=_run_worker, args=(i, args, directory, barrier, results)
+            )
+            for i in range(args.workers)
+        ]
+        for process in processes:
+            process.start()
+        rows = [results.get() for _ in processes]
+        for process in processes:
+            process.join()
+
+    reads = sum(r[0] for r in rows)
+    remote = sum(r[1] for r in rows)
+    total_bytes = sum(r[2] for r in rows)
+    wall = max(r[3] for r in rows)
+    return reads / wall, total_bytes / wall / 1024 / 1024, remote / reads
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--cases", type=int, default=50)
+    parser.add_argument("--reads", type=int, default=400, help="每個 worker 的讀取次數")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--text-chunks", type=int, default=60)
+    parser.add_argument("--audio-chunks", type=int, default=40)
+    options = parser.parse_args()
+
+    print(f"{'workers':>8} {'streams/s':>12} {'MiB/s':>10} {'remote':>8}")
+    for workers in options.workers:
+        args = argparse.Namespace(**{**vars(options), "workers": workers})
+        rate, mib, remote = run(args)
+        print(f"{workers:>8} {rate:>12.1f} {mib:>10.1f} {remote:>8.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,26 +1,48 @@
-import json
-from pathlib import Path
+import asyncio
+import gzip
+import time
+from contextlib import asynccontextmanager
 from typing import Literal, Optional
 from uuid import uuid4
 
 import settings
 from api import tts as Tts
-from api.img import search_images
-from api.services import ApiService, LLMs
+from api import img, metrics
+from api.admission import admission
+from api.alignment import alignment_path
+from api.batch import Batch, BatchResponse
+from api.catalogue import model_catalogue
+from api.degrade import Decision, Mode, degrader
+from api.share_store import share_store
+from api.tracing import tracer
+from api.services import ApiService, LLMs, case_backend
 from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import RedirectResponse
+from fastapi.responses import FileResponse, RedirectResponse, Response
 from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel
 from pyturnstile import Turnstile
 from settings import DEV_MODE
 from starlette.responses import StreamingResponse
-from utils.log import logger
+from utils.log import get_logger, logger
 
 docs_url = "/docs" if DEV_MODE else None  # disables docs
 redoc_url = "/redoc" if DEV_MODE else None  # disables redoc
 openapi_url = "/openapi.json" if DEV_MODE else None
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    model_catalogue.load_snapshots()
+    await Tts.tts_clients.start()
+    yield
+    await case_backend.close()
+    await img.client.aclose()
+    await Tts.tts_clients.close()
+
+
 app = FastAPI(
+    lifespan=lifespan,
     debug=settings.DEV_MODE,
     docs_url=docs_url,
     redoc_url=redoc_url,
@@ -44,11 +66,6 @@ logger.info(f"CORS allow origins: {origins}")
 # Mount storage directory
 app.mount("/storage", StaticFiles(directory="storage"), name="storage")
 
-
-# Create directory for storing shared cases
-SHARED_CASES_DIR = Path("./storage/shared_cases")
-SHARED_CASES_DIR.mkdir(exist_ok=True)
-
 # 文件驗證限制
 MAX_CASES_COUNT = 50  # 最大案例數量
 MAX_FILE_SIZE_MB = 1  # 最大文件大小（MB）
@@ -59,6 +76,47 @@ TiersEN = Literal["S", "A", "B", "C", "D"]
 
 turnstile = Turnstile(secret=settings.TURNSTILE_SECRET_KEY)
 
+# /tier 每次請求一筆的熱路徑紀錄，可用 LOG_SAMPLE=aitier.request=... 抽樣
+request_logger = get_logger("aitier.request")
+
+
+async def validate_turnstile(token: str, endpoint: str) -> bool:
+    """驗證 Turnstile token 並記錄延遲"""
+    start = time.perf_counter()
+    validate = await turnstile.async_validate(token=token)
+    result = "ok" if validate.success else "rejected"
+    metrics.turnstile_seconds.labels(endpoint, result).observe(
+        time.perf_counter() - start
+    )
+    return validate.success
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """If-None-Match 是否包含指定的 ETag（弱比較）"""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    tags = [tag.strip().removeprefix("W/") for tag in header.split(",")]
+    return "*" in tags or etag in tags
+
+
+def accepts_gzip(request: Request) -> bool:
+    """Accept-Encoding 是否接受 gzip：依 q 值判斷（q=0 為拒絕），未列出 gzip 時看 *"""
+    weights: dict[str, float] = {}
+    for part in request.headers.get("accept-encoding", "").split(","):
+        coding, *params = (param.strip() for param in part.split(";"))
+        weight = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    weight = float(value)
+                except ValueError:
+                    weight = 0.0
+        weights[coding.lower()] = weight
+    weight = weights.get("gzip", weights.get("x-gzip", weights.get("*", 0.0)))
+    return weight > 0
+
 
 def if_exists(string: str, *args, **kwargs) -> str:
     return string.format(*args, **kwargs) if string else ""
@@ -77,10 +135,12 @@ class TierRequest(BaseModel):
     style: Optional[str] = None
     turnstile_token: Optional[str] = None
     lang: str = "zh-TW"
+    fresh: bool = False  # 不使用快取的銳評
+    defer_image: bool = False  # 立即回傳 case_id，圖片改由 /image/{case_id} 取得
 
     def __repr__(self):
         nt = "\n\t"
-        return f"TierRequest({nt}subject={self.subject}, {nt}role_name={self.role_name}, {nt}role_description={self.role_description}, {nt}tier={self.tier}, {nt}suggestion={self.suggestion}, {nt}tts={self.tts}, {nt}tts_model={self.tts_model}, {nt}tts_speed={self.tts_speed}, {nt}llm_model={self.llm_model}, {nt}style={self.style}, {nt}lang={self.lang}\n)"
+        return f"TierRequest({nt}subject={self.subject}, {nt}role_name={self.role_name}, {nt}role_description={self.role_description}, {nt}tier={self.tier}, {nt}suggestion={self.suggestion}, {nt}tts={self.tts}, {nt}tts_model={self.tts_model}, {nt}tts_speed={self.tts_speed}, {nt}llm_model={self.llm_model}, {nt}style={self.style}, {nt}lang={self.lang}, {nt}fresh={self.fresh}, {nt}defer_image={self.defer_image}\n)"
 
     def __str__(self):
         return self.__repr__()
@@ -152,9 +212,43 @@ class TierRequest(BaseModel):
         return prompt
 
 
+class TierBatchItem(BaseModel):
+    subject: str
+    tier: Optional[str] = None
+    suggestion: Optional[str] = None
+
+
+class TierBatchRequest(BaseModel):
+    """多個項目共用 TierRequest 中除了 subject、tier、suggestion 以外的設定"""
+
+    items: list[TierBatchItem]
+    role_name: str = "銳評AI"
+    role_description: Optional[str] = None
+    tts: Optional[bool] = None
+    tts_model: Optional[str] = None
+    tts_speed: float = 1.0
+    llm_model: LLMs = "dynamic/auto_backup"
+    style: Optional[str] = None
+    turnstile_token: Optional[str] = None
+    lang: str = "zh-TW"
+    fresh: bool = False
+
+    def to_requests(self) -> list[TierRequest]:
+        shared = self.model_dump(exclude={"items"})
+        return [TierRequest(**shared, **item.model_dump()) for item in self.items]
+
+
 class TierResponse(BaseModel):
     case_id: str
     img_url: str
+    # 實際採用的服務等級：負載過高時可能不合成語音（tts=false）或改用較便宜的 llm_model
+    mode: Mode = "full"
+    tts: bool = True
+    llm_model: str = ""
+
+
+class ImageResponse(BaseModel):
+    img_url: str
 
 
 @app.get("/")
@@ -163,63 +257,226 @@ def root():
 
 
 @app.get("/tts/{case_id}")
-async def tts(case_id: str) -> StreamingResponse:
-    """處理 TTS 請求，根據 case_id 返回對應的音頻流"""
-    return StreamingResponse(
-        ApiService.get_api_service(case_id).tts_gen(), media_type="audio/mp3"
-    )
+async def tts(case_id: str) -> Response:
+    """
+    處理 TTS 請求，根據 case_id 返回對應的音頻流
+    音訊已完整寫入磁碟（合成完成或已封存）時改以檔案回應，支援 Range 請求
+    """
+    service = await ApiService.get_api_service(case_id)
+    audio_file = service.audio_file()
+    if audio_file is not None:
+        return FileResponse(audio_file, media_type="audio/mp3")
+    return StreamingResponse(service.tts_gen(), media_type="audio/mp3")
+
+
+@app.get("/tts/{case_id}/alignment")
+async def tts_alignment(case_id: str) -> FileResponse:
+    """文字與音訊的對齊索引：每個 TTS 片段的文字範圍、音訊位元組與秒數，以及評級出現的位置"""
+    await ApiService.get_api_service(case_id)
+    path = alignment_path(case_id)
+    if not path.exists():
+        raise HTTPException(status_code=404, detail="Alignment not ready")
+    return FileResponse(path, media_type="application/json")
 
 
 @app.get("/text/{case_id}")
-async def text(case_id: str) -> StreamingResponse:
-    """處理文本流請求，根據 case_id 返回對應的文本流"""
+async def text(case_id: str, events: bool = False) -> StreamingResponse:
+    """
+    處理文本流請求，根據 case_id 返回對應的文本流
+    events=true 時改為 SSE 事件（text_delta、tier_decision、done）
+    """
+    service = await ApiService.get_api_service(case_id)
     return StreamingResponse(
-        ApiService.get_api_service(case_id).llm_gen(), media_type="text/event-stream"
+        service.event_gen() if events else service.llm_gen(),
+        media_type="text/event-stream",
     )
 
 
+@app.get("/image/{case_id}", response_model=ImageResponse)
+async def image(case_id: str) -> ImageResponse:
+    """根據 case_id 返回圖片網址，搜尋尚未完成時會等待"""
+    service = await ApiService.get_api_service(case_id)
+    img_url = await service.image_url()
+    return ImageResponse(img_url=img_url)
+
+
+async def create_case(
+    chat_input: TierRequest, case_id: str
+) -> tuple[ApiService, Decision]:
+    """依目前負載決定服務等級，啟動案例與圖片搜尋；呼叫者須已取得准入名額"""
+    decision = degrader.decide(
+        ApiService.running_cases(),
+        tts=chat_input.tts is not False,
+        llm_model=chat_input.llm_model,
+    )
+    service = ApiService(
+        prompt=chat_input.to_prompt(),
+        llm_model=decision.llm_model,
+        case_id=case_id,
+        tts=decision.tts,
+        tts_model=chat_input.tts_model,
+        tts_speed=chat_input.tts_speed,
+        use_cache=not chat_input.fresh,
+        lang=chat_input.lang,
+    )
+    await service.start()
+    service.search_image(chat_input.subject, lang=chat_input.lang)
+    return service, decision
+
+
 @app.post("/tier", response_model=TierResponse)
-async def chat(chat_input: TierRequest) -> TierResponse:
-    """處理聊天請求，返回一個唯一的 UUID 以識別這次對話"""
+async def chat(request: Request, chat_input: TierRequest) -> TierResponse:
+    """
+    處理聊天請求，返回一個唯一的 UUID 以識別這次對話
+    超過用戶端速率回傳 429，同時進行的案例已滿且排隊逾時回傳 503
+    """
     uuid = uuid4().hex
 
     if not chat_input.turnstile_token:
         raise HTTPException(status_code=400, detail="Turnstile token is required")
 
-    validate = await turnstile.async_validate(token=chat_input.turnstile_token)
+    # 在 Turnstile 驗證前限速，避免被用來消耗驗證額度
+    admission.check_rate(request.client.host if request.client else "")
+
+    trace = tracer.trace(uuid)
+    try:
+        with trace.span("turnstile"):
+            valid = await validate_turnstile(chat_input.turnstile_token, "tier")
+        if not valid:
+            raise HTTPException(status_code=400, detail="Turnstile validation failed")
+        with trace.span("admission"):
+            await admission.acquire()
+    except BaseException:
+        tracer.discard(uuid)
+        raise
 
-    if not validate.success:
+    try:
+        service, decision = await create_case(chat_input, uuid)
+    except BaseException:
+        admission.release()
+        raise
+    admission.hold(service.finished())
+
+    # print(f"Received message: {chat_input}")
+
+    # 以參數傳入，TierRequest 的多行 repr 在記錄執行緒中才格式化
+    request_logger.info("Received request (%s): %r", decision.mode, chat_input)
+
+    mode = {
+        "mode": decision.mode,
+        "tts": decision.tts,
+        "llm_model": decision.llm_model,
+    }
+    if chat_input.defer_image:
+        return TierResponse(case_id=uuid, img_url="", **mode)
+    # 等待圖片搜尋（逾時約 10 秒）期間用戶端還拿不到 case_id，
+    # 這個請求先算作收聽者，寬限期從回應送出時才開始倒數
+    with service.listening():
+        img_url = await service.image_url()
+    return TierResponse(case_id=uuid, img_url=img_url, **mode)
+
+
+@app.post("/tier/batch")
+async def chat_batch(
+    request: Request, batch_input: TierBatchRequest
+) -> StreamingResponse:
+    """
+    一次請求銳評多個項目，共用角色、風格與模型設定，只驗證一次 Turnstile
+    回傳以 item 標記的 SSE 串流；語音仍由 /tts/{case_id} 取得，case_id 見 item_start 事件
+    """
+    if not batch_input.turnstile_token:
+        raise HTTPException(status_code=400, detail="Turnstile token is required")
+    if not batch_input.items:
+        raise HTTPException(status_code=400, detail="At least one item is required")
+    if len(batch_input.items) > settings.BATCH_MAX_ITEMS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Too many items, at most {settings.BATCH_MAX_ITEMS} are allowed",
+        )
+
+    # 每個項目都會建立一個案例，依項目數取用權杖
+    admission.check_rate(
+        request.client.host if request.client else "", len(batch_input.items)
+    )
+    if not await validate_turnstile(batch_input.turnstile_token, "tier_batch"):
         raise HTTPException(status_code=400, detail="Turnstile validation failed")
 
-    ApiService(
-        prompt=chat_input.to_prompt(),
-        llm_model=chat_input.llm_model,
-        case_id=uuid,
-        tts_model=chat_input.tts_model,
-        tts_speed=chat_input.tts_speed,
-    ).start()
+    chat_inputs = batch_input.to_requests()
+    request_logger.info(
+        "Received batch request (%d items): %r", len(chat_inputs), batch_input
+    )
+    # 第一個項目的名額在串流開始前取得，整體過載時直接回傳 503；
+    # 之後由 BatchResponse 保證即使串流沒有開始也會歸還
+    await admission.acquire()
+    batch = Batch(
+        [chat_input.subject for chat_input in chat_inputs],
+        lambda index, case_id: create_case(chat_inputs[index], case_id),
+        concurrency=settings.BATCH_CONCURRENCY,
+        admitted=True,
+    )
+    return BatchResponse(batch)
 
-    img_url = await search_images(chat_input.subject, lang=chat_input.lang)
 
-    # print(f"Received message: {chat_input}")
+@app.get("/admission")
+async def admission_stats() -> dict:
+    """/tier 准入控制與降級狀態：進行中與排隊中的案例數、等待時間、拒絕次數與目前的服務等級"""
+    return {
+        **admission.stats(),
+        **degrader.stats(),
+        **degrader.signals(ApiService.running_cases()),
+    }
+
+
+@app.get("/metrics")
+async def get_metrics() -> Response:
+    """Prometheus 文字格式的指標"""
+    return Response(
+        content=metrics.REGISTRY.render(),
+        media_type="text/plain; version=0.0.4; charset=utf-8",
+    )
+
+
+@app.get("/debug/traces", include_in_schema=DEV_MODE)
+async def list_traces(limit: int = 50) -> dict:
+    """（僅開發模式）最近案例的各階段時間線，新的在前"""
+    if not DEV_MODE:
+        raise HTTPException(status_code=404, detail="Not Found")
+    return {"traces": [trace.to_dict() for trace in tracer.recent(limit)]}
 
-    logger.info(f"Received request: {chat_input}")
 
-    return TierResponse(case_id=uuid, img_url=img_url[0] if img_url else "")
+@app.get("/debug/traces/{case_id}", include_in_schema=DEV_MODE)
+async def get_trace(case_id: str) -> dict:
+    """（僅開發模式）單一案例的各階段時間線：開始、第一個片段與結束的毫秒數"""
+    if not DEV_MODE:
+        raise HTTPException(status_code=404, detail="Not Found")
+    trace = tracer.get(case_id)
+    if trace is None:
+        raise HTTPException(status_code=404, detail="Trace not found")
+    return trace.to_dict()
 
 
 @app.get("/models")
 async def get_model(
+    request: Request,
     model_name: Optional[str] = None,
-    sort_by: Optional[str] = "score",
+    sort_by: str = "score",
     lang: Optional[str] = "zh-TW",
 ):
     """獲取模型列表"""
-    if not model_name:
-        with open(f"storage/fish_model/{sort_by}.json", "r", encoding="utf-8") as f:
-            models = json.load(f)
-    models = await Tts.get_models(model_name, sort_by, lang=lang)
-    return models
+    if model_name:
+        # 先在本機索引搜尋，沒有結果才查詢 Fish Audio
+        if models := model_catalogue.search(model_name, lang):
+            return models
+        return await Tts.get_models(model_name, sort_by, lang=lang)
+
+    try:
+        entry = await model_catalogue.get(sort_by, lang)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    headers = {"ETag": entry.etag, "Cache-Control": "no-cache"}
+    if etag_matches(request, entry.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=entry.body, media_type="application/json", headers=headers)
 
 
 class ReviewCaseFormData(BaseModel):
@@ -262,8 +519,7 @@ async def save_cases(request: Request, save_request: SaveCasesRequest):
     try:
         if not save_request.turnstile_token:
             raise HTTPException(status_code=400, detail="Turnstile token is required")
-        validate = await turnstile.async_validate(token=save_request.turnstile_token)
-        if not validate.success:
+        if not await validate_turnstile(save_request.turnstile_token, "save_cases"):
             raise HTTPException(status_code=400, detail="Turnstile validation failed")
         body = await request.body()
         body_size = len(body)
@@ -283,19 +539,13 @@ async def save_cases(request: Request, save_request: SaveCasesRequest):
                 detail=f"Case 數量超過限制，最多允許 {MAX_CASES_COUNT} 個案例",
             )
 
-        share_id = uuid4().hex
-        file_path = SHARED_CASES_DIR / f"{share_id}.json"
-
         # Convert Pydantic models to dict for JSON serialization
         cases_dict = [case.model_dump() for case in save_request.cases]
-
-        # 寫入文件（使用與原始數據相同的格式）
-        json_str = json.dumps(cases_dict, ensure_ascii=False, indent=2)
-        with open(file_path, "w", encoding="utf-8") as f:
-            f.write(json_str)
+        share_id, duplicate = await share_store.save(cases_dict)
 
         logger.info(
-            f"Saved cases to {file_path}, size: {body_size / 1024:.2f}KB, cases count: {len(save_request.cases)}"
+            f"Saved cases as {share_id}, size: {body_size / 1024:.2f}KB, cases count: {len(save_request.cases)}"
+            f"{' (deduplicated)' if duplicate else ''}"
         )
         return {"share_id": share_id, "message": "Cases saved successfully"}
     except HTTPException:
@@ -306,21 +556,29 @@ async def save_cases(request: Request, save_request: SaveCasesRequest):
 
 
 @app.get("/share/{share_id}")
-async def get_shared_cases(share_id: str):
-    """根據分享 ID 獲取案例數據"""
+async def get_shared_cases(request: Request, share_id: str) -> Response:
+    """根據分享 ID 獲取案例數據，直接回傳儲存的 gzip 內容，不重新解析 JSON"""
     try:
-        file_path = SHARED_CASES_DIR / f"{share_id}.json"
-
-        if not file_path.exists():
-            raise HTTPException(status_code=404, detail="Shared case not found")
-
-        with open(file_path, "r", encoding="utf-8") as f:
-            cases = json.load(f)
-
-        logger.info(f"Retrieved shared cases: {share_id}")
-        return {"cases": cases}
-    except HTTPException:
-        raise
+        shared = await share_store.get(share_id)
     except Exception as e:
         logger.error(f"Failed to retrieve shared cases: {e}")
         raise HTTPException(status_code=500, detail=str(e))
+    if shared is None:
+        raise HTTPException(status_code=404, detail="Shared case not found")
+
+    # gzip 與未壓縮的回應位元組不同，各用自己的 ETag，快取才不會把兩者混用
+    compressed = accepts_gzip(request)
+    etag = f'{shared.etag[:-1]}-gz"' if compressed else shared.etag
+    headers = {
+        "ETag": etag,
+        "Vary": "Accept-Encoding",
+        "Cache-Control": "public, max-age=86400",
+    }
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    if compressed:
+        headers["Content-Encoding"] = "gzip"
+        body = shared.compressed
+    else:
+        body = await asyncio.to_thread(gzip.decompress, shared.compressed)
+    return Response(content=body, media_type="application/json", headers=headers)
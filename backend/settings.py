@@ -9,6 +9,64 @@ FRONTEND_URL = getenv("FRONTEND_URL", "http://127.0.0.1:3000")
 
 API_SERVICE_TIME_OUT = int(getenv("API_SERVICE_TIME_OUT", "300"))
 
+# 案例沒有任何收聽者超過此秒數後，取消尚未完成的 LLM 與 TTS 生成
+CASE_IDLE_GRACE = float(getenv("CASE_IDLE_GRACE", "10"))
+# 為 true 時即使無人收聽也完成生成並保存音訊
+CASE_PERSIST = getenv("CASE_PERSIST", "false").lower() == "true"
+
+# 已完成案例的封存目錄；封存後的案例在記憶體中只再保留 CASE_ARCHIVED_TTL 秒，
+# 之後 /text、/tts、/image 由封存檔提供
+CASE_ARCHIVE_DIR = getenv("CASE_ARCHIVE_DIR", "storage/archive")
+# 封存目錄的總大小上限，超過時依最後讀寫時間做 LRU 淘汰
+CASE_ARCHIVE_MAX_BYTES = int(getenv("CASE_ARCHIVE_MAX_BYTES", str(1024 * 1024 * 1024)))
+CASE_ARCHIVED_TTL = float(getenv("CASE_ARCHIVED_TTL", "30"))
+
+# 每個案例的每條串流（文字或音訊）在記憶體中保留的最大位元組數
+BROADCASTER_MAX_BYTES = int(getenv("BROADCASTER_MAX_BYTES", str(8 * 1024 * 1024)))
+# 所有案例合計的記憶體預算，超過時各串流會盡量淘汰已消費或已寫入磁碟的片段
+BROADCASTER_GLOBAL_MAX_BYTES = int(
+    getenv("BROADCASTER_GLOBAL_MAX_BYTES", str(256 * 1024 * 1024))
+)
+
+# 已完成 LLM 銳評的快取：記憶體 LRU 條目數、磁碟條目數、存活秒數
+# 命中時以 LLM_CACHE_PACE 倍的原始間隔重播（0 為立即輸出）
+LLM_CACHE_DIR = getenv("LLM_CACHE_DIR", "storage/llm_cache")
+LLM_CACHE_MAX_ENTRIES = int(getenv("LLM_CACHE_MAX_ENTRIES", "1000"))
+LLM_CACHE_MAX_DISK_ENTRIES = int(getenv("LLM_CACHE_MAX_DISK_ENTRIES", "20000"))
+LLM_CACHE_TTL = float(getenv("LLM_CACHE_TTL", str(24 * 60 * 60)))
+LLM_CACHE_PACE = float(getenv("LLM_CACHE_PACE", "1.0"))
+
+# TTS 音訊快取，依總大小做 LRU 淘汰
+TTS_CACHE_DIR = getenv("TTS_CACHE_DIR", "storage/tts_cache")
+TTS_CACHE_MAX_BYTES = int(getenv("TTS_CACHE_MAX_BYTES", str(2 * 1024 * 1024 * 1024)))
+# 各案例的音訊目錄（storage/audio），同樣依總大小做 LRU 淘汰，連同其對齊索引一併刪除
+AUDIO_DIR = getenv("AUDIO_DIR", "storage/audio")
+AUDIO_MAX_BYTES = int(getenv("AUDIO_MAX_BYTES", str(4 * 1024 * 1024 * 1024)))
+
+# 圖片搜尋結果快取
+IMG_CACHE_DIR = getenv("IMG_CACHE_DIR", "storage/img_cache")
+IMG_CACHE_MAX_ENTRIES = int(getenv("IMG_CACHE_MAX_ENTRIES", "5000"))
+IMG_CACHE_MAX_DISK_ENTRIES = int(getenv("IMG_CACHE_MAX_DISK_ENTRIES", "50000"))
+IMG_CACHE_TTL = float(getenv("IMG_CACHE_TTL", str(7 * 24 * 60 * 60)))
+
+# LLM 對沖請求：主要模型在 p95 首字延遲（限制在 MIN~MAX 秒內）仍無回應時，
+# 同時向備援模型發出請求，採用先產生文字的一方
+LLM_HEDGE = getenv("LLM_HEDGE", "true").lower() == "true"
+LLM_HEDGE_MIN_DELAY = float(getenv("LLM_HEDGE_MIN_DELAY", "1.0"))
+LLM_HEDGE_MAX_DELAY = float(getenv("LLM_HEDGE_MAX_DELAY", "6.0"))
+# 每個模型的斷路器：最近 WINDOW 次呼叫中錯誤率或 p95 首字延遲過高時暫停使用 COOLDOWN 秒
+LLM_BREAKER_WINDOW = int(getenv("LLM_BREAKER_WINDOW", "50"))
+LLM_BREAKER_MIN_CALLS = int(getenv("LLM_BREAKER_MIN_CALLS", "5"))
+LLM_BREAKER_ERROR_RATE = float(getenv("LLM_BREAKER_ERROR_RATE", "0.5"))
+LLM_BREAKER_SLOW_TTFT = float(getenv("LLM_BREAKER_SLOW_TTFT", "15.0"))
+LLM_BREAKER_COOLDOWN = float(getenv("LLM_BREAKER_COOLDOWN", "30.0"))
+
+# 案例串流的共享方式："local" 僅限單一程序；"unix" 透過 Unix socket 在同主機的多個 worker 間共享
+CASE_BACKEND = getenv("CASE_BACKEND", "local")
+# uvicorn worker 數；與 uvicorn --workers 的預設值相同讀取 WEB_CONCURRENCY，多 worker 時請以此啟動
+WORKERS = max(int(getenv("WEB_CONCURRENCY", "1")), 1)
+CASE_SOCKET_DIR = getenv("CASE_SOCKET_DIR", "storage/run")
+
 FISH_API_KEY = getenv("FISH_API_KEY", "")
 
 AI_API_KEY = getenv("AI_API_KEY", "")
@@ -19,6 +77,72 @@ DEV_MODE = getenv("APP_MODE", "production") == "dev"
 
 TURNSTILE_SECRET_KEY = getenv("TURNSTILE_SECRET_KEY", "")
 
+# 預先握手的 Fish Audio websocket 數量、閒置汰換秒數（自放入池中或最後一次 ping 成功起算）
+# 與健康檢查間隔（0 為停用連線池）
+TTS_WS_POOL_SIZE = int(getenv("TTS_WS_POOL_SIZE", "2"))
+TTS_WS_IDLE_TIMEOUT = float(getenv("TTS_WS_IDLE_TIMEOUT", "30"))
+TTS_WS_HEALTH_INTERVAL = float(getenv("TTS_WS_HEALTH_INTERVAL", "10"))
+
+# /models 模型清單：啟動時載入的快照目錄，以及過期後在背景重新整理的秒數
+MODEL_CATALOGUE_DIR = getenv("MODEL_CATALOGUE_DIR", "storage/fish_model")
+MODEL_CATALOGUE_TTL = float(getenv("MODEL_CATALOGUE_TTL", "600"))
+
+# 分享案例的儲存目錄與 gzip 壓縮等級
+SHARE_DIR = getenv("SHARE_DIR", "storage/shared_cases")
+SHARE_COMPRESS_LEVEL = int(getenv("SHARE_COMPRESS_LEVEL", "6"))
+# 熱門分享在記憶體中保留的壓縮內容數量與秒數
+SHARE_CACHE_MAX_ENTRIES = int(getenv("SHARE_CACHE_MAX_ENTRIES", "500"))
+SHARE_CACHE_TTL = float(getenv("SHARE_CACHE_TTL", str(60 * 60)))
+
+# /tier 准入控制：每個用戶端每秒補充的請求數與可累積的上限（RATE 為 0 時不限速）
+ADMISSION_RATE = float(getenv("ADMISSION_RATE", "0.2"))
+ADMISSION_BURST = int(getenv("ADMISSION_BURST", "5"))
+ADMISSION_MAX_CLIENTS = int(getenv("ADMISSION_MAX_CLIENTS", "10000"))
+# 整個服務同時進行的案例上限、排隊上限與最長等待秒數（MAX_ACTIVE 為 0 時不限制）；
+# 前兩者由 WEB_CONCURRENCY 個 worker 平分，見 api.admission.per_worker
+ADMISSION_MAX_ACTIVE = int(getenv("ADMISSION_MAX_ACTIVE", "32"))
+ADMISSION_MAX_QUEUE = int(getenv("ADMISSION_MAX_QUEUE", "64"))
+ADMISSION_QUEUE_TIMEOUT = float(getenv("ADMISSION_QUEUE_TIMEOUT", "10"))
+
+# /tier/batch：一次請求的項目上限，以及同一批次中同時進行（LLM、TTS、圖片搜尋）的項目數
+BATCH_MAX_ITEMS = int(getenv("BATCH_MAX_ITEMS", "50"))
+BATCH_CONCURRENCY = int(getenv("BATCH_CONCURRENCY", "4"))
+
+# 負載降級：新案例改為純文字（text_only），或再改用較便宜的 LLM（lite）的門檻
+# text_only：案例負載、同時合成的 TTS 數或最近 TTS_ERROR_WINDOW 秒內的合成錯誤率超過門檻
+# lite：案例負載或斷路器開啟的 LLM 模型數超過門檻
+# 案例負載為 (進行中的案例數 + 1) / 每個 worker 的准入名額，門檻須介於 0 與 1 之間
+DEGRADE_TEXT_ONLY_LOAD = float(getenv("DEGRADE_TEXT_ONLY_LOAD", "0.75"))
+DEGRADE_TTS_MAX_STREAMS = int(getenv("DEGRADE_TTS_MAX_STREAMS", "16"))
+DEGRADE_TTS_ERROR_RATE = float(getenv("DEGRADE_TTS_ERROR_RATE", "0.3"))
+TTS_ERROR_WINDOW = float(getenv("TTS_ERROR_WINDOW", "60"))
+DEGRADE_LITE_LOAD = float(getenv("DEGRADE_LITE_LOAD", "0.95"))
+DEGRADE_LLM_OPEN_CIRCUITS = int(getenv("DEGRADE_LLM_OPEN_CIRCUITS", "2"))
+# 指標低於門檻的 RECOVER_RATIO 倍且維持 MIN_HOLD 秒後才恢復，避免來回切換
+DEGRADE_RECOVER_RATIO = float(getenv("DEGRADE_RECOVER_RATIO", "0.7"))
+DEGRADE_MIN_HOLD = float(getenv("DEGRADE_MIN_HOLD", "15"))
+DEGRADE_LITE_MODEL = getenv("DEGRADE_LITE_MODEL", "google/gemini-2.0-flash-lite")
+
+# 每個案例各階段的時間線：記憶體中保留的案例數，以及案例結束後附加寫入的 JSONL 檔（空字串為不匯出）
+TRACE_MAX_CASES = int(getenv("TRACE_MAX_CASES", "200"))
+TRACE_EXPORT_PATH = getenv("TRACE_EXPORT_PATH", "")
+
+# 記錄檔：目錄、格式（"text" 或 "json" 每行一筆 JSON）、午夜輪替後保留的天數、是否輸出到控制台
+LOG_DIR = getenv("LOG_DIR", "logs")
+LOG_FORMAT = getenv("LOG_FORMAT", "text")
+LOG_BACKUP_DAYS = int(getenv("LOG_BACKUP_DAYS", "14"))
+LOG_CONSOLE = getenv("LOG_CONSOLE", "true").lower() == "true"
+# 依 logger 名稱抽樣 INFO 以下的紀錄，例如 "httpx=0.1,aitier.request=0.5"
+LOG_SAMPLE = getenv("LOG_SAMPLE", "")
+# 記錄佇列的上限，背景執行緒跟不上時丟棄新的紀錄並計數
+LOG_QUEUE_SIZE = int(getenv("LOG_QUEUE_SIZE", "10000"))
+# 記錄檔輪替："time" 由程序在午夜自行輪替，多 worker 時每個程序寫自己的 app.{pid}.log；
+# "external" 以 WatchedFileHandler 寫入共用的 app.log，由 logrotate 等外部工具輪替
+LOG_ROTATE = getenv("LOG_ROTATE", "time")
+
+# 送往 TTS 的文字切分策略："sentence"（依標點與計時器）或 "fixed"（固定 5 字）
+TTS_CHUNKER = getenv("TTS_CHUNKER", "sentence")
+
 DEFAULT_TTS_MODEL = "a9372068ed0740b48326cf9a74d7496a"
 
 LLMs = Literal[
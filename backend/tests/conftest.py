@@ -0,0 +1,8 @@
+import os
+import tempfile
+
+# settings 與 utils.log 在 import 時讀取環境變數，必須在載入任何專案模組前設定
+os.environ.setdefault("AI_API_KEY", "test")
+os.environ.setdefault("TTS_WS_POOL_SIZE", "0")
+os.environ.setdefault("LOG_CONSOLE", "false")
+os.environ.setdefault("LOG_DIR", tempfile.mkdtemp(prefix="aitier-test-logs-"))
@@ -0,0 +1,98 @@
+import asyncio
+
+import pytest
+from api.admission import AdmissionController, per_worker
+from fastapi import HTTPException
+
+
+def _controller(**kwargs) -> AdmissionController:
+    options = dict(
+        rate=0, burst=1, max_active=1, max_queue=8, queue_timeout=1, max_clients=8
+    )
+    return AdmissionController(**{**options, **kwargs})
+
+
+def test_waiters_are_admitted_in_arrival_order():
+    async def run():
+        admission = _controller()
+        await admission.acquire()
+        order = []
+
+        async def wait(name):
+            await admission.acquire()
+            order.append(name)
+
+        tasks = [asyncio.create_task(wait(name)) for name in "abc"]
+        await asyncio.sleep(0)
+        for _ in tasks:
+            admission.release()
+            await asyncio.sleep(0)
+        await asyncio.gather(*tasks)
+        # 名額直接轉交，不會讓新來的請求插隊
+        return order, admission.active
+
+    assert asyncio.run(run()) == (["a", "b", "c"], 1)
+
+
+def test_queue_timeout_rejects_and_leaves_queue():
+    async def run():
+        admission = _controller(queue_timeout=0.01)
+        await admission.acquire()
+        with pytest.raises(HTTPException) as e:
+            await admission.acquire()
+        admission.release()
+        return e.value, len(admission.waiters), admission.active, admission.counts
+
+    error, queued, active, counts = asyncio.run(run())
+    assert error.status_code == 503
+    assert int(error.headers["Retry-After"]) >= 1
+    assert (queued, active, counts["queue_timeout"]) == (0, 0, 1)
+
+
+def test_cancelled_waiter_is_skipped():
+    async def run():
+        admission = _controller()
+        await admission.acquire()
+        first = asyncio.create_task(admission.acquire())
+        second = asyncio.create_task(admission.acquire())
+        await asyncio.sleep(0)
+        first.cancel()
+        await asyncio.sleep(0)
+        admission.release()
+        await second
+        return len(admission.waiters), admission.active
+
+    assert asyncio.run(run()) == (0, 1)
+
+
+def test_full_queue_is_rejected_immediately():
+    async def run():
+        admission = _controller(max_queue=1)
+        await admission.acquire()
+        waiting = asyncio.create_task(admission.acquire())
+        await asyncio.sleep(0)
+        with pytest.raises(HTTPException) as e:
+            await admission.acquire()
+        admission.release()
+        await waiting
+        return e.value.status_code, admission.counts["queue_full"]
+
+    assert asyncio.run(run()) == (503, 1)
+
+
+def test_hold_releases_when_work_finishes():
+    async def run():
+        admission = _controller()
+        await admission.acquire()
+        work = asyncio.get_running_loop().create_future()
+        admission.hold(work)
+        work.set_result(None)
+        await asyncio.sleep(0)
+        return admission.active
+
+    assert asyncio.run(run()) == 0
+
+
+def test_per_worker_rounds_up():
+    assert per_worker(32, 3) == 11
+    assert per_worker(0, 4) == 0
@@ -0,0 +1,55 @@
+import asyncio
+import os
+
+import pytest
+from api.archive import ArchivedCase, CaseArchive
+from fastapi import HTTPException
+
+
+def _record(audio_path: str = "", tts: bool = True) -> dict:
+    return {
+        "text": "夯" * 100,
+        "tier": "夯",
+        "tier_index": 0,
+        "timing": [],
+        "tts": tts,
+        "audio_path": audio_path,
+        "image_url": "",
+    }
+
+
+def test_oldest_records_are_trimmed(tmp_path):
+    archive = CaseArchive(str(tmp_path), max_bytes=2000)
+    ids = [f"{index:02x}" + "0" * 30 for index in range(10)]
+
+    async def run():
+        for index, case_id in enumerate(ids):
+            await archive.save(case_id, _record())
+            # mtime 解析度可能不足，明確指定寫入順序
+            os.utime(archive.path(case_id), (index, index))
+        return [await archive.lookup(case_id) is not None for case_id in ids]
+
+    kept = asyncio.run(run())
+    assert not kept[0] and kept[-1]
+    total = sum(path.stat().st_size for path in tmp_path.glob("*/*.json"))
+    assert total <= 2000
+
+
+def test_missing_audio_is_none_and_streaming_it_is_404(tmp_path):
+    case = ArchivedCase("a" * 32, _record(str(tmp_path / "gone.mp3")))
+    assert case.audio_file() is None
+    with pytest.raises(HTTPException) as e:
+        case.tts_gen()
+    assert e.value.status_code == 404
+
+    audio = tmp_path / "kept.mp3"
+    audio.write_bytes(b"\xff")
+    assert ArchivedCase("a" * 32, _record(str(audio))).audio_file() == audio
+
+
+def test_tts_disabled_case_has_no_audio():
+    case = ArchivedCase("a" * 32, _record(tts=False))
+    assert case.audio_file() is None
+    with pytest.raises(HTTPException) as e:
+        case.tts_gen()
+    assert e.value.status_code == 400
@@ -0,0 +1,73 @@
+import asyncio
+
+from api.admission import admission
+from api.batch import Batch, BatchResponse
+
+
+async def _never_called(index, case_id):
+    raise AssertionError("no item should start")
+
+
+def _scope() -> dict:
+    return {"type": "http", "method": "POST", "path": "/tier/batch", "headers": []}
+
+
+def test_slot_is_returned_when_client_leaves_before_streaming():
+    async def run():
+        before = admission.active
+        await admission.acquire()
+        batch = Batch(["a", "b"], _never_called, concurrency=2, admitted=True)
+
+        async def receive():
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            raise OSError("client went away")
+
+        try:
+            await BatchResponse(batch)(_scope(), receive, send)
+        except OSError:
+            pass
+        return before, admission.active
+
+    before, after = asyncio.run(run())
+    assert after == before
+
+
+def test_slot_is_returned_when_client_leaves_while_item_starts():
+    async def run():
+        before = admission.active
+        await admission.acquire()
+        starting = asyncio.Event()
+
+        async def slow_case(index, case_id):
+            starting.set()
+            await asyncio.Event().wait()
+
+        batch = Batch(["a"], slow_case, concurrency=1, admitted=True)
+        stream = batch.stream()
+        reader = asyncio.create_task(anext(stream))
+        await starting.wait()
+        # 用戶端斷線時 Starlette 取消正在讀取串流的工作
+        reader.cancel()
+        await asyncio.gather(reader, return_exceptions=True)
+        # 等被取消的項目執行完清理
+        await asyncio.gather(*batch.items, return_exceptions=True)
+        batch.release_admitted()
+        return before, admission.active
+
+    before, after = asyncio.run(run())
+    assert after == before
+
+
+def test_pre_acquired_slot_is_returned_once():
+    async def run():
+        before = admission.active
+        await admission.acquire()
+        batch = Batch(["a"], _never_called, concurrency=1, admitted=True)
+        batch.release_admitted()
+        batch.release_admitted()
+        return before, admission.active
+
+    before, after = asyncio.run(run())
+    assert after == before
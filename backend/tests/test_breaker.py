@@ -0,0 +1,88 @@
+import time
+
+from api.ai import CircuitBreaker
+from settings import (
+    LLM_BREAKER_MIN_CALLS,
+    LLM_BREAKER_SLOW_TTFT,
+    LLM_HEDGE_MAX_DELAY,
+    LLM_HEDGE_MIN_DELAY,
+)
+
+
+def _tripped() -> CircuitBreaker:
+    breaker = CircuitBreaker("test/model")
+    for _ in range(LLM_BREAKER_MIN_CALLS):
+        breaker.record_result(failed=True)
+    return breaker
+
+
+def _cool_down(breaker: CircuitBreaker):
+    breaker.open_until = time.monotonic() - 1
+
+
+def test_errors_open_the_circuit():
+    breaker = CircuitBreaker("test/model")
+    for _ in range(LLM_BREAKER_MIN_CALLS - 1):
+        breaker.record_result(failed=True)
+    assert breaker.state == "closed"
+    breaker.record_result(failed=True)
+    assert breaker.state == "open"
+    assert not breaker.allow()
+
+
+def test_slow_first_tokens_open_the_circuit():
+    breaker = CircuitBreaker("test/model")
+    for _ in range(LLM_BREAKER_MIN_CALLS):
+        breaker.record_ttft(LLM_BREAKER_SLOW_TTFT + 1)
+    breaker.record_result(failed=False)
+    assert breaker.state == "open"
+
+
+def test_half_open_admits_a_single_probe():
+    breaker = _tripped()
+    _cool_down(breaker)
+    assert breaker.state == "half_open"
+    assert breaker.allow()
+    assert not breaker.allow()
+
+
+def test_successful_probe_closes_and_resets_windows():
+    breaker = _tripped()
+    _cool_down(breaker)
+    breaker.allow()
+    breaker.record_result(failed=False)
+    assert breaker.state == "closed"
+    assert not breaker.failures and not breaker.ttfts
+    assert breaker.allow()
+
+
+def test_failed_probe_opens_again():
+    breaker = _tripped()
+    _cool_down(breaker)
+    breaker.allow()
+    breaker.record_result(failed=True)
+    assert breaker.state == "open"
+    assert not breaker.allow()
+
+
+def test_abandoned_probe_frees_the_probe_slot():
+    breaker = _tripped()
+    _cool_down(breaker)
+    breaker.allow()
+    breaker.abandon()
+    assert breaker.allow()
+
+
+def test_abandoned_hedge_loser_counts_its_wait():
+    breaker = CircuitBreaker("test/model")
+    for _ in range(LLM_BREAKER_MIN_CALLS):
+        breaker.abandon(waited=LLM_BREAKER_SLOW_TTFT)
+    assert breaker.state == "open"
+
+
+def test_hedge_delay_is_clamped():
+    breaker = CircuitBreaker("test/model")
+    assert breaker.hedge_delay() == LLM_HEDGE_MAX_DELAY
+    for _ in range(LLM_BREAKER_MIN_CALLS):
+        breaker.record_ttft(0.0)
+    assert breaker.hedge_delay() == LLM_HEDGE_MIN_DELAY
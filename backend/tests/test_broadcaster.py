@@ -0,0 +1,141 @@
+import asyncio
+from typing import Any
+
+import pytest
+from api.services import Broadcaster
+from api.tier_parser import StreamEvent
+
+
+@pytest.fixture(autouse=True)
+def budget(monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(Broadcaster, "total_bytes", 0)
+    monkeypatch.setattr(Broadcaster, "global_max_bytes", 1000)
+
+
+async def collect(broadcaster: Broadcaster, **kwargs: Any) -> list[Any]:
+    return [chunk async for chunk in broadcaster.subscribe(**kwargs)]
+
+
+def text_events(count: int, size: int = 100) -> list[StreamEvent]:
+    return [StreamEvent("text_delta", str(i % 10) * size) for i in range(count)]
+
+
+def test_replays_from_start_and_follows_live_tail():
+    async def run():
+        broadcaster = Broadcaster()
+        broadcaster.append(b"a")
+        reader = asyncio.create_task(collect(broadcaster))
+        await asyncio.sleep(0)
+        broadcaster.append(b"b")
+        broadcaster.close()
+        return await reader, await collect(broadcaster, offset=1)
+
+    assert asyncio.run(run()) == ([b"a", b"b"], [b"b"])
+
+
+def test_global_pressure_reclaims_idle_durable_broadcaster_first():
+    async def run():
+        old_events = text_events(10)
+        old = Broadcaster()
+        for event in old_events:
+            old.append(event)
+        old.close()
+
+        async def replay() -> list[Any]:
+            return old_events
+
+        old.persisted(replay)
+
+        new = Broadcaster()
+        new.append(StreamEvent("text_delta", "x" * 100))
+        new.close()
+        assert old.nbytes == 0
+        assert new.start_offset == 0
+        # 被回收的串流仍可從持久化來源完整重播
+        return await collect(old), await collect(new)
+
+    replayed, fresh = asyncio.run(run())
+    assert [e.data for e in replayed] == [e.data for e in text_events(10)]
+    assert [e.data for e in fresh] == ["x" * 100]
+
+
+def test_global_pressure_never_evicts_unread_text_of_live_case():
+    async def run():
+        old = Broadcaster()
+        for event in text_events(10):
+            old.append(event)
+        old.close()  # 尚未持久化，不能回收
+
+        new = Broadcaster()
+        sid = new.reserve()  # 例如 TTS 的 block 訂閱者，讀得比畫面快
+        for event in text_events(3):
+            new.append(event)
+        new.close()
+        await collect(new, sid=sid)
+        new._trim()
+        assert new.start_offset == 0
+        return await collect(new)
+
+    assert [e.data for e in asyncio.run(run())] == [e.data for e in text_events(3)]
+
+
+def test_own_budget_drops_lagging_reader_but_keeps_caught_up_one():
+    async def run():
+        broadcaster = Broadcaster(max_bytes=300)
+        Broadcaster.global_max_bytes = 10**9
+        lagging = broadcaster.subscribe(policy="drop")
+        caught_up: list[Any] = []
+
+        async def follow():
+            async for chunk in broadcaster.subscribe(policy="drop"):
+                caught_up.append(chunk)
+
+        follower = asyncio.create_task(follow())
+        await asyncio.sleep(0)
+        for event in text_events(20):
+            broadcaster.append(event)
+            await asyncio.sleep(0)
+        broadcaster.close()
+        await follower
+        return [chunk async for chunk in lagging], caught_up
+
+    lagging, caught_up = asyncio.run(run())
+    assert lagging == []
+    assert len(caught_up) == 20
+
+
+def test_block_subscriber_pauses_producer():
+    async def run():
+        broadcaster = Broadcaster(max_bytes=2)
+        sid = broadcaster.reserve()
+
+        async def produce():
+            for chunk in (b"a", b"b", b"c", b"d"):
+                yield chunk
+
+        producer = asyncio.create_task(broadcaster.publish(produce()))
+        await asyncio.sleep(0.01)
+        assert not producer.done()
+        chunks = await collect(broadcaster, sid=sid)
+        await producer
+        return chunks
+
+    assert asyncio.run(run()) == [b"a", b"b", b"c", b"d"]
+
+
+def test_unsubscribed_reservation_releases_producer():
+    async def run():
+        broadcaster = Broadcaster(max_bytes=1)
+        sid = broadcaster.reserve()
+
+        async def produce():
+            for chunk in (b"a", b"b", b"c"):
+                yield chunk
+
+        producer = asyncio.create_task(broadcaster.publish(produce()))
+        await asyncio.sleep(0.01)
+        broadcaster.unsubscribe(sid)
+        await asyncio.wait_for(producer, 1)
+        return broadcaster.cursors
+
+    assert asyncio.run(run()) == {}
@@ -0,0 +1,88 @@
+import asyncio
+import json
+import socket
+
+import pytest
+from api.registry import RemoteCase, UnixSocketCaseBackend
+from fastapi import HTTPException
+
+
+async def _chunks(*chunks):
+    for chunk in chunks:
+        yield chunk
+
+
+def _owner(directory) -> UnixSocketCaseBackend:
+    streams = {("case", "text"): ["夯", "爆"], ("case", "tts"): [b"\x01", b"\x02"]}
+
+    def get_stream(case_id, stream, offset):
+        chunks = streams.get((case_id, stream))
+        return _chunks(*chunks[offset:]) if chunks else None
+
+    return UnixSocketCaseBackend(
+        str(directory), get_stream, lambda case_id: case_id == "case"
+    )
+
+
+def _reader(directory) -> UnixSocketCaseBackend:
+    # 同一程序內的另一個 worker：沒有註冊過案例，socket_path 與擁有者不同
+    return UnixSocketCaseBackend(str(directory), lambda *_: None, lambda _: False)
+
+
+def test_remote_streams_from_owner(tmp_path):
+    async def run():
+        owner = _owner(tmp_path)
+        await owner.register("case", tts=True)
+        remote = await _reader(tmp_path).lookup("case")
+        text = [chunk async for chunk in remote.llm_gen()]
+        audio = [chunk async for chunk in remote.tts_gen()]
+        await owner.close()
+        return text, audio
+
+    assert asyncio.run(run()) == (["夯", "爆"], [b"\x01", b"\x02"])
+
+
+def test_stale_socket_record_is_removed(tmp_path):
+    # 已結束的 worker 留下的 socket 檔：存在但無人監聽
+    dead = tmp_path / "1.sock"
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.bind(str(dead))
+    sock.close()
+    cases = tmp_path / "cases"
+    cases.mkdir()
+    (cases / "case").write_text(json.dumps({"socket": str(dead), "tts": True}))
+
+    assert asyncio.run(_reader(tmp_path).lookup("case")) is None
+    assert not (cases / "case").exists()
+
+
+def test_case_no_longer_owned_is_not_found(tmp_path):
+    async def run():
+        owner = _owner(tmp_path)
+        await owner.register("case", tts=True)
+        await owner.register("gone", tts=True)
+        missing = await _reader(tmp_path).lookup("gone")
+        remote = RemoteCase("gone", owner.socket_path, tts=True)
+        with pytest.raises(HTTPException) as e:
+            await remote.image_url()
+        await owner.close()
+        return missing, e.value.status_code
+
+    assert asyncio.run(run()) == (None, 404)
+
+
+def test_malformed_request_is_answered_and_server_keeps_serving(tmp_path):
+    async def run():
+        owner = _owner(tmp_path)
+        await owner.register("case", tts=True)
+        reader, writer = await asyncio.open_unix_connection(owner.socket_path)
+        writer.write(b'{"stream": "text"}\n')
+        await writer.drain()
+        closed = await reader.read() == b""
+        writer.close()
+        remote = await _reader(tmp_path).lookup("case")
+        text = [chunk async for chunk in remote.llm_gen()]
+        await owner.close()
+        return closed, text
+
+    assert asyncio.run(run()) == (True, ["夯", "爆"])
@@ -0,0 +1,27 @@
+import pytest
+from main import accepts_gzip
+from starlette.requests import Request
+
+
+def _request(accept_encoding: str) -> Request:
+    headers = [(b"accept-encoding", accept_encoding.encode())]
+    return Request({"type": "http", "headers": headers})
+
+
+@pytest.mark.parametrize(
+    ("header", "expected"),
+    [
+        ("gzip, deflate, br", True),
+        ("br;q=1.0, gzip;q=0.5", True),
+        ("gzip;q=0", False),
+        ("gzip; q=0.0, identity", False),
+        ("*", True),
+        ("*;q=0", False),
+        ("gzip;q=0, *", False),
+        ("br", False),
+        ("", False),
+        ("gzip;q=oops", False),
+    ],
+)
+def test_accepts_gzip(header, expected):
+    assert accepts_gzip(_request(header)) is expected
@@ -0,0 +1,54 @@
+from itertools import combinations
+
+import pytest
+from api.tier_parser import StreamEvent, TierTagParser, clean_text
+
+SAMPLES = [
+    "這個東西必須給到[夯]，沒得說",
+    "夯！真的夯[夯]，[夯]不用再說",
+    "普通[NPC]",
+    "[ S ] tier right away",
+    "數組 a[0] 和 [12345678] 不是標籤",
+    "[[拉完了]]",
+    "沒有結尾的標籤 [人上",
+    "先[A]後[B]",
+    "",
+]
+
+
+def _parse(chunks: list[str]) -> list[StreamEvent]:
+    """逐片段餵入解析器，並把相鄰的 text_delta 合併，只比較語意"""
+    parser = TierTagParser()
+    events = [event for chunk in chunks for event in parser.feed(chunk)]
+    merged: list[StreamEvent] = []
+    for event in events + parser.close():
+        if event.type == "text_delta" and merged and merged[-1].type == "text_delta":
+            merged[-1] = StreamEvent("text_delta", merged[-1].data + event.data)
+        elif event.type != "text_delta" or event.data:
+            merged.append(event)
+    return merged
+
+
+def _splits(text: str, cuts: int):
+    for points in combinations(range(1, len(text)), cuts):
+        bounds = (0, *points, len(text))
+        yield [text[a:b] for a, b in zip(bounds, bounds[1:])]
+
+
+@pytest.mark.parametrize("text", SAMPLES)
+def test_events_do_not_depend_on_chunk_boundaries(text):
+    expected = _parse([text])
+    for cuts in (1, 2):
+        for chunks in _splits(text, cuts):
+            assert _parse(chunks) == expected, chunks
+    assert _parse(list(text)) == expected
+
+
+def test_tier_is_spoken_when_only_in_tag():
+    assert clean_text("這必須給到[夯]") == "這必須給到夯"
+    assert clean_text("夯！[夯]") == "夯！"
+
+
+def test_only_first_tier_is_decided():
+    decisions = [e.data for e in _parse(["先[A]後[B]"]) if e.type == "tier_decision"]
+    assert decisions == ["A"]
@@ -1,54 +1,239 @@
 import asyncio
 import json
+import math
+import os
 import pathlib
+import random
 import shutil
+import time
+from typing import Any, Optional
 
-from api.tts import get_models
+import httpx
+from api.model_index import variants
+from api.tts import fetch_model_page, get_models, s2t, tts_clients
 from utils.log import logger
 
+SNAPSHOT_DIR = pathlib.Path("storage/fish_model")
+SORT_KEYS = ["task_count", "created_at", "score"]
+
+# 精簡目錄只保留伺服器搜尋與前端顯示需要的欄位
+COMPACT_FIELDS = (
+    "_id",
+    "title",
+    "description",
+    "cover_image",
+    "tags",
+    "languages",
+    "task_count",
+    "like_count",
+    "created_at",
+    "updated_at",
+)
+# 每次同步幾乎都會變動的統計欄位，只有它們不同時不算模型有更新
+VOLATILE_FIELDS = ("task_count", "like_count")
+
+RETRIES = 5
+BACKOFF = 1.0  # 第 n 次重試前等待 BACKOFF * 2**n 秒（加上隨機抖動）
+
+
+def lang_suffix(lang: str) -> str:
+    return "_en" if not lang.startswith("zh") else ""
+
+
+def atomic_write(path: pathlib.Path, data: Any) -> bool:
+    """先寫入暫存檔再 rename，內容沒有變化時不寫入；回傳是否寫入"""
+    content = json.dumps(data, ensure_ascii=False).encode("utf-8")
+    if path.exists() and path.read_bytes() == content:
+        return False
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    tmp.write_bytes(content)
+    os.replace(tmp, path)
+    return True
+
+
+async def fetch_page(
+    semaphore: asyncio.Semaphore,
+    sort_by: str,
+    lang: str,
+    page_number: int,
+    page_size: int,
+) -> dict[str, Any]:
+    for attempt in range(RETRIES):
+        try:
+            async with semaphore:
+                return await fetch_model_page(sort_by, lang, page_number, page_size)
+        except (httpx.HTTPError, ValueError) as e:
+            if attempt == RETRIES - 1:
+                raise
+            delay = BACKOFF * 2**attempt * (1 + random.random() / 2)
+            logger.warning(
+                f"Error fetching {sort_by} page {page_number} (lang={lang}): {e!r}, "
+                f"retrying in {delay:.1f}s"
+            )
+            await asyncio.sleep(delay)
+    raise AssertionError("unreachable")
+
+
+async def fetch_catalogue(
+    lang: str, page_size: int, max_models: int, concurrency: int
+) -> list[dict[str, Any]]:
+    """依 task_count 分頁取得整份目錄，第一頁取得 total 後其餘頁面並行取得"""
+    semaphore = asyncio.Semaphore(concurrency)
+    first = await fetch_page(semaphore, "task_count", lang, 1, page_size)
+    total = first.get("total", len(first.get("items", [])))
+    if max_models:
+        total = min(total, max_models)
+    pages = await asyncio.gather(
+        *[
+            fetch_page(semaphore, "task_count", lang, page_number, page_size)
+            for page_number in range(2, math.ceil(total / page_size) + 1)
+        ]
+    )
+
+    # 同步期間排序可能變動，以 _id 去除重複
+    models: dict[str, dict[str, Any]] = {}
+    for page in [first, *pages]:
+        for item in page.get("items", []):
+            models.setdefault(item["_id"], item)
+    return list(models.values())[: max_models or None]
+
+
+def load_catalogue(path: pathlib.Path) -> dict[str, dict[str, Any]]:
+    try:
+        data = json.loads(path.read_text("utf-8"))
+    except (OSError, ValueError):
+        return {}
+    return {model["_id"]: model for model in data.get("models", [])}
+
+
+def content_changed(old: dict[str, Any], new: dict[str, Any]) -> bool:
+    return any(
+        old.get(field) != new.get(field)
+        for field in new.keys() | old.keys()
+        if field not in VOLATILE_FIELDS
+    )
+
+
+def compact(
+    item: dict[str, Any], previous: Optional[dict[str, Any]], lang: str
+) -> dict[str, Any]:
+    model = {field: item.get(field) for field in COMPACT_FIELDS}
+    if (
+        previous is not None
+        and previous.get("updated_at") == model["updated_at"]
+        and previous.get("source_title") == model["title"]
+    ):
+        # 未更新的模型沿用上次轉換好的文字與搜尋用的簡繁形式，不重跑 OpenCC
+        model["title"] = previous["title"]
+        model["description"] = previous["description"]
+        model["variants"] = previous.get("variants")
+    elif lang.startswith("zh"):
+        model["title"] = s2t(model["title"] or "")
+        model["description"] = s2t(model["description"] or "")
+    model["source_title"] = item.get("title")
+    if not model.get("variants"):
+        # ModelIndex 啟動時直接採用，不必再為每個模型做簡繁轉換
+        titles, descriptions = variants(
+            model["title"] or "", model["description"] or ""
+        )
+        model["variants"] = [list(titles), list(descriptions)]
+    return model
+
+
+async def sync_catalogue(
+    lang: str, page_size: int, max_models: int, concurrency: int
+) -> None:
+    """同步整份目錄到 storage/fish_model/catalogue{_en}.json，只轉換新增或更新的模型"""
+    start = time.perf_counter()
+    path = SNAPSHOT_DIR / f"catalogue{lang_suffix(lang)}.json"
+    previous = load_catalogue(path)
+    items = await fetch_catalogue(lang, page_size, max_models, concurrency)
+    fetched = time.perf_counter()
+
+    models, added, changed = [], 0, 0
+    for item in items:
+        old = previous.get(item["_id"])
+        model = compact(item, old, lang)
+        if old is None:
+            added += 1
+        elif content_changed(old, model):
+            changed += 1
+        models.append(model)
+    removed = len(previous.keys() - {m["_id"] for m in models})
+
+    written = atomic_write(path, {"lang": lang, "models": models})
+    logger.info(
+        f"Synced {len(models)} models (lang={lang}): {added} added, {changed} changed, "
+        f"{removed} removed, {len(models) - added - changed} unchanged; "
+        f"fetch {fetched - start:.1f}s, total {time.perf_counter() - start:.1f}s"
+        f"{'' if written else ', file unchanged'}"
+    )
+
 
 async def fetch_one(
     sort_by: str = "score", auto_copy: bool = True, lang: str = "zh-TW"
 ) -> None:
-    """從 Fish API 根據指定的排序方式獲取模型列表並保存到本地 JSON 文件"""
-    lang_suffix = "_en" if not lang.startswith("zh") else ""
+    """從 Fish API 根據指定的排序方式獲取第一頁模型列表，作為 /models 與前端預載的快照"""
     logger.info(f"Fetching models sorted by {sort_by} (lang={lang})...")
 
-    output_path = f"storage/fish_model/{sort_by}{lang_suffix}.json"
-
-    with open(output_path, "w", encoding="utf-8") as f:
-        for attempt in range(5):
-            try:
-                models = await get_models(sort_by=sort_by, lang=lang)
-                break
-            except Exception as e:
-                logger.error(f"Error fetching models sorted by {sort_by}: {e}")
-                if attempt == 2:
-                    logger.error(
-                        f"Failed to fetch models sorted by {sort_by} after 3 attempts."
-                    )
-                    return
-                continue
-        json.dump(models, f, ensure_ascii=False)
+    output_path = SNAPSHOT_DIR / f"{sort_by}{lang_suffix(lang)}.json"
+
+    for attempt in range(RETRIES):
+        try:
+            models = await get_models(sort_by=sort_by, lang=lang)
+            break
+        except Exception as e:
+            if attempt == RETRIES - 1:
+                logger.error(
+                    f"Failed to fetch models sorted by {sort_by} after {RETRIES} attempts: {e}"
+                )
+                return
+            delay = BACKOFF * 2**attempt * (1 + random.random() / 2)
+            logger.error(
+                f"Error fetching models sorted by {sort_by}: {e}, retrying in {delay:.1f}s"
+            )
+            await asyncio.sleep(delay)
+
+    if not atomic_write(output_path, models):
+        logger.info(f"{output_path} is unchanged.")
+        return
 
     if auto_copy:
-        frontend_json = f"../frontend/assets/fish_model/{sort_by}{lang_suffix}.json"
+        frontend_json = f"../frontend/assets/fish_model/{output_path.name}"
         path2 = pathlib.Path(__file__).parent.parent / frontend_json
 
         if path2.parent.exists():
-            shutil.copyfile(pathlib.Path(output_path), path2)
+            shutil.copyfile(output_path, path2)
             logger.info(
                 f"model JSON file has been copied to {frontend_json} successfully."
             )
 
 
-async def main(auto_copy: bool = True, lang: str = "zh-TW"):
-    await asyncio.gather(
-        *[
-            fetch_one(sort_by=sort_by, auto_copy=auto_copy, lang=lang)
-            for sort_by in ["task_count", "created_at", "score"]
-        ]
-    )
+async def main(
+    auto_copy: bool = True,
+    lang: str = "all",
+    full: bool = True,
+    page_size: int = 100,
+    max_models: int = 10000,
+    concurrency: int = 4,
+):
+    langs = ["zh-TW", "en"] if lang == "all" else [lang]
+    start = time.perf_counter()
+    try:
+        await asyncio.gather(
+            *[
+                fetch_one(sort_by=sort_by, auto_copy=auto_copy, lang=language)
+                for language in langs
+                for sort_by in SORT_KEYS
+            ]
+        )
+        if full:
+            for language in langs:
+                await sync_catalogue(language, page_size, max_models, concurrency)
+    finally:
+        await tts_clients.close()
+    logger.info(f"Model sync finished in {time.perf_counter() - start:.1f}s")
 
 
 if __name__ == "__main__":
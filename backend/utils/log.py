@@ -1,42 +1,246 @@
+import atexit
 import datetime
+import json
 import logging
 import os
+import queue
+from logging.handlers import (
+    QueueHandler,
+    QueueListener,
+    TimedRotatingFileHandler,
+    WatchedFileHandler,
+)
+from typing import Optional
 
+from api import metrics
 from rich.console import Console
 from rich.logging import RichHandler
 from rich.theme import Theme
+from settings import (
+    LOG_BACKUP_DAYS,
+    LOG_CONSOLE,
+    LOG_DIR,
+    LOG_FORMAT,
+    LOG_QUEUE_SIZE,
+    LOG_ROTATE,
+    LOG_SAMPLE,
+    WORKERS,
+)
 
 # 設定Rich主題
 custom_theme = Theme({"info": "cyan", "warning": "yellow", "error": "bold red"})
 console = Console(theme=custom_theme)
 
-# 設定日誌系統
-log_dir = "logs"
-if not os.path.exists(log_dir):
-    os.makedirs(log_dir)
+TEXT_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
 
-current_time = datetime.datetime.now().strftime("%Y-%m-%d")
-log_file = f"{log_dir}/{current_time}.log"
 
-# 設定logger
-logger = logging.getLogger()
-logger.setLevel(logging.INFO)
+class LazyQueueHandler(QueueHandler):
+    """
+    只把 LogRecord 放進佇列，訊息格式化（含 %r 參數的 __repr__）與寫入都在背景執行緒進行
+    標準的 QueueHandler.prepare 會在呼叫端先格式化，是為了跨程序 pickle；
+    同一程序內的佇列不需要，因此 args 必須是之後不會再被修改的物件
+    """
 
-# 設定Rich handler (控制台輸出)
-rich_handler = RichHandler(
-    console=console, rich_tracebacks=True, tracebacks_show_locals=False
-)
-rich_handler.setLevel(logging.INFO)
+    def __init__(self, log_queue: "queue.Queue[logging.LogRecord]"):
+        super().__init__(log_queue)
+        self.dropped = 0
+        self.reported = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        """佇列已滿時丟棄紀錄並計數，不阻塞呼叫端；之後第一筆放得進去的紀錄前補上一筆警告"""
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+            metrics.log_dropped.inc()
+            return
+        if self.dropped != self.reported:
+            count, self.reported = self.dropped - self.reported, self.dropped
+            warning = logging.makeLogRecord(
+                {
+                    "name": __name__,
+                    "levelno": logging.WARNING,
+                    "levelname": "WARNING",
+                    "msg": "Dropped %d log records because the log queue was full",
+                    "args": (count,),
+                }
+            )
+            try:
+                self.queue.put_nowait(warning)
+            except queue.Full:
+                self.reported -= count
+
+
+class DrainingQueueListener(QueueListener):
+    """佇列有上限時 put_nowait 可能因已滿而放不進結束標記，改為等待背景執行緒騰出空間"""
+
+    def enqueue_sentinel(self):
+        self.queue.put(self._sentinel)
+
+
+class SamplingFilter(logging.Filter):
+    """
+    依 logger 名稱抽樣熱路徑的 INFO 以下紀錄，WARNING 以上一律保留
+    rates 為 {logger 名稱: 保留比例}，子 logger 沿用最接近的上層設定；
+    以計數器每 1/rate 筆保留一筆，結果固定且不需要亂數
+    """
+
+    def __init__(self, rates: dict[str, float]):
+        super().__init__()
+        self.rates = rates
+        self.counters: dict[str, int] = {}
+
+    def _rate(self, name: str) -> float:
+        while name:
+            if name in self.rates:
+                return self.rates[name]
+            name = name.rpartition(".")[0]
+        return 1.0
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING or not self.rates:
+            return True
+        rate = self._rate(record.name)
+        if rate >= 1:
+            return True
+        if rate <= 0:
+            return False
+        count = self.counters.get(record.name, 0)
+        self.counters[record.name] = count + 1
+        return count % round(1 / rate) == 0
+
+
+class JsonFormatter(logging.Formatter):
+    """每筆紀錄一行 JSON，附上 extra 傳入的欄位（例如 case_id）"""
 
-# 設定File handler (檔案輸出)
-file_handler = logging.FileHandler(filename=log_file, encoding="utf-8", mode="a")
-file_handler.setLevel(logging.DEBUG)
-file_format = logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
-file_handler.setFormatter(file_format)
+    RESERVED = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
 
-# 添加handlers
-logger.addHandler(rich_handler)
-logger.addHandler(file_handler)
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.datetime.fromtimestamp(record.created).isoformat(
+                timespec="milliseconds"
+            ),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+            "module": record.module,
+            "line": record.lineno,
+        }
+        for key, value in vars(record).items():
+            if key not in self.RESERVED:
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+def parse_sample(spec: str) -> dict[str, float]:
+    """解析 "httpx=0.1,aitier.request=0.5" 形式的抽樣設定"""
+    rates = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        name, _, rate = item.partition("=")
+        rates[name.strip()] = float(rate)
+    return rates
+
+
+def create_handlers(
+    log_dir: str,
+    fmt: str,
+    console_output: bool,
+    backup_days: int,
+    rotate: str = "time",
+    workers: int = 1,
+) -> list[logging.Handler]:
+    handlers: list[logging.Handler] = []
+    if console_output:
+        # 設定Rich handler (控制台輸出)
+        rich_handler = RichHandler(
+            console=console, rich_tracebacks=True, tracebacks_show_locals=False
+        )
+        rich_handler.setLevel(logging.INFO)
+        handlers.append(rich_handler)
+
+    # 設定File handler (檔案輸出)
+    os.makedirs(log_dir, exist_ok=True)
+    suffix = "jsonl" if fmt == "json" else "log"
+    file_handler: logging.FileHandler
+    if rotate == "external":
+        # 多個程序附加寫入同一個檔案，輪替後（檔案被移走）自動重新開啟
+        file_handler = WatchedFileHandler(f"{log_dir}/app.{suffix}", encoding="utf-8")
+    else:
+        # 每天午夜輪替，保留 backup_days 天；多個程序輪替同一個檔案會互相覆蓋，
+        # 因此多 worker 時每個程序各寫一個檔案
+        name = f"app.{os.getpid()}" if workers > 1 else "app"
+        file_handler = TimedRotatingFileHandler(
+            filename=f"{log_dir}/{name}.{suffix}",
+            when="midnight",
+            backupCount=backup_days,
+            encoding="utf-8",
+        )
+    file_handler.setLevel(logging.DEBUG)
+    if fmt == "json":
+        file_handler.setFormatter(JsonFormatter())
+    else:
+        file_handler.setFormatter(logging.Formatter(TEXT_FORMAT))
+    handlers.append(file_handler)
+    return handlers
+
+
+_listener: Optional[QueueListener] = None
+
+
+def configure(
+    log_dir: str = LOG_DIR,
+    fmt: str = LOG_FORMAT,
+    console_output: bool = LOG_CONSOLE,
+    sample: str = LOG_SAMPLE,
+    backup_days: int = LOG_BACKUP_DAYS,
+    queue_size: int = LOG_QUEUE_SIZE,
+    rotate: str = LOG_ROTATE,
+    workers: int = WORKERS,
+) -> logging.Logger:
+    """
+    設定 root logger：呼叫端只把紀錄放進有上限的佇列，背景執行緒的 QueueListener
+    負責格式化、輸出到 Rich 控制台與記錄檔；重複呼叫時先停止舊的 listener
+    """
+    global _listener
+    shutdown()
+    root = logging.getLogger()
+    root.setLevel(logging.INFO)
+    log_queue: queue.Queue[logging.LogRecord] = queue.Queue(maxsize=queue_size)
+    queue_handler = LazyQueueHandler(log_queue)
+    queue_handler.addFilter(SamplingFilter(parse_sample(sample)))
+    root.handlers = [queue_handler]
+    _listener = DrainingQueueListener(
+        log_queue,
+        *create_handlers(log_dir, fmt, console_output, backup_days, rotate, workers),
+        respect_handler_level=True,
+    )
+    _listener.start()
+    return root
+
+
+def shutdown():
+    """停止背景執行緒並寫出佇列中剩餘的紀錄"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
+
+
+def get_logger(name: str) -> logging.Logger:
+    """熱路徑使用具名 logger，才能以 LOG_SAMPLE 個別抽樣"""
+    return logging.getLogger(name)
+
+
+# 設定logger
+logger = configure()
+atexit.register(shutdown)
 
 for _, old_logger in logging.root.manager.loggerDict.items():
     old_logger.handlers = []  # type: ignore
@@ -198,7 +198,10 @@ export const TierInputGroup = ({
         setTimeout(() => {
             setIsTimeToMove(true);
         }, 5000);
-        playAudio(case_id);
+        // The server may drop TTS under load; it reports the mode it used
+        if (response.data.tts !== false) {
+            playAudio(case_id);
+        }
         streamText(case_id, img_url);
         return img_url;
     };